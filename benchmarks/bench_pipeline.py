@@ -0,0 +1,368 @@
+"""
+Stage-level pipeline benchmark on deterministic synthetic clips, with a regression gate.
+
+    python benchmarks/bench_pipeline.py                       # all clips, compare to baseline.json
+    python benchmarks/bench_pipeline.py --clips small --repeat 1
+    python benchmarks/bench_pipeline.py --update-baseline     # record this machine's numbers
+
+Clips are generated with ffmpeg lavfi (testsrc2, plus a drawn face that Haar detects moving over
+it for the *_faces clips). Every stage of `/analyze` is timed separately, then the endpoint
+end to end through TestClient. For each stage the median wall time, the CPU time of this
+process plus the PRNU pool workers, and the peak RSS of both are reported.
+
+A stage regresses when its wall time exceeds the baseline by more than --tolerance (relative)
+plus --slack seconds, or its peak RSS exceeds the baseline by more than --tolerance.
+Shared machines change speed over time, so a fixed calibration kernel (residual extraction and
+face detection on a constant frame) is timed with every run and stored with the baseline;
+baseline times are scaled by the ratio before comparing. Baselines are still per machine:
+record one with --update-baseline. The exit status is 1 on any regression.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from deepforensics.app import config, ingest, media, metadata, ml, prnu, reports, utils  # noqa: E402
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+# name -> (width, height, fps, seconds, faces)
+CLIPS: Dict[str, Tuple[int, int, int, int, bool]] = {
+    "small": (320, 240, 10, 2, False),
+    "480p_faces": (854, 480, 25, 4, True),
+    "720p_faces": (1280, 720, 30, 8, True),
+}
+
+STAGES = ("sample_frames", "decode_frames", "process_frames_for_prnu", "region_scores_and_heatmaps",
+          "temporal_consistency", "metadata.analyze", "ml.predict", "analyze_endpoint")
+
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_TICK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+@dataclass
+class StageResult:
+    wall_s: float
+    cpu_s: float
+    peak_rss_mb: float
+
+
+def _face_image(size: int) -> np.ndarray:
+    """A schematic frontal face (head, brows, eyes, nose, mouth) that the Haar cascade detects."""
+    img = np.full((size, size, 3), 60, np.uint8)
+    c = size // 2
+    cv2.ellipse(img, (c, c), (int(size * 0.32), int(size * 0.42)), 0, 0, 360, (150, 170, 200), -1)
+    for dx in (-1, 1):
+        cv2.ellipse(img, (c + dx * int(size * 0.13), int(c - size * 0.08)), (int(size * 0.07), int(size * 0.035)),
+                    0, 0, 360, (40, 40, 40), -1)
+        cv2.line(img, (c + dx * int(size * 0.06), int(c - size * 0.17)), (c + dx * int(size * 0.22), int(c - size * 0.17)),
+                 (50, 50, 60), 4)
+    cv2.ellipse(img, (c, int(c + size * 0.2)), (int(size * 0.12), int(size * 0.04)), 0, 0, 360, (60, 60, 120), -1)
+    cv2.line(img, (c, int(c - size * 0.02)), (c, int(c + size * 0.1)), (110, 120, 150), 3)
+    return img
+
+
+def make_clip(name: str, out_dir: Path) -> Path:
+    """Encode clip `name` from CLIPS into out_dir (reused if already there)."""
+    w, h, fps, seconds, faces = CLIPS[name]
+    path = out_dir / f"{name}.mp4"
+    if path.exists():
+        return path
+    cmd = ["ffmpeg", "-y", "-f", "lavfi", "-i", f"testsrc2=size={w}x{h}:rate={fps}:duration={seconds}"]
+    if faces:
+        size = h // 3
+        face = out_dir / f"face_{size}.png"
+        cv2.imwrite(str(face), _face_image(size))
+        cmd += ["-loop", "1", "-i", str(face), "-filter_complex",
+                f"[0:v][1:v]overlay=x='(W-w)/2+(W-w)/4*sin(t)':y='(H-h)/3':shortest=1"]
+    cmd += ["-pix_fmt", "yuv420p", "-c:v", "libx264", "-preset", "veryfast", "-g", str(fps), str(path)]
+    code, _, err = utils.run_cmd(cmd)
+    if code != 0:
+        raise RuntimeError(f"ffmpeg failed for {name}: {err}")
+    return path
+
+
+def _proc_rss(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[1]) * _PAGE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _proc_cpu(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / _TICK
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+class _Meter:
+    """Wall time, CPU time and peak RSS of this process plus its multiprocessing children."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _pids(self) -> List[int]:
+        return [os.getpid()] + [p.pid for p in multiprocessing.active_children()]
+
+    def _rss(self) -> int:
+        if not os.path.exists("/proc/self/statm"):
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return sum(_proc_rss(pid) for pid in self._pids())
+
+    def _children_cpu(self) -> float:
+        return sum(_proc_cpu(p.pid) for p in multiprocessing.active_children())
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._rss())
+
+    def measure(self, fn: Callable[[], object]) -> Tuple[object, StageResult]:
+        self.peak = self._rss()
+        self._stop.clear()
+        sampler = threading.Thread(target=self._sample, daemon=True)
+        sampler.start()
+        cpu0, child0, wall0 = time.process_time(), self._children_cpu(), time.perf_counter()
+        try:
+            out = fn()
+        finally:
+            wall = time.perf_counter() - wall0
+            cpu = time.process_time() - cpu0 + self._children_cpu() - child0
+            self._stop.set()
+            sampler.join()
+        self.peak = max(self.peak, self._rss())
+        return out, StageResult(wall_s=wall, cpu_s=cpu, peak_rss_mb=self.peak / float(1 << 20))
+
+
+def calibrate(repeat: int = 7) -> float:
+    """Median CPU seconds of a fixed workload shaped like the pipeline's hot stages."""
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (360, 640, 3), dtype=np.uint8)
+    frame[60:300, 200:440] = cv2.resize(_face_image(120), (240, 240))
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    times = []
+    for _ in range(repeat):
+        t0 = time.process_time()
+        prnu.extract_residuals_batch(frame[None].repeat(4, axis=0))
+        prnu._detect_faces(gray)
+        times.append(time.process_time() - t0)
+    return statistics.median(times)
+
+
+def _isolate(workdir: Path) -> None:
+    """Point every cache and store at workdir so runs neither reuse nor pollute real state."""
+    config.CACHE_DIR = workdir / "cache"
+    config.EVIDENCE_DIR = workdir / "evidence"
+    config.REPORTS_DIR = workdir / "reports"
+    config.REPORTS_DB = workdir / "reports.sqlite3"
+    config.BLOB_DIR = workdir / "blobs"
+    config.RESULT_CACHE_ENABLED = False
+    config.ML_PROVIDER = "stub"
+
+
+def run_clip(path: Path, workdir: Path, repeat: int, meter: _Meter, client) -> Dict[str, StageResult]:
+    """Every stage of the pipeline on one clip, `repeat` times; median wall/CPU, max peak RSS."""
+    runs: Dict[str, List[StageResult]] = {s: [] for s in STAGES}
+    sha = utils.sha256_file(path)
+    for i in range(repeat):
+        tmp = utils.safe_mkdir(workdir / f"run_{path.stem}_{i}")
+        info = media.probe_media(path, use_cache=False)
+
+        def stage(name: str, fn: Callable[[], object]):
+            out, res = meter.measure(fn)
+            runs[name].append(res)
+            return out
+
+        stage("sample_frames", lambda: ingest.sample_frames(path, tmp / "png", media=info))
+        frames, _ = stage("decode_frames", lambda: ingest.extract_frames(path, tmp / "frames", media=info))
+        clip_prnu, residuals = stage("process_frames_for_prnu", lambda: prnu.process_frames_for_prnu(frames, keep_residuals=True))
+        # Same call as /analyze: face scores, dense windows and the top-k heatmaps
+        faces, _, _ = stage("region_scores_and_heatmaps",
+                            lambda: prnu.region_scores_and_heatmaps(frames, residuals, utils.safe_mkdir(tmp / "evidence")))
+        stage("temporal_consistency", lambda: prnu.temporal_consistency(residuals))
+        _, flags, _ = stage("metadata.analyze", lambda: metadata.analyze(path, info))
+        faces_json = [{"frame_index": s.frame_index, "bbox": list(s.bbox), "score": s.score} for s in faces]
+        stage("ml.predict", lambda: ml.predict(path, flags, faces_json, sha256=sha))
+
+        config.CACHE_DIR = tmp / "cache"  # no media-probe cache hit from an earlier repeat
+
+        def analyze():
+            with open(path, "rb") as fh:
+                r = client.post("/analyze", files={"file": (path.name, fh, "video/mp4")}, data={"privacy_mode": "true"})
+            if r.status_code != 200:
+                raise RuntimeError(f"/analyze failed: {r.status_code} {r.text[:200]}")
+            return r
+
+        stage("analyze_endpoint", analyze)
+        del frames, residuals, clip_prnu
+        utils.cleanup_path(tmp)
+
+    return {
+        name: StageResult(
+            wall_s=statistics.median(r.wall_s for r in res),
+            cpu_s=statistics.median(r.cpu_s for r in res),
+            peak_rss_mb=max(r.peak_rss_mb for r in res),
+        )
+        for name, res in runs.items()
+    }
+
+
+def run(clips: List[str], repeat: int = 3, clip_dir: Optional[Path] = None) -> Dict[str, Dict[str, StageResult]]:
+    """Benchmark `clips`; the process-wide config is isolated to a temporary directory meanwhile."""
+    from fastapi.testclient import TestClient
+    from deepforensics.app.api import app
+
+    utils.require_binaries(["ffmpeg", "ffprobe"])
+    saved = {k: getattr(config, k) for k in ("CACHE_DIR", "EVIDENCE_DIR", "REPORTS_DIR", "REPORTS_DB", "BLOB_DIR",
+                                             "RESULT_CACHE_ENABLED", "ML_PROVIDER")}
+    results: Dict[str, Dict[str, StageResult]] = {}
+    with tempfile.TemporaryDirectory(prefix="df_bench_") as td:
+        workdir = Path(td)
+        clip_dir = utils.safe_mkdir(clip_dir or workdir / "clips")
+        _isolate(workdir)
+        meter = _Meter()
+        try:
+            with TestClient(app) as client:  # runs startup: PRNU pool and exiftool workers are warm
+                for name in clips:
+                    results[name] = run_clip(make_clip(name, clip_dir), workdir, repeat, meter, client)
+        finally:
+            reports.shutdown_store()
+            for k, v in saved.items():
+                setattr(config, k, v)
+    return results
+
+
+def to_json(results: Dict[str, Dict[str, StageResult]], calibration_s: float) -> Dict:
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "calibration_s": round(calibration_s, 5),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "prnu_workers": config.MAX_WORKERS,
+        },
+        "clips": {clip: {stage: {k: round(v, 4) for k, v in asdict(r).items()} for stage, r in stages.items()}
+                  for clip, stages in results.items()},
+    }
+
+
+def speed_factor(baseline: Dict, calibration_s: Optional[float]) -> float:
+    """How much slower this machine runs now than when the baseline was recorded (1.0 if unknown)."""
+    base = (baseline.get("meta") or {}).get("calibration_s")
+    if not base or not calibration_s:
+        return 1.0
+    return calibration_s / base
+
+
+def compare(results: Dict[str, Dict[str, StageResult]], baseline: Dict, tolerance: float,
+            slack_s: float, calibration_s: Optional[float] = None) -> List[str]:
+    """
+    Regressions of `results` against a baseline written by `to_json` (stages missing there are
+    skipped). Baseline wall times are scaled by `speed_factor` when `calibration_s` is given.
+    """
+    factor = speed_factor(baseline, calibration_s)
+    regressions: List[str] = []
+    for clip, stages in results.items():
+        for stage, r in stages.items():
+            base = (baseline.get("clips", {}).get(clip) or {}).get(stage)
+            if not base:
+                continue
+            expected = base["wall_s"] * factor
+            limit = expected * (1.0 + tolerance) + slack_s
+            if r.wall_s > limit:
+                regressions.append(f"{clip}/{stage}: wall {r.wall_s:.3f}s > {limit:.3f}s (baseline {expected:.3f}s)")
+            rss_limit = base["peak_rss_mb"] * (1.0 + tolerance)
+            if r.peak_rss_mb > rss_limit:
+                regressions.append(f"{clip}/{stage}: peak RSS {r.peak_rss_mb:.0f}MB > {rss_limit:.0f}MB"
+                                   f" (baseline {base['peak_rss_mb']:.0f}MB)")
+    return regressions
+
+
+def format_table(results: Dict[str, Dict[str, StageResult]], baseline: Optional[Dict] = None,
+                 calibration_s: Optional[float] = None) -> str:
+    factor = speed_factor(baseline, calibration_s) if baseline else 1.0
+    lines = []
+    if calibration_s:
+        lines.append(f"calibration {calibration_s * 1000:.1f} ms" + (f" (machine speed factor {factor:.2f})" if baseline else ""))
+    for clip, stages in results.items():
+        w, h, fps, seconds, faces = CLIPS[clip]
+        lines.append(f"{clip}: {w}x{h} {fps}fps {seconds}s{' faces' if faces else ''}")
+        lines.append(f"  {'stage':<33} {'wall ms':>9} {'cpu ms':>9} {'peak MB':>8} {'vs base':>8}")
+        for stage, r in stages.items():
+            base = ((baseline or {}).get("clips", {}).get(clip) or {}).get(stage)
+            delta = f"{(r.wall_s / (base['wall_s'] * factor) - 1.0):+8.0%}" if base and base["wall_s"] > 0 else f"{'-':>8}"
+            lines.append(f"  {stage:<33} {r.wall_s * 1000:>9.1f} {r.cpu_s * 1000:>9.1f} {r.peak_rss_mb:>8.0f} {delta}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--clips", default=",".join(CLIPS), help="comma-separated subset of: " + ", ".join(CLIPS))
+    ap.add_argument("--repeat", type=int, default=3, help="runs per clip; the median is reported")
+    ap.add_argument("--baseline", default=str(BASELINE_PATH))
+    ap.add_argument("--tolerance", type=float, default=0.3, help="allowed relative slowdown / RSS growth")
+    ap.add_argument("--slack", type=float, default=0.05, help="allowed absolute slowdown per stage (s)")
+    ap.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    ap.add_argument("--json", default=None, help="also write the results to this file")
+    args = ap.parse_args(argv)
+
+    clips = [c.strip() for c in args.clips.split(",") if c.strip()]
+    unknown = [c for c in clips if c not in CLIPS]
+    if unknown:
+        ap.error(f"unknown clips: {', '.join(unknown)}")
+    calibration_s = calibrate()
+    results = run(clips, max(1, args.repeat))
+    calibration_s = (calibration_s + calibrate()) / 2.0  # before and after the run
+    data = to_json(results, calibration_s)
+    if args.json:
+        Path(args.json).write_text(json.dumps(data, indent=2))
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        old = json.loads(baseline_path.read_text()) if baseline_path.exists() else {"clips": {}}
+        old["meta"] = data["meta"]
+        old["clips"].update(data["clips"])
+        baseline_path.write_text(json.dumps(old, indent=2) + "\n")
+        print(format_table(results, calibration_s=calibration_s))
+        print(f"baseline written to {baseline_path}")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else None
+    print(format_table(results, baseline, calibration_s))
+    if baseline is None:
+        print(f"no baseline at {baseline_path}; run with --update-baseline to record one")
+        return 0
+    regressions = compare(results, baseline, args.tolerance, args.slack, calibration_s)
+    for r in regressions:
+        print("REGRESSION " + r)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
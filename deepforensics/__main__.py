@@ -0,0 +1,183 @@
+"""
+Command-line entry point.
+
+    python -m deepforensics batch <dir> [--out results.jsonl] [--workers N]
+    python -m deepforensics import-reports [--dir examples/reports]
+
+`batch` runs the same pipeline as `POST /analyze` over every video under <dir>, several videos at
+a time, appending one JSON line per video to --out. Re-running with the same --out skips content
+(by sha256) that already has a successful line, so an interrupted sweep resumes where it stopped.
+
+`import-reports` adds report JSON files written before the report store existed to the store,
+so they show up in `GET /reports`. Reports already in the store are left alone.
+"""
+from __future__ import annotations
+
+import argparse
+import concurrent.futures as futures
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from .app import config, exiftool, pipeline, prnu, reports, utils
+
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".m4v", ".mkv", ".avi", ".webm", ".mpg", ".mpeg", ".3gp")
+
+
+def find_videos(root: Path, extensions: Iterable[str] = VIDEO_EXTENSIONS) -> List[Path]:
+    exts = {e.lower() for e in extensions}
+    return sorted(p for p in root.rglob("*") if p.is_file() and p.suffix.lower() in exts)
+
+
+def completed_hashes(out_path: Path) -> Set[str]:
+    """sha256 of every video with a successful result line in an existing output file."""
+    done: Set[str] = set()
+    if not out_path.exists():
+        return done
+    with open(out_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interrupted run
+            if rec.get("status") == "ok" and rec.get("sha256"):
+                done.add(rec["sha256"])
+    return done
+
+
+class BatchRunner:
+    def __init__(self, out_path: Path, workers: int, privacy_mode: bool = True, device_id: Optional[str] = None,
+                 identify: bool = False, log=sys.stderr):
+        self.out_path = out_path
+        self.workers = max(1, workers)
+        self.privacy_mode = privacy_mode
+        self.device_id = device_id
+        self.identify = identify
+        self.log = log
+        self._lock = threading.Lock()
+        self._claimed: Set[str] = set()
+        self.stats: Dict[str, int] = {"ok": 0, "failed": 0, "skipped": 0}
+        self.stage_totals: Dict[str, float] = {}
+
+    def _write(self, rec: Dict) -> None:
+        line = json.dumps(rec, separators=(",", ":"))
+        with self._lock:
+            with open(self.out_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _analyze(self, path: Path) -> str:
+        sha = utils.sha256_file(path)
+        with self._lock:
+            if sha in self._claimed:
+                self.stats["skipped"] += 1
+                return "skipped"
+            self._claimed.add(sha)
+
+        tmpdir = utils.create_temp_dir("batch")
+        started = time.perf_counter()
+        try:
+            report = pipeline.run_analysis(
+                path, path.name, path.stat().st_size, sha, self.privacy_mode, self.device_id, tmpdir,
+                identify=self.identify,
+            )
+        except Exception as e:
+            detail = getattr(e, "detail", str(e))
+            self._write({"path": str(path), "sha256": sha, "status": "failed", "error": detail})
+            with self._lock:
+                self.stats["failed"] += 1
+            return f"failed: {detail}"
+        finally:
+            utils.cleanup_path(tmpdir)
+
+        self._write({"path": str(path), "sha256": sha, "status": "ok", "seconds": round(time.perf_counter() - started, 3),
+                     "report": report})
+        with self._lock:
+            self.stats["ok"] += 1
+            for stage, secs in (report.get("timings") or {}).items():
+                self.stage_totals[stage] = self.stage_totals.get(stage, 0.0) + secs
+        return report.get("ensemble", {}).get("decision", "ok")
+
+    def run(self, videos: List[Path]) -> Dict:
+        self._claimed = completed_hashes(self.out_path)
+        utils.safe_mkdir(self.out_path.parent)
+        started = time.perf_counter()
+        total = len(videos)
+        with futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="df-batch") as ex:
+            pending = {ex.submit(self._analyze, p): p for p in videos}
+            for i, fut in enumerate(futures.as_completed(pending), 1):
+                print(f"[{i}/{total}] {pending[fut].name}: {fut.result()}", file=self.log, flush=True)
+        elapsed = time.perf_counter() - started
+        return {"elapsed_sec": elapsed, **self.stats}
+
+    def summary(self, result: Dict) -> str:
+        elapsed = result["elapsed_sec"]
+        rate = result["ok"] / (elapsed / 60.0) if elapsed > 0 else 0.0
+        lines = [
+            f"{result['ok']} analysed, {result['skipped']} skipped, {result['failed']} failed in {elapsed:.1f}s"
+            f" ({rate:.1f} videos/min, {self.workers} workers)",
+        ]
+        if self.stage_totals and result["ok"]:
+            total = sum(self.stage_totals.values()) or 1.0
+            lines.append(f"{'stage':<10} {'total s':>9} {'mean s':>8} {'share':>6}")
+            for stage, secs in sorted(self.stage_totals.items(), key=lambda kv: kv[1], reverse=True):
+                lines.append(f"{stage:<10} {secs:>9.2f} {secs / result['ok']:>8.3f} {secs / total:>6.1%}")
+        return "\n".join(lines)
+
+
+def _batch(args: argparse.Namespace) -> int:
+    root = Path(args.dir)
+    if not root.is_dir():
+        print(f"Not a directory: {root}", file=sys.stderr)
+        return 2
+    utils.require_binaries(["ffmpeg", "ffprobe"])
+    videos = find_videos(root)
+    runner = BatchRunner(Path(args.out), args.workers, privacy_mode=not args.keep_evidence,
+                         device_id=args.device_id, identify=args.identify)
+    prnu.start_pool()
+    try:
+        result = runner.run(videos)
+    finally:
+        prnu.shutdown_pool()
+        exiftool.shutdown_pool()
+    print(runner.summary(result))
+    return 1 if result["failed"] else 0
+
+
+def _import_reports(args: argparse.Namespace) -> int:
+    root = Path(args.dir)
+    if not root.is_dir():
+        print(f"Not a directory: {root}", file=sys.stderr)
+        return 2
+    store = reports.get_store()
+    counts = store.import_dir(root)
+    print(f"{counts['imported']} imported, {counts['skipped']} already stored, {counts['failed']} unreadable"
+          f" ({len(store)} reports in {store.path})")
+    return 1 if counts["failed"] else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m deepforensics", description="DeepForensics command line")
+    sub = parser.add_subparsers(dest="command", required=True)
+    batch = sub.add_parser("batch", help="Analyse every video under a directory into a JSONL file")
+    batch.add_argument("dir", help="Directory searched recursively for videos")
+    batch.add_argument("--out", default="batch_results.jsonl", help="JSONL output; existing results are resumed (default: %(default)s)")
+    batch.add_argument("--workers", type=int, default=config.JOB_WORKERS, help="Videos analysed concurrently (default: %(default)s)")
+    batch.add_argument("--device-id", default=None, help="Compare every clip to this enrolled device")
+    batch.add_argument("--identify", action="store_true", help="Rank every clip against all enrolled devices")
+    batch.add_argument("--keep-evidence", action="store_true", help="Keep heatmaps and frames (privacy mode off)")
+    imp = sub.add_parser("import-reports", help="Add existing report JSON files to the report store")
+    imp.add_argument("--dir", default=str(config.REPORTS_DIR), help="Directory of <task_id>.json reports (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.command == "batch":
+        return _batch(args)
+    if args.command == "import-reports":
+        return _import_reports(args)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,22 @@
 __all__ = [
     "ingest",
+    "media",
     "metadata",
     "prnu",
     "ml",
+    "rules",
+    "ollama",
     "ensemble",
     "api",
+    "pipeline",
+    "jobs",
     "utils",
+    "exiftool",
+    "cache",
+    "blobs",
+    "reports",
+    "thumbnails",
+    "devices",
     "config",
 ]
 
@@ -1,16 +1,20 @@
 from __future__ import annotations
 
+import functools
+import hashlib
 import json
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import List, Optional
 
 import numpy as np
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile
-from fastapi.responses import JSONResponse, FileResponse, RedirectResponse
+from fastapi import FastAPI, File, Form, HTTPException, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, FileResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.middleware.gzip import GZipMiddleware
 
-from . import config, ingest, metadata as metadata_mod, ml as ml_mod, prnu as prnu_mod, ensemble as ensemble_mod, utils
+from . import blobs as blobs_mod, config, devices as devices_mod, exiftool as exiftool_mod, ingest, jobs as jobs_mod, media as media_mod, ollama as ollama_mod, pipeline, prnu as prnu_mod, reports as reports_mod, utils
 
 
 config.ensure_dirs()
@@ -22,6 +26,110 @@ if ui_dir.exists():
     app.mount("/ui", StaticFiles(directory=str(ui_dir), html=True), name="static")
 
 
+class UploadLimitMiddleware:
+    """
+    Reject oversize upload requests before the body is received: by the declared
+    Content-Length when present, otherwise as soon as the streamed body passes the limit.
+    """
+
+    class _TooLarge(Exception):
+        pass
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") != "POST":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        try:
+            declared = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            declared = 0
+        if declared > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                raise self._TooLarge()
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise self._TooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal started
+            if exceeded:
+                # Whatever the app made of the aborted body (form parsing turns it into a 400)
+                # is replaced by the 413 below
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not started:
+            await self._reject(send)
+
+    @staticmethod
+    async def _reject(send):
+        body = json.dumps({"detail": "Request body too large"}).encode()
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+
+class JSONGZipMiddleware(GZipMiddleware):
+    """Gzip, except event streams (buffering would hold events back) and already compressed images."""
+
+    SKIP = ("/events", "/heatmap/", "/blobs/")
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "") if scope["type"] == "http" else ""
+        if any(s in path for s in self.SKIP):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+app.add_middleware(UploadLimitMiddleware, max_bytes=config.MAX_REQUEST_BYTES)
+app.add_middleware(JSONGZipMiddleware, minimum_size=config.GZIP_MIN_SIZE, compresslevel=config.GZIP_LEVEL)
+
+
+@app.on_event("startup")
+def _startup():
+    # Start worker pools up front so the first request does not pay for process/Perl startup
+    prnu_mod.start_pool()
+    exiftool_mod.get_pool()
+    if config.ML_PROVIDER == "ollama":
+        # Loads the model in the background; the first analysis no longer waits for a cold load
+        ollama_mod.get_client().preload_async()
+
+
+@app.on_event("shutdown")
+def _shutdown():
+    jobs_mod.shutdown_manager()
+    prnu_mod.shutdown_pool()
+    exiftool_mod.shutdown_pool()
+    ollama_mod.shutdown_client()
+    reports_mod.shutdown_store()
+
+
 @app.get("/")
 def root_redirect():
     if ui_dir.exists():
@@ -40,193 +148,251 @@ def health():
     return {"status": "ok", "version": config.VERSION}
 
 
+def _enroll_video(in_path, digest: str, tmpdir) -> Path:
+    """Accumulate one video's residuals and spill the sums to disk; returns the state file."""
+    media = media_mod.probe_media(in_path, sha256=digest)
+    frames, _ = ingest.extract_frames(in_path, tmpdir / "frames", media=media)
+    acc, _ = prnu_mod.accumulate_prnu(frames)
+    state_path = tmpdir / f"state_{digest}.npz"
+    np.savez(state_path, **acc.state())
+    return state_path
+
+
 @app.post("/enroll")
 async def enroll(device_id: str = Form(...), files: List[UploadFile] | None = None):
     _refuse_external_calls_guard()
     if not files:
         raise HTTPException(400, "No files provided")
-
+    if not devices_mod.valid_device_id(device_id):
+        raise HTTPException(400, "Invalid device_id")
+
+    store = devices_mod.get_store()
+    if store.is_legacy(device_id):
+        # Refuse before decoding anything; store.add re-checks under the device lock
+        raise HTTPException(409, str(devices_mod.LegacyFingerprint.for_device(device_id, store.root)))
+    known = store.sources(device_id)
     tmpdir = utils.create_temp_dir("enroll")
     try:
-        all_residuals: List[np.ndarray] = []
+        # Only footage not enrolled yet is decoded; the stored sums cover the rest
+        pending = []
+        skipped: List[str] = []
         for f in files:
-            in_path = tmpdir / f.filename
-            with open(in_path, "wb") as out:
-                out.write(await f.read())
-            frames, _ = ingest.sample_frames(in_path, tmpdir / "frames")
-            _, residuals = prnu_mod.process_frames_for_prnu(frames)
-            all_residuals.extend(residuals)
-        fingerprint = prnu_mod.aggregate_residuals(all_residuals)
-        fp_dir = config.WORK_DIR / "device_fingerprints"
-        utils.safe_mkdir(fp_dir)
-        np.save(fp_dir / f"device_{device_id}.npy", fingerprint)
-        return {"device_id": device_id, "status": "enrolled"}
+            filename = utils.safe_filename(f.filename)
+            in_path = tmpdir / filename
+            try:
+                _, digest = await utils.save_upload(f, in_path, max_bytes=config.MAX_UPLOAD_BYTES)
+            except utils.UploadTooLarge as ue:
+                raise HTTPException(413, str(ue))
+            if digest in known or any(digest == p[0] for p in pending):
+                skipped.append(filename)
+            else:
+                state_path = await run_in_threadpool(_enroll_video, in_path, digest, tmpdir)
+                pending.append((digest, filename, state_path))
+            utils.cleanup_path(in_path)
+            utils.cleanup_path(tmpdir / "frames")
+        try:
+            meta, added = await run_in_threadpool(store.add, device_id, pending)
+        except devices_mod.LegacyFingerprint as le:
+            raise HTTPException(409, str(le))
+        skipped += [name for sha, name, _ in pending if sha not in added]
+        return {
+            "device_id": device_id,
+            "status": "enrolled" if added else "unchanged",
+            "added": [name for sha, name, _ in pending if sha in added],
+            "skipped": skipped,
+            "frames": meta.get("frames", 0),
+            "sources": len(meta.get("sources", {})),
+        }
+    finally:
+        utils.cleanup_path(tmpdir)
+
+
+@app.post("/identify")
+async def identify(file: UploadFile = File(...), top_k: int = Form(default=config.IDENTIFY_TOP_K)):
+    """Rank every enrolled device by PRNU correlation with the uploaded clip."""
+    _refuse_external_calls_guard()
+    tmpdir, in_path, _, upload_sha256 = await _receive_upload(file)
+    try:
+        return await run_in_threadpool(pipeline.run_identify, in_path, upload_sha256, tmpdir, max(1, top_k))
+    except pipeline.AnalysisError as ae:
+        raise HTTPException(ae.status_code, ae.detail)
     finally:
         utils.cleanup_path(tmpdir)
 
 
 @app.post("/analyze")
-async def analyze(file: UploadFile = File(...), privacy_mode: bool = Form(default=config.PRIVACY_MODE_DEFAULT), device_id: str | None = Form(default=None)):
+async def analyze(file: UploadFile = File(...), privacy_mode: bool = Form(default=config.PRIVACY_MODE_DEFAULT), device_id: str | None = Form(default=None),
+                  identify: bool = Form(default=False)):
+    _refuse_external_calls_guard()
+    tmpdir, in_path, upload_size, upload_sha256 = await _receive_upload(file)
+    try:
+        # The pipeline is blocking (ffmpeg, process pool, HTTP to Ollama); keep it off the event loop
+        report = await run_in_threadpool(
+            pipeline.run_analysis, in_path, utils.safe_filename(file.filename), upload_size, upload_sha256,
+            privacy_mode, device_id, tmpdir, identify=identify,
+        )
+    except pipeline.AnalysisError as ae:
+        raise HTTPException(ae.status_code, ae.detail)
+    return JSONResponse(report)
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...), privacy_mode: bool = Form(default=config.PRIVACY_MODE_DEFAULT), device_id: str | None = Form(default=None),
+                     identify: bool = Form(default=False)):
+    """Queue an analysis and return its task_id immediately; poll /jobs/{id} or stream /jobs/{id}/events."""
     _refuse_external_calls_guard()
-    started_at = datetime.utcnow().isoformat() + "Z"
+    tmpdir, in_path, upload_size, upload_sha256 = await _receive_upload(file)
     task_id = utils.make_task_id()
+    try:
+        job = jobs_mod.get_manager().submit(
+            task_id, functools.partial(pipeline.run_analysis, identify=identify), in_path, utils.safe_filename(file.filename), upload_size, upload_sha256,
+            privacy_mode, device_id, tmpdir, task_id,
+            on_reject=lambda: utils.cleanup_path(tmpdir),
+        )
+    except jobs_mod.JobQueueFull as qe:
+        raise HTTPException(503, str(qe))
+    return {"task_id": job.task_id, "status": job.status, "status_url": f"/jobs/{task_id}", "events_url": f"/jobs/{task_id}/events"}
+
+
+def _get_job(task_id: str) -> jobs_mod.Job:
+    job = jobs_mod.get_manager().get(task_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return job
+
+
+@app.get("/jobs/{task_id}")
+def job_status(task_id: str):
+    return _get_job(task_id).snapshot()
+
+
+@app.get("/jobs/{task_id}/events")
+async def job_events(task_id: str):
+    """Server-Sent Events stream of per-stage progress, ending with a `done` or `failed` event."""
+    job = _get_job(task_id)
+
+    async def stream():
+        sent = 0
+        while True:
+            events = await job.next_events(sent, 15.0)
+            if not events:
+                yield ": keep-alive\n\n"
+                continue
+            for ev in events:
+                yield f"event: {ev['event']}\ndata: {json.dumps({'task_id': task_id, **ev})}\n\n"
+            sent += len(events)
+            if events[-1]["event"] in ("done", "failed"):
+                return
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def _receive_upload(file: UploadFile):
     tmpdir = utils.create_temp_dir("analyze")
-    evidence_dir = utils.safe_mkdir(config.EVIDENCE_DIR / task_id)
+    in_path = tmpdir / utils.safe_filename(file.filename)
     try:
-        in_path = tmpdir / file.filename
-        with open(in_path, "wb") as out:
-            out.write(await file.read())
+        upload_size, upload_sha256 = await utils.save_upload(file, in_path, max_bytes=config.MAX_UPLOAD_BYTES)
+    except utils.UploadTooLarge as ue:
+        utils.cleanup_path(tmpdir)
+        raise HTTPException(413, str(ue))
+    except Exception:
+        utils.cleanup_path(tmpdir)
+        raise
+    return tmpdir, in_path, upload_size, upload_sha256
 
-        # Ingest frames
-        frames_dir = tmpdir / "frames"
-        try:
-            frames, ingest_info = ingest.sample_frames(in_path, frames_dir)
-        except Exception as ie:
-            raise HTTPException(400, f"Frame sampling failed: {ie}")
 
-        # PRNU
-        try:
-            clip_prnu, residuals = prnu_mod.process_frames_for_prnu(frames)
-        except Exception as pe:
-            raise HTTPException(500, f"PRNU processing failed: {pe}")
-        face_scores, heatmaps = prnu_mod.face_region_scores_and_heatmaps(frames, residuals, evidence_dir)
+def _load_report_raw(task_id: str) -> bytes:
+    raw = reports_mod.get_store().get_raw(task_id)
+    if raw is not None:
+        return raw.encode("utf-8")
+    # Report files written before the store existed (until imported with `import-reports`)
+    path = config.REPORTS_DIR / f"{task_id}.json"
+    if not path.exists():
+        raise HTTPException(404, "Report not found")
+    return path.read_bytes()
 
-        # Metadata
-        try:
-            meta_details, meta_flags, meta_score = metadata_mod.analyze(in_path)
-        except Exception as me:
-            raise HTTPException(500, f"Metadata analysis failed: {me}")
-
-        # ML provider (stub by default, optional Ollama if enabled)
-        face_scores_json = [
-            {"frame_index": s.frame_index, "bbox": list(s.bbox), "score": s.score} for s in face_scores
-        ]
-        frame_b64 = None
-        if config.ML_PROVIDER == "ollama" and config.OLLAMA_ENABLE_VISION:
-            # Prepare a few frame thumbnails as base64
-            frame_b64 = []
-            import base64
-            for p in frames[:3]:
-                try:
-                    with open(p, "rb") as fh:
-                        frame_b64.append(base64.b64encode(fh.read()).decode())
-                except Exception:
-                    pass
-        ml_out = ml_mod.predict(in_path, meta_flags, face_scores_json, frame_b64)
-
-        # PRNU similarity: if device enrolled, compare to fingerprint; else use proxy from faces
-        prnu_similarity = 0.0
-        prnu_reference_used = False
-        if device_id:
-            fp_path = config.WORK_DIR / "device_fingerprints" / f"device_{device_id}.npy"
-            if fp_path.exists():
-                try:
-                    ref = np.load(fp_path)
-                    prnu_similarity = float(prnu_mod.correlation_similarity(clip_prnu, ref))
-                    # map from [-1,1] to [0,1]
-                    prnu_similarity = (prnu_similarity + 1.0) / 2.0
-                    prnu_reference_used = True
-                except Exception:
-                    prnu_reference_used = False
-        if not prnu_reference_used:
-            if face_scores:
-                prnu_similarity = 1.0 - max(s.score for s in face_scores)
-                prnu_similarity = float(np.clip(prnu_similarity, 0.0, 1.0))
-
-        ens = ensemble_mod.score_and_decide(ml_out["score"], prnu_similarity, meta_score)
-
-        # Serialize outputs
-        # Save a representative residual image
-        residual_paths: List[str] = []
-        if residuals:
-            import cv2
-            rep = (residuals[0] - residuals[0].min())
-            if rep.max() > 0:
-                rep = rep / rep.max()
-            rep_img = (rep * 255).astype("uint8")
-            rep_path = evidence_dir / "residual_sample.png"
-            cv2.imwrite(str(rep_path), rep_img)
-            residual_paths.append(str(rep_path))
-
-        # Include up to 3 heatmaps; base64 when privacy_mode, else paths
-        heatmap_repr = None
-        heatmap_list: List[str] | None = None
-        if heatmaps:
-            heatmap_list = []
-            for hp in heatmaps[:3]:
-                if privacy_mode:
-                    heatmap_list.append("data:image/png;base64," + utils.b64_of_file(hp))
-                else:
-                    heatmap_list.append(hp.as_posix())
-            heatmap_repr = heatmap_list[0]
-
-        report: Dict = {
-            "task_id": task_id,
-            "source": {
-                "filename": Path(file.filename).name,
-                "filesize": Path(in_path).stat().st_size,
-                "duration_sec": ingest_info.get("duration_sec", 0.0),
-            },
-            "ml": ml_out,
-            "metadata": {"flags": meta_flags, "details": meta_details},
-            "prnu": {
-                "clip_score": float(np.mean(np.abs(clip_prnu))),
-                "similarity": prnu_similarity,
-                "reference_used": prnu_reference_used,
-                "face_region_scores": face_scores_json,
-                "heatmap_image": heatmap_repr,
-                "heatmap_images": heatmap_list,
-                "residual_images": residual_paths,
-            },
-            "ensemble": {
-                **ens,
-                "explanation": "local_stub+PRNU proxy+metadata rules",
-            },
-            "evidence": {
-                "frames": [p.as_posix() for p in frames[:3]],
-                "residuals": residual_paths,
-            },
-            "timestamps": {"started_at": started_at, "finished_at": datetime.utcnow().isoformat() + "Z"},
-        }
 
-        # Save report
-        utils.safe_mkdir(config.REPORTS_DIR)
-        report_path = config.REPORTS_DIR / f"{task_id}.json"
-        with open(report_path, "w", encoding="utf-8") as f:
-            json.dump(report, f, indent=2)
+def _load_report(task_id: str) -> dict:
+    return json.loads(_load_report_raw(task_id))
 
-        # Privacy cleanup
-        if privacy_mode:
-            utils.cleanup_path(evidence_dir)
-            utils.cleanup_path(tmpdir)
 
-        return JSONResponse(report)
-    except HTTPException:
-        # cleanup then re-raise
-        try:
-            if privacy_mode:
-                utils.cleanup_path(evidence_dir)
-                utils.cleanup_path(tmpdir)
-        finally:
-            pass
-        raise
-    except Exception as e:
-        # Ensure cleanup if privacy
-        try:
-            if privacy_mode:
-                utils.cleanup_path(evidence_dir)
-                utils.cleanup_path(tmpdir)
-        finally:
-            pass
-        raise HTTPException(500, f"Analysis failed: {e}")
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def _cached(request: Request, etag: str, cache_control: str, respond) -> Response:
+    """304 if the client already has `etag`, else `respond()` with validator headers."""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    response = respond()
+    response.headers.update(headers)
+    return response
+
+
+def _epoch(dt: Optional[datetime]) -> Optional[float]:
+    if dt is None:
+        return None
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+
+@app.get("/reports")
+def list_reports(decision: Optional[List[str]] = Query(default=None), since: Optional[datetime] = None,
+                 until: Optional[datetime] = None, ml_provider: Optional[str] = None, sha256: Optional[str] = None,
+                 min_score: Optional[float] = None, max_score: Optional[float] = None, limit: int = 50,
+                 cursor: Optional[str] = None, include_report: bool = False):
+    """
+    Stored reports matching all given filters, newest first. `decision` may repeat; `since`
+    (inclusive) and `until` (exclusive) are ISO timestamps, UTC unless they carry an offset.
+    Pass the returned `next_cursor` as `cursor` to fetch the next page.
+    """
+    try:
+        items, next_cursor = reports_mod.get_store().query(
+            decision=decision, since=_epoch(since), until=_epoch(until), ml_provider=ml_provider, sha256=sha256,
+            min_score=min_score, max_score=max_score, limit=max(1, min(limit, config.REPORTS_PAGE_MAX)),
+            cursor=cursor, include_report=include_report,
+        )
+    except reports_mod.InvalidCursor as ce:
+        raise HTTPException(400, str(ce))
+    return {"items": items, "next_cursor": next_cursor}
 
 
 @app.get("/report/{task_id}")
-def get_report(task_id: str):
-    path = config.REPORTS_DIR / f"{task_id}.json"
-    if not path.exists():
-        raise HTTPException(404, "Report not found")
-    with open(path, "r", encoding="utf-8") as f:
-        return JSONResponse(json.load(f))
+def get_report(task_id: str, request: Request):
+    # Sent as stored (no decode/encode round trip); clients revalidate with If-None-Match
+    body = _load_report_raw(task_id)
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    return _cached(request, etag, "no-cache", lambda: Response(body, media_type="application/json"))
+
+
+@app.get("/blobs/{name}")
+def get_blob(name: str, request: Request):
+    """Content-addressed artifact referenced by a report; immutable, so cacheable forever."""
+    store = blobs_mod.get_store()
+    if not store.exists(name):
+        raise HTTPException(404, "Blob not found")
+    media_type = blobs_mod.MEDIA_TYPES.get(Path(name).suffix, "application/octet-stream")
+    return _cached(request, f'"{name}"', "public, max-age=31536000, immutable",
+                   lambda: FileResponse(store.path(name), media_type=media_type))
+
+
+@app.get("/report/{task_id}/heatmap/{frame}")
+def get_heatmap(task_id: str, frame: int, request: Request):
+    frames = (_load_report(task_id).get("prnu") or {}).get("heatmap_frames") or []
+    entry = next((h for h in frames if h.get("frame_index") == frame), None)
+    if entry is None or not entry.get("data"):
+        raise HTTPException(404, "No heatmap for this frame")
+    data = Path(entry["data"])
+    if not data.exists():
+        raise HTTPException(410, "Heatmap evidence is no longer available")
+    png = prnu_mod.render_heatmap_png(data)
+    st = png.stat()
+    etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+    return _cached(request, etag, "no-cache", lambda: FileResponse(png, media_type="image/png"))
 
 
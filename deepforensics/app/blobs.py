@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from . import config, utils
+
+
+_NAME = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]{1,8})?$")
+
+MEDIA_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".npz": "application/octet-stream"}
+
+
+def blob_url(name: str) -> str:
+    return f"/blobs/{name}"
+
+
+def valid_name(name: str) -> bool:
+    return bool(_NAME.match(name or ""))
+
+
+class BlobStore:
+    """
+    Content-addressed artifacts (rendered heatmaps, ...) under `BLOB_DIR`, named
+    `<sha256><ext>` and sharded by the first two hex digits. Identical content is stored once,
+    and a name never changes meaning, so clients may cache blobs indefinitely.
+    """
+
+    def __init__(self, root: Optional[Path] = None):
+        self._root = root
+
+    @property
+    def root(self) -> Path:
+        return self._root or config.BLOB_DIR
+
+    def path(self, name: str) -> Path:
+        if not valid_name(name):
+            raise ValueError(f"Invalid blob name: {name!r}")
+        return self.root / name[:2] / name
+
+    def put(self, data: bytes, ext: str = "") -> str:
+        """Store `data` (no-op if already present) and return its name."""
+        name = hashlib.sha256(data).hexdigest() + ext
+        path = self.path(name)
+        if path.exists():
+            return name
+        utils.safe_mkdir(path.parent)
+        tmp = path.with_name(f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        finally:
+            utils.cleanup_path(tmp)
+        return name
+
+    def exists(self, name: str) -> bool:
+        return valid_name(name) and self.path(name).exists()
+
+
+_DATA_URI = re.compile(r"^data:image/(png|jpeg);base64,")
+
+
+def externalize_images(report: Dict, store: Optional[BlobStore] = None) -> Dict:
+    """Move inline base64 heatmaps (reports written before the blob store) into blobs, in place."""
+    prnu = report.get("prnu") or {}
+    store = store or get_store()
+    urls: Dict[str, str] = {}
+
+    def move(value):
+        m = _DATA_URI.match(value) if isinstance(value, str) else None
+        if m is None:
+            return value
+        if value not in urls:
+            ext = ".png" if m.group(1) == "png" else ".jpg"
+            urls[value] = blob_url(store.put(base64.b64decode(value[m.end():]), ext))
+        return urls[value]
+
+    for h in prnu.get("heatmap_frames") or []:
+        if "image" in h:
+            h["image"] = move(h["image"])
+            if h["image"].startswith("/blobs/"):
+                h["blob"] = h["image"][len("/blobs/"):]
+    if prnu.get("heatmap_images"):
+        prnu["heatmap_images"] = [move(v) for v in prnu["heatmap_images"]]
+    if prnu.get("heatmap_image"):
+        prnu["heatmap_image"] = move(prnu["heatmap_image"])
+    return report
+
+
+_store: Optional[BlobStore] = None
+
+
+def get_store() -> BlobStore:
+    global _store
+    if _store is None:
+        _store = BlobStore()
+    return _store
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from . import config, devices as devices_mod, rules as rules_mod, utils
+
+
+# Report fields that are specific to one request and rebuilt on every cache hit
+_PER_TASK_KEYS = ("task_id", "timestamps", "timings", "cache")
+
+
+def _fingerprint_stamp(device_id: Optional[str]) -> Optional[str]:
+    if not device_id:
+        return None
+    fp = devices_mod.fingerprint_path(device_id)
+    try:
+        st = fp.stat()
+        return f"{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        return "missing"
+
+
+def make_key(content_sha256: str, device_id: Optional[str], privacy_mode: bool, identify: bool = False) -> str:
+    """Cache key over the content hash and every setting that changes the analysis result."""
+    parts = {
+        "version": config.VERSION,
+        "sha256": content_sha256,
+        "frame_count": config.FRAME_COUNT,
+        "resize_width": config.RESIZE_WIDTH,
+        "decode_mode": config.FRAME_DECODE_MODE,
+        "sampling": config.FRAME_SAMPLING,
+        "face_detect": [config.FACE_DETECT_EVERY, config.FACE_DETECT_WIDTH],
+        "dense_windows": list(config.PRNU_DENSE_WINDOWS),
+        "prnu_aggregate": config.PRNU_AGGREGATE,
+        "match_method": config.PRNU_MATCH_METHOD,
+        "pce": [list(config.PRNU_PCE_SCALES), config.PRNU_PCE_THRESHOLD, config.PRNU_PCE_EXCLUDE],
+        "weights": [config.W_ML, config.W_PRNU, config.W_META, config.W_TEMPORAL],
+        "temporal": [config.TEMPORAL_BREAK_Z, config.TEMPORAL_MIN_FRAMES],
+        "ml_provider": config.ML_PROVIDER,
+        "ml_model": config.OLLAMA_MODEL if config.ML_PROVIDER == "ollama" else None,
+        # Which frames the vision model sees, and at what size, changes its answer
+        "vision": [
+            config.OLLAMA_ENABLE_VISION, config.THUMBNAIL_COUNT, config.THUMBNAIL_MAX_PIXELS,
+            config.THUMBNAIL_MAX_BYTES, config.THUMBNAIL_MIN_HASH_DISTANCE,
+        ] if config.ML_PROVIDER == "ollama" else None,
+        # Editing the stub rules changes stub scores (also the fallback when Ollama fails)
+        "stub_rules": rules_mod.get_rules().signature,
+        "device_id": device_id,
+        # Re-enrolling the device must invalidate earlier similarity results
+        "fingerprint": _fingerprint_stamp(device_id),
+        "privacy_mode": bool(privacy_mode),
+        # Identification ranks against every enrolled device, so any enrollment invalidates it
+        "identify": [
+            devices_mod.get_index().signature(), config.IDENTIFY_SKETCH_DIM, config.IDENTIFY_SEED,
+            config.IDENTIFY_CANDIDATES, config.IDENTIFY_PCE_TOP, config.IDENTIFY_TOP_K,
+        ] if identify else None,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def strip_artifacts(report: Dict) -> Dict:
+    """Drop heatmaps, residual images and evidence paths, keeping only the scores and flags."""
+    out = json.loads(json.dumps(report))
+    prnu = out.get("prnu") or {}
+    for k in ("heatmap_image", "heatmap_images", "residual_images"):
+        if k in prnu:
+            prnu[k] = None
+    for h in prnu.get("heatmap_frames") or []:
+        h.pop("image", None)
+        h.pop("data", None)
+    out.pop("evidence", None)
+    return out
+
+
+def _referenced_paths(report: Dict):
+    prnu = report.get("prnu") or {}
+    for p in prnu.get("residual_images") or []:
+        if isinstance(p, str) and not p.startswith("data:"):
+            yield Path(p)
+    for h in prnu.get("heatmap_frames") or []:
+        if h.get("data"):
+            yield Path(h["data"])
+    for p in (report.get("evidence") or {}).get("frames") or []:
+        yield Path(p)
+
+
+class ResultCache:
+    """
+    Size-bounded, LRU-evicted store of finished analyses under `CACHE_DIR/results`.
+    In privacy mode only scores and flags are kept; artifacts are stripped before writing.
+    """
+
+    def __init__(self, root: Optional[Path] = None, max_entries: int = config.RESULT_CACHE_MAX_ENTRIES,
+                 max_bytes: int = config.RESULT_CACHE_MAX_BYTES):
+        self._root = root
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @property
+    def root(self) -> Path:
+        return self._root or config.CACHE_DIR / "results"
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Evidence of a non-private run may have been deleted since; treat as a miss
+        if any(not p.exists() for p in _referenced_paths(report)):
+            self.invalidate(key)
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return report
+
+    def put(self, key: str, report: Dict, privacy_mode: bool) -> None:
+        if not config.RESULT_CACHE_ENABLED:
+            return
+        entry = strip_artifacts(report) if privacy_mode else json.loads(json.dumps(report))
+        for k in _PER_TASK_KEYS:
+            entry.pop(k, None)
+        utils.safe_mkdir(self.root)
+        path = self._path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp, path)
+        except OSError:
+            utils.cleanup_path(tmp)
+            return
+        self._evict()
+
+    def invalidate(self, key: str) -> None:
+        utils.cleanup_path(self._path(key))
+
+    def clear(self) -> None:
+        utils.cleanup_path(self.root)
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = []
+            for p in self.root.glob("*.json"):
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+            entries.sort(key=lambda e: e[0], reverse=True)
+            total = 0
+            for i, (_, size, p) in enumerate(entries):
+                total += size
+                if i >= self.max_entries or total > self.max_bytes:
+                    utils.cleanup_path(p)
+
+
+_cache: Optional[ResultCache] = None
+
+
+def get_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        _cache = ResultCache()
+    return _cache
@@ -17,22 +17,95 @@ BASE_DIR = Path(__file__).resolve().parent.parent.parent
 WORK_DIR = BASE_DIR / "work"
 CACHE_DIR = WORK_DIR / "cache"
 EVIDENCE_DIR = WORK_DIR / "evidence"
+FINGERPRINT_DIR = WORK_DIR / "device_fingerprints"
+BLOB_DIR = WORK_DIR / "blobs"  # content-addressed report artifacts (rendered heatmaps)
 REPORTS_DIR = BASE_DIR / "examples" / "reports"
 STUB_RULES_PATH = BASE_DIR / "examples" / "stub_rules.json"
 
+# Uploads: streamed to disk in chunks; per-file and per-request size limits. The request cap
+# defaults to one file plus room for multipart headers and form fields, so an oversize file is
+# cut off while it streams rather than after it has been spooled in full.
+UPLOAD_CHUNK_SIZE = 1 << 20
+MAX_UPLOAD_BYTES = int(os.environ.get("DF_MAX_UPLOAD_BYTES", str(4 << 30)))
+MAX_REQUEST_BYTES = int(os.environ.get("DF_MAX_REQUEST_BYTES", str(MAX_UPLOAD_BYTES + (1 << 20))))
+
+# Media probe cache (ffprobe/exiftool results keyed by content hash)
+MEDIA_CACHE_ENABLED = True
+
+# exiftool: long-lived -stay_open workers shared across requests
+EXIFTOOL_POOL_SIZE = 2
+EXIFTOOL_TIMEOUT = 10
+
+# Result cache: finished reports keyed by content hash + analysis settings
+RESULT_CACHE_ENABLED = os.environ.get("DF_RESULT_CACHE", "1") != "0"
+RESULT_CACHE_MAX_ENTRIES = 5000
+RESULT_CACHE_MAX_BYTES = 256 << 20
+
+# Report store: every report indexed in SQLite for listing and filtering
+REPORTS_DB = Path(os.environ.get("DF_REPORTS_DB", str(WORK_DIR / "reports.sqlite3")))
+REPORT_FILES = os.environ.get("DF_REPORT_FILES", "1") != "0"  # also write REPORTS_DIR/<task_id>.json
+REPORTS_PAGE_MAX = 500
+
+# HTTP: JSON responses above GZIP_MIN_SIZE bytes are gzipped for clients that accept it
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 5
+
+# Background analysis jobs (/jobs)
+JOB_WORKERS = int(os.environ.get("DF_JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.environ.get("DF_JOB_MAX_PENDING", "16"))
+
 # Ingest
 FRAME_COUNT = 30
 RESIZE_WIDTH = 640
 MAX_WORKERS = max(1, min(4, os.cpu_count() or 2))
+# Frames one request may have queued in the shared PRNU pool at a time
+PRNU_INFLIGHT_PER_REQUEST = MAX_WORKERS
+# Frames handled per worker task (denoised together as one batch)
+PRNU_BATCH_SIZE = 4
+# "pipe" decodes raw BGR frames from ffmpeg's stdout into memory; "png" writes frame files to disk
+FRAME_DECODE_MODE = os.environ.get("DF_FRAME_DECODE_MODE", "pipe")
+# In-memory sampling: "stride", "seek", "keyframe" or "auto" (seek once a clip is long enough)
+FRAME_SAMPLING = os.environ.get("DF_FRAME_SAMPLING", "auto")
+SEEK_MIN_DURATION_SEC = 60.0
+
+# Face detection: Haar runs on every k-th frame (boxes tracked in between), optionally downscaled
+FACE_DETECT_EVERY = int(os.environ.get("DF_FACE_DETECT_EVERY", "1"))
+FACE_DETECT_WIDTH = int(os.environ.get("DF_FACE_DETECT_WIDTH", "0"))  # 0 = detect at frame size
 
 # PRNU
+# Fingerprint estimator: "mle" (streaming, sum(W*I)/sum(I^2)) or "median" (stacks all residuals)
+PRNU_AGGREGATE = os.environ.get("DF_PRNU_AGGREGATE", "mle")
+# Device matching: "pce" (FFT cross-correlation over shifts and scales) or "corr" (plain Pearson)
+PRNU_MATCH_METHOD = os.environ.get("DF_PRNU_MATCH_METHOD", "pce")
+PRNU_PCE_THRESHOLD = 60.0  # PCE at which similarity is 0.5
+PRNU_PCE_SCALES = (1.0, 0.9, 0.8, 0.75, 0.67, 0.5)
+PRNU_PCE_EXCLUDE = 11  # side of the peak neighbourhood left out of the energy estimate
+PRNU_SPECTRUM_CACHE = 32  # reference spectra kept in memory
+# 1:N identification: count-sketch pruning, exact correlation on the best candidates, PCE re-rank
+IDENTIFY_SKETCH_DIM = 8192
+IDENTIFY_CANDIDATES = 16
+IDENTIFY_PCE_TOP = 8  # candidates (best by single-scale PCE) that get the multi-scale PCE
+IDENTIFY_TOP_K = 5
+IDENTIFY_SEED = 0
 PRNU_FACE_CORR_SUSPICIOUS = 0.45
 PRNU_FACE_CORR_LIKELY = 0.30
+# Square window sizes (px) for the dense residual-consistency map; empty disables it
+PRNU_DENSE_WINDOWS = tuple(int(w) for w in os.environ.get("DF_PRNU_DENSE_WINDOWS", "64,128").split(",") if w.strip())
+PRNU_DENSE_TOP_K = 5
+# Frames (ranked by their worst face score) that keep heatmap data for on-demand rendering
+HEATMAP_TOP_K = 3
+
+# Temporal residual consistency: splice points where adjacent-frame correlation drops
+TEMPORAL_BREAK_Z = 3.5  # robust z-score below which an adjacent pair is a break
+TEMPORAL_MIN_FRAMES = 6
 
 # Ensemble weights
 W_ML = 0.6
 W_PRNU = 0.3
 W_META = 0.1
+# Temporal signal; when present, W_TEMPORAL * score is added on top of the other three terms
+# (which are not rescaled) and the total is capped at 1. 0 disables it
+W_TEMPORAL = float(os.environ.get("DF_W_TEMPORAL", "0.1"))
 
 # ML provider
 # "stub" or "ollama" (local-only)
@@ -41,6 +114,14 @@ OLLAMA_HOST = os.environ.get("DF_OLLAMA_HOST", "http://127.0.0.1:11434")
 OLLAMA_MODEL = os.environ.get("DF_OLLAMA_MODEL", "llava:7b")
 OLLAMA_TIMEOUT = int(os.environ.get("DF_OLLAMA_TIMEOUT", "20"))
 OLLAMA_ENABLE_VISION = True  # send a few frame thumbnails as base64 when available
+OLLAMA_MAX_INFLIGHT = int(os.environ.get("DF_OLLAMA_MAX_INFLIGHT", "1"))  # concurrent generations
+OLLAMA_KEEP_ALIVE = os.environ.get("DF_OLLAMA_KEEP_ALIVE", "30m")  # how long the model stays loaded
+OLLAMA_CACHE_ENABLED = os.environ.get("DF_OLLAMA_CACHE", "1") != "0"
+# Vision thumbnails sent to the model: most suspicious faces / most distinct frames, JPEG within budget
+THUMBNAIL_COUNT = int(os.environ.get("DF_THUMBNAIL_COUNT", "3"))
+THUMBNAIL_MAX_PIXELS = int(os.environ.get("DF_THUMBNAIL_MAX_PIXELS", str(336 * 336)))
+THUMBNAIL_MAX_BYTES = int(os.environ.get("DF_THUMBNAIL_MAX_BYTES", str(48 << 10)))
+THUMBNAIL_MIN_HASH_DISTANCE = 6  # dHash bits; closer frames count as duplicates
 
 
 def ensure_dirs() -> None:
@@ -0,0 +1,370 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from . import config, prnu, utils
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process locking only
+    fcntl = None
+
+
+_DEVICE_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,127}$")
+
+
+def valid_device_id(device_id: str) -> bool:
+    return bool(_DEVICE_ID.match(device_id or ""))
+
+
+def fingerprint_path(device_id: str, root: Optional[Path] = None) -> Path:
+    """The finalized fingerprint read by /analyze (same location as before incremental enrollment)."""
+    return (root or config.FINGERPRINT_DIR) / f"device_{device_id}.npy"
+
+
+class LegacyFingerprint(RuntimeError):
+    """The device has a fingerprint from before enrollment state was kept; it cannot be extended."""
+
+    @classmethod
+    def for_device(cls, device_id: str, root: Optional[Path] = None) -> "LegacyFingerprint":
+        return cls(
+            f"Device {device_id!r} was enrolled before incremental enrollment and its fingerprint cannot be "
+            f"extended; remove {fingerprint_path(device_id, root).name} and enroll all of its footage again, "
+            "or enroll under a new device_id"
+        )
+
+
+def _atomic_write(path: Path, write) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    finally:
+        utils.cleanup_path(tmp)
+
+
+class DeviceStore:
+    """
+    Per-device enrollment state under `FINGERPRINT_DIR`:
+
+    - `device_{id}/state.npz`: PRNUAccumulator sums, so new footage is folded in incrementally
+    - `device_{id}/meta.json`: frame count, resolution and the sha256 of every enrolled source
+    - `device_{id}.npy`: the finalized fingerprint
+
+    Updates of one device are serialized by a lock file and every file is replaced atomically,
+    so readers never see a half-written fingerprint.
+    """
+
+    def __init__(self, root: Optional[Path] = None):
+        self._root = root
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    @property
+    def root(self) -> Path:
+        return self._root or config.FINGERPRINT_DIR
+
+    def _dir(self, device_id: str) -> Path:
+        return self.root / f"device_{device_id}"
+
+    @contextmanager
+    def _lock(self, device_id: str):
+        with self._locks_guard:
+            tlock = self._locks.setdefault(device_id, threading.Lock())
+        with tlock:
+            d = utils.safe_mkdir(self._dir(device_id))
+            with open(d / ".lock", "a+b") as fh:
+                if fcntl is not None:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+    def meta(self, device_id: str) -> Dict:
+        try:
+            with open(self._dir(device_id) / "meta.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"device_id": device_id, "frames": 0, "resolution": None, "sources": {}}
+
+    def sources(self, device_id: str) -> Dict[str, Dict]:
+        return self.meta(device_id).get("sources", {})
+
+    def is_legacy(self, device_id: str) -> bool:
+        """True if the device has a fingerprint but no accumulator state to fold new footage into."""
+        return fingerprint_path(device_id, self.root).exists() and not (self._dir(device_id) / "state.npz").exists()
+
+    def _load_state(self, device_id: str) -> prnu.PRNUAccumulator:
+        path = self._dir(device_id) / "state.npz"
+        if not path.exists():
+            return prnu.PRNUAccumulator()
+        with np.load(path) as state:
+            return prnu.PRNUAccumulator.from_state(state)
+
+    def add(self, device_id: str, items: Iterable[Tuple[str, str, Path]]) -> Tuple[Dict, List[str]]:
+        """
+        Fold per-video accumulator states (`(sha256, filename, state_path)`) into the device.
+        Sources already enrolled, including by a concurrent request, are skipped.
+        Returns the updated meta and the sha256 of the sources actually added.
+        Raises LegacyFingerprint rather than replace a fingerprint enrolled before state was kept.
+        """
+        if not valid_device_id(device_id):
+            raise ValueError(f"Invalid device id: {device_id!r}")
+        with self._lock(device_id):
+            if self.is_legacy(device_id):
+                raise LegacyFingerprint.for_device(device_id, self.root)
+            meta = self.meta(device_id)
+            acc = self._load_state(device_id)
+            added: List[str] = []
+            now = datetime.utcnow().isoformat() + "Z"
+            for sha, filename, state_path in items:
+                if sha in meta["sources"]:
+                    continue
+                with np.load(state_path) as state:
+                    video = prnu.PRNUAccumulator.from_state(state)
+                acc.merge(video)
+                meta["sources"][sha] = {"filename": filename, "frames": video.count, "enrolled_at": now}
+                added.append(sha)
+            if not added:
+                return meta, added
+
+            d = self._dir(device_id)
+            state = acc.state()
+            _atomic_write(d / "state.npz", lambda f: np.savez(f, **state))
+            fingerprint = acc.finalize()
+            _atomic_write(fingerprint_path(device_id, self.root), lambda f: np.save(f, fingerprint))
+            meta.update(device_id=device_id, frames=acc.count, resolution=list(acc.shape), updated_at=now)
+            _atomic_write(d / "meta.json", lambda f: f.write(json.dumps(meta, indent=2).encode("utf-8")))
+            return meta, added
+
+
+def _normalize_rows(x: np.ndarray) -> np.ndarray:
+    x = x.astype(np.float32).reshape(x.shape[0], -1)
+    x -= x.mean(axis=1, keepdims=True)
+    x /= np.linalg.norm(x, axis=1, keepdims=True) + 1e-12
+    return x
+
+
+@dataclass(frozen=True)
+class _IndexState:
+    """One generation of the index; replaced as a whole so readers never mix generations."""
+    signature: Optional[str] = None
+    groups: Dict[Tuple[int, int], Dict] = field(default_factory=dict)
+    rows: Dict[str, Tuple[Tuple[int, int], int]] = field(default_factory=dict)
+    stamps: Dict[str, str] = field(default_factory=dict)
+
+    def reference(self, device_id: str) -> Optional[np.ndarray]:
+        hit = self.rows.get(device_id)
+        if hit is None:
+            return None
+        shape, i = hit
+        return self.groups[shape]["matrix"][i].reshape(shape)
+
+
+class FingerprintIndex:
+    """
+    All enrolled fingerprints as zero-mean, unit-norm rows of a memory-mapped float32 matrix
+    (one per fingerprint resolution) plus small in-memory count sketches of each row.
+    `identify` scores every device on the sketches and computes exact correlations only for
+    the best `candidates`. The index is rebuilt only when the set of fingerprint files changes.
+    """
+
+    def __init__(self, root: Optional[Path] = None, sketch_dim: int = config.IDENTIFY_SKETCH_DIM,
+                 seed: int = config.IDENTIFY_SEED):
+        self._root = root
+        self.sketch_dim = sketch_dim
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._state = _IndexState()
+        self._hashes: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {}
+
+    @property
+    def root(self) -> Path:
+        return self._root or config.FINGERPRINT_DIR
+
+    @property
+    def index_dir(self) -> Path:
+        return self.root / "index"
+
+    def _fingerprint_files(self) -> List[Tuple[str, Path, os.stat_result]]:
+        out = []
+        for p in sorted(self.root.glob("device_*.npy")):
+            try:
+                out.append((p.stem[len("device_"):], p, p.stat()))
+            except OSError:
+                continue
+        return out
+
+    def signature(self, files: Optional[List[Tuple[str, Path, os.stat_result]]] = None) -> str:
+        """Changes whenever a fingerprint is added, replaced or removed."""
+        files = self._fingerprint_files() if files is None else files
+        return hashlib.sha256(
+            json.dumps([(d, st.st_size, st.st_mtime_ns) for d, _, st in files]).encode()
+        ).hexdigest()
+
+    def _sketch_hashes(self, shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+        if shape not in self._hashes:
+            rng = np.random.default_rng([self.seed, shape[0], shape[1]])
+            n = shape[0] * shape[1]
+            self._hashes[shape] = (rng.integers(0, self.sketch_dim, n), rng.choice(np.array([-1.0, 1.0], np.float32), n))
+        return self._hashes[shape]
+
+    def _sketch(self, rows: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+        # Count sketch: inner products of sketches estimate inner products of the rows
+        buckets, signs = self._sketch_hashes(shape)
+        return np.stack([np.bincount(buckets, weights=r * signs, minlength=self.sketch_dim) for r in rows]).astype(np.float32)
+
+    def _build_matrix(self, path: Path, members: List[Tuple[str, Path]], shape: Tuple[int, int]) -> np.ndarray:
+        # Written under a private name and renamed, so no process maps a half-written matrix
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            mat = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(len(members), shape[0] * shape[1]))
+            for i, (_, fp_path) in enumerate(members):
+                mat[i] = _normalize_rows(np.load(fp_path)[None])[0]
+            mat.flush()
+            del mat
+            os.replace(tmp, path)
+        finally:
+            utils.cleanup_path(tmp)
+        return np.load(path, mmap_mode="r")
+
+    def _remove_old_generations(self, current: List[Path]) -> None:
+        """
+        Delete matrices of generations older than the current one. Matrices written after it
+        (another process that already saw newer fingerprints) are left for that process.
+        """
+        try:
+            cutoff = min(p.stat().st_mtime_ns for p in current)
+        except (OSError, ValueError):
+            return
+        keep = {p.name for p in current}
+        for old in self.index_dir.glob("matrix_*.f32"):
+            try:
+                if old.name not in keep and old.stat().st_mtime_ns < cutoff:
+                    utils.cleanup_path(old)
+            except OSError:
+                continue
+
+    def _snapshot(self) -> _IndexState:
+        self.refresh()
+        return self._state
+
+    def refresh(self) -> None:
+        with self._lock:
+            files = self._fingerprint_files()
+            signature = self.signature(files)
+            if signature == self._state.signature:
+                return
+            by_shape: Dict[Tuple[int, int], List[Tuple[str, Path]]] = {}
+            stamps = {d: f"{d}:{st.st_size}:{st.st_mtime_ns}" for d, _, st in files}
+            for device_id, path, _ in files:
+                try:
+                    shape = tuple(np.load(path, mmap_mode="r").shape)
+                except (OSError, ValueError):
+                    continue
+                if len(shape) == 2:
+                    by_shape.setdefault(shape, []).append((device_id, path))
+
+            utils.safe_mkdir(self.index_dir)
+            groups: Dict[Tuple[int, int], Dict] = {}
+            rows: Dict[str, Tuple[Tuple[int, int], int]] = {}
+            paths: List[Path] = []
+            for shape, members in by_shape.items():
+                h, w = shape
+                mat_path = self.index_dir / f"matrix_{h}x{w}.{signature[:12]}.f32"
+                matrix = self._build_matrix(mat_path, members, shape)
+                paths.append(mat_path)
+                for i, (device_id, _) in enumerate(members):
+                    rows[device_id] = (shape, i)
+                sketches = np.concatenate([self._sketch(matrix[i:i + 64], shape) for i in range(0, len(members), 64)])
+                groups[shape] = {"ids": [d for d, _ in members], "matrix": matrix, "sketches": sketches}
+            self._state = _IndexState(signature=signature, groups=groups, rows=rows, stamps=stamps)
+            self._remove_old_generations(paths)
+
+    def __len__(self) -> int:
+        return len(self._state.rows)
+
+    def reference(self, device_id: str) -> Tuple[Optional[np.ndarray], Optional[str]]:
+        """Normalized fingerprint and spectrum cache key of one device, from the same generation."""
+        state = self._snapshot()
+        return state.reference(device_id), state.stamps.get(device_id)
+
+    def fingerprint(self, device_id: str) -> Optional[np.ndarray]:
+        """Normalized fingerprint of one device as a read-only view into the index."""
+        return self._snapshot().reference(device_id)
+
+    def spectrum_key(self, device_id: str) -> Optional[str]:
+        """Cache key for the device's reference spectrum; changes when it is re-enrolled."""
+        return self._state.stamps.get(device_id)
+
+    def identify(self, clip_prnu: np.ndarray, top_k: int = config.IDENTIFY_TOP_K,
+                 candidates: int = config.IDENTIFY_CANDIDATES, method: str = config.PRNU_MATCH_METHOD,
+                 pce_top: int = config.IDENTIFY_PCE_TOP) -> List[Dict]:
+        """
+        Rank enrolled devices against a clip fingerprint (best first). Each resolution group is
+        pruned to `candidates` on the sketches and scored by exact correlation. With
+        `method="pce"` the candidates of all groups are pre-ranked by single-scale PCE (which
+        tolerates crops) and only the best `pce_top` get the full multi-scale PCE.
+        """
+        state = self._snapshot()
+        scored: List[Dict] = []
+        for shape, group in state.groups.items():
+            q = clip_prnu
+            if q.shape != shape:
+                q = cv2.resize(q.astype(np.float32), (shape[1], shape[0]), interpolation=cv2.INTER_CUBIC)
+            q = _normalize_rows(q[None])[0]
+            approx = group["sketches"] @ self._sketch(q[None], shape)[0]
+            n = min(candidates, len(approx))
+            rows = np.sort(np.argpartition(-approx, n - 1)[:n])
+            exact = group["matrix"][rows] @ q
+            scored.extend({"device_id": group["ids"][i], "correlation": float(c)} for c, i in zip(exact, rows))
+        if method == "pce":
+            def pce(cand: Dict, scales: Tuple[float, ...]) -> None:
+                m = prnu.pce_match(clip_prnu, state.reference(cand["device_id"]), state.stamps.get(cand["device_id"]), scales=scales)
+                cand.update(pce=m["pce"], similarity=prnu.pce_similarity(m["pce"]), scale=m["scale"], shift=list(m["shift"]))
+
+            for cand in scored:
+                pce(cand, (1.0,))
+            scored.sort(key=lambda c: c["pce"], reverse=True)
+            # The multi-scale PCE is at least the single-scale one, so the order below the top stays valid
+            for cand in scored[:pce_top]:
+                pce(cand, config.PRNU_PCE_SCALES)
+            scored.sort(key=lambda c: c["pce"], reverse=True)
+        else:
+            scored.sort(key=lambda c: c["correlation"], reverse=True)
+        return scored[:top_k]
+
+
+_store: Optional[DeviceStore] = None
+
+
+def get_store() -> DeviceStore:
+    global _store
+    if _store is None:
+        _store = DeviceStore()
+    return _store
+
+
+_index: Optional[FingerprintIndex] = None
+
+
+def get_index() -> FingerprintIndex:
+    global _index
+    if _index is None:
+        _index = FingerprintIndex()
+    return _index
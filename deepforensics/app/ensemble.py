@@ -1,17 +1,20 @@
 from __future__ import annotations
 
-from typing import Dict
+from typing import Dict, Optional
 
 from . import config
 
 
-def score_and_decide(ml_score: float, prnu_similarity: float, metadata_flag_score: float) -> Dict:
+def score_and_decide(ml_score: float, prnu_similarity: float, metadata_flag_score: float,
+                     temporal_score: Optional[float] = None) -> Dict:
     # ensemble_score = w_ml * ml_score + w_prnu * (1 - prnu_similarity) + w_meta * metadata_flag_score
-    ensemble_score = (
-        config.W_ML * ml_score
-        + config.W_PRNU * (1.0 - prnu_similarity)
-        + config.W_META * metadata_flag_score
-    )
+    #                  [+ w_temporal * temporal_score, capped at 1]
+    # The temporal term is added on top rather than renormalizing the other weights: it is 0 for a
+    # clip with consistent noise, so such clips keep their score against the 0.4/0.7 thresholds
+    ensemble_score = (config.W_ML * ml_score + config.W_PRNU * (1.0 - prnu_similarity)
+                      + config.W_META * metadata_flag_score)
+    if temporal_score is not None and config.W_TEMPORAL > 0:
+        ensemble_score = min(1.0, ensemble_score + config.W_TEMPORAL * temporal_score)
     if ensemble_score >= 0.7:
         decision = "LIKELY_MANIPULATED"
     elif ensemble_score >= 0.4:
@@ -19,5 +22,3 @@ def score_and_decide(ml_score: float, prnu_similarity: float, metadata_flag_scor
     else:
         decision = "SAFE"
     return {"weighted_score": float(ensemble_score), "decision": decision}
-
-
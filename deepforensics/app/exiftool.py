@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import itertools
+import json
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from . import config
+
+
+class ExifToolError(RuntimeError):
+    pass
+
+
+class ExifToolTimeout(ExifToolError):
+    pass
+
+
+class ExifToolUnsafePath(ExifToolError):
+    """The path would be read as more than one argument (or as an option) from the -@ argfile."""
+
+
+def argfile_safe(path: Path) -> bool:
+    text = str(path)
+    return "\n" not in text and "\r" not in text and not text.startswith("-")
+
+
+def run_once(path: Path, command: Sequence[str] = ("exiftool",), timeout: float = config.EXIFTOOL_TIMEOUT) -> Dict:
+    """One-shot `exiftool -j <path>`: the path is a single argv entry, so any file name is safe."""
+    try:
+        proc = subprocess.run(
+            list(command) + ["-j", "-charset", "filename=utf8", str(Path(path).absolute())],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise ExifToolTimeout(f"exiftool timed out after {timeout}s")
+    text = proc.stdout.decode("utf-8", errors="ignore").strip()
+    if not text:
+        return {}
+    data = json.loads(text)
+    return data[0] if isinstance(data, list) and data else {}
+
+
+class ExifToolProcess:
+    """
+    One long-lived `exiftool -stay_open True -@ -` worker returning JSON (-j).
+    The process is (re)started on demand; a crash or a timed-out call kills it
+    and the next call starts a fresh one.
+    """
+
+    def __init__(self, command: Sequence[str] = ("exiftool",)):
+        self.command = list(command)
+        self._proc: Optional[subprocess.Popen] = None
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._seq = itertools.count(1)
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self) -> None:
+        self._lines = queue.Queue()
+        self._proc = subprocess.Popen(
+            self.command + ["-stay_open", "True", "-@", "-", "-common_args", "-j", "-charset", "filename=utf8"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        # A reader thread lets execute() enforce a timeout portably (no select() on Windows pipes)
+        threading.Thread(target=self._pump, args=(self._proc, self._lines), daemon=True).start()
+
+    @staticmethod
+    def _pump(proc: subprocess.Popen, lines: "queue.Queue[Optional[str]]") -> None:
+        for raw in proc.stdout:
+            lines.put(raw.decode("utf-8", errors="ignore"))
+        lines.put(None)
+
+    def close(self) -> None:
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            if proc.poll() is None:
+                proc.stdin.write(b"-stay_open\nFalse\n")
+                proc.stdin.flush()
+                proc.wait(timeout=2)
+        except Exception:
+            pass
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+    def execute(self, path: Path, timeout: float = config.EXIFTOOL_TIMEOUT) -> Dict:
+        if not argfile_safe(path):
+            # A newline would inject arguments (-o, -w, ...) and desync the {readyN} sentinel
+            raise ExifToolUnsafePath(f"Path cannot be sent to the exiftool worker: {path!r}")
+        if not self.alive:
+            self.start()
+        seq = next(self._seq)
+        try:
+            self._proc.stdin.write(f"{path}\n-execute{seq}\n".encode("utf-8"))
+            self._proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            self.close()
+            raise ExifToolError(f"exiftool worker died: {e}")
+
+        sentinel = f"{{ready{seq}}}"
+        out: List[str] = []
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                line = self._lines.get(timeout=max(0.0, remaining))
+            except queue.Empty:
+                self.close()
+                raise ExifToolTimeout(f"exiftool timed out after {timeout}s")
+            if line is None:
+                self.close()
+                raise ExifToolError("exiftool worker exited unexpectedly")
+            if line.strip() == sentinel:
+                break
+            out.append(line)
+        text = "".join(out).strip()
+        if not text:
+            return {}
+        data = json.loads(text)
+        return data[0] if isinstance(data, list) and data else {}
+
+
+class ExifToolPool:
+    """Small fixed-size pool of exiftool workers shared by concurrent requests."""
+
+    def __init__(self, size: int = config.EXIFTOOL_POOL_SIZE, command: Sequence[str] = ("exiftool",)):
+        self._idle: "queue.Queue[ExifToolProcess]" = queue.Queue()
+        self._workers = [ExifToolProcess(command) for _ in range(max(1, size))]
+        for w in self._workers:
+            self._idle.put(w)
+
+    def execute(self, path: Path, timeout: float = config.EXIFTOOL_TIMEOUT) -> Dict:
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise ExifToolError("No exiftool worker available")
+        try:
+            try:
+                return worker.execute(path, timeout)
+            except (ExifToolTimeout, ExifToolUnsafePath):
+                raise
+            except ExifToolError:
+                # Crashed mid-call: retry once on a freshly started process
+                return worker.execute(path, timeout)
+        finally:
+            self._idle.put(worker)
+
+    def close(self) -> None:
+        for w in self._workers:
+            w.close()
+
+
+_pool: Optional[ExifToolPool] = None
+_pool_lock = threading.Lock()
+
+
+def available() -> bool:
+    return shutil.which("exiftool") is not None
+
+
+def get_pool() -> Optional[ExifToolPool]:
+    """App-wide pool, created lazily; None when exiftool is not installed."""
+    global _pool
+    if _pool is None and available():
+        with _pool_lock:
+            if _pool is None:
+                _pool = ExifToolPool()
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -1,54 +1,53 @@
 from __future__ import annotations
 
+import bisect
+import concurrent.futures as futures
 import math
 import os
+import subprocess
+import tempfile
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 
 import cv2
+import numpy as np
 
 from . import config, utils
+from .media import MediaInfo
 
 
-def get_duration_seconds(video_path: Path) -> float:
-    meta = utils.ffprobe_json(video_path)
-    try:
-        return float(meta.get("format", {}).get("duration", 0.0))
-    except Exception:
-        return 0.0
-
-
-def compute_frame_step(video_path: Path, target_frames: int = config.FRAME_COUNT) -> int:
-    meta = utils.ffprobe_json(video_path)
-    nb_frames = None
-    for s in meta.get("streams", []):
-        if s.get("codec_type") == "video":
-            nb = s.get("nb_frames")
-            if nb is not None:
-                try:
-                    nb_frames = int(nb)
-                except Exception:
-                    nb_frames = None
-            break
-    if not nb_frames:
-        # fallback by duration * fps estimation
-        try:
-            r_num, r_den = meta["streams"][0]["r_frame_rate"].split("/")
-            fps = float(r_num) / float(r_den)
-        except Exception:
-            fps = 30.0
-        duration = get_duration_seconds(video_path)
-        nb_frames = max(1, int(duration * fps))
+def _media(video_path: Path, media: Optional[MediaInfo]) -> MediaInfo:
+    if media is not None:
+        return media
+    # Direct callers without a shared probe pay for one uncached ffprobe, but no hashing
+    return MediaInfo(sha256="", size=0, probe=utils.ffprobe_json(video_path))
+
+
+def get_duration_seconds(video_path: Path, media: Optional[MediaInfo] = None) -> float:
+    return _media(video_path, media).duration
+
+
+def compute_frame_step(video_path: Path, target_frames: int = config.FRAME_COUNT,
+                       media: Optional[MediaInfo] = None) -> int:
+    nb_frames = _media(video_path, media).nb_frames
     step = max(1, nb_frames // max(1, target_frames))
     return step
 
 
+def compute_frame_indices(nb_frames: int, target_frames: int = config.FRAME_COUNT) -> List[int]:
+    """Frame indices kept by the strided `select='not(mod(n,step))'` sampler."""
+    step = max(1, nb_frames // max(1, target_frames))
+    return list(range(0, nb_frames, step))[:target_frames]
+
+
 def sample_frames(video_path: Path, out_dir: Path, resize_width: int = config.RESIZE_WIDTH,
-                  target_frames: int = config.FRAME_COUNT) -> Tuple[List[Path], Dict]:
+                  target_frames: int = config.FRAME_COUNT,
+                  media: Optional[MediaInfo] = None) -> Tuple[List[Path], Dict]:
     utils.safe_mkdir(out_dir)
     # Ensure required tools exist
     utils.require_binaries(["ffmpeg", "ffprobe"])
-    step = compute_frame_step(video_path, target_frames)
+    media = _media(video_path, media)
+    step = compute_frame_step(video_path, target_frames, media)
     vf = f"select='not(mod(n,{step}))',scale={resize_width}:-1"
     pattern = str(out_dir / "frame_%04d.png")
     code, out, err = utils.run_cmd([
@@ -64,8 +63,205 @@ def sample_frames(video_path: Path, out_dir: Path, resize_width: int = config.RE
     if len(frames) == 0:
         raise RuntimeError("No frames extracted; check input file and ffmpeg codecs support.")
 
-    duration = get_duration_seconds(video_path)
-    return frames, {"duration_sec": duration, "frame_step": step, "frame_count": len(frames)}
+    return frames, {"duration_sec": media.duration, "frame_step": step, "frame_count": len(frames),
+                    "source_frames": [i * step for i in range(len(frames))]}
+
+
+def _output_size(media: MediaInfo, resize_width: int) -> Tuple[int, int]:
+    """Frame size ffmpeg produces for `scale=resize_width:H`, honouring display rotation."""
+    stream = media.video_stream
+    w = int(stream.get("width") or 0)
+    h = int(stream.get("height") or 0)
+    if w <= 0 or h <= 0:
+        raise RuntimeError("Could not determine video dimensions from ffprobe.")
+    rotation = 0
+    try:
+        rotation = int(float((stream.get("tags") or {}).get("rotate", 0)))
+    except Exception:
+        rotation = 0
+    for sd in stream.get("side_data_list", []) or []:
+        if "rotation" in sd:
+            try:
+                rotation = int(float(sd["rotation"]))
+            except Exception:
+                pass
+    # ffmpeg autorotates before the filter graph, so a quarter turn swaps the axes
+    if abs(rotation) % 180 == 90:
+        w, h = h, w
+    out_h = max(1, int(round(h * resize_width / float(w))))
+    return resize_width, out_h
+
+
+def _read_exact(stream, buf: memoryview) -> int:
+    total = 0
+    while total < len(buf):
+        n = stream.readinto(buf[total:])
+        if not n:
+            break
+        total += n
+    return total
+
+
+def _decode_strided(video_path: Path, step: int, width: int, height: int,
+                    target_frames: int) -> Tuple[np.ndarray, List[int]]:
+    vf = f"select='not(mod(n,{step}))',scale={width}:{height}"
+    frames = np.empty((target_frames, height, width, 3), dtype=np.uint8)
+    frame_bytes = height * width * 3
+    flat = memoryview(frames.reshape(-1))
+    count = 0
+    with tempfile.TemporaryFile() as errf:
+        proc = subprocess.Popen([
+            "ffmpeg", "-nostdin", "-v", "error", "-i", str(video_path), "-vf", vf, "-vsync", "0",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1",
+        ], stdout=subprocess.PIPE, stderr=errf)
+        try:
+            while count < target_frames:
+                got = _read_exact(proc.stdout, flat[count * frame_bytes:(count + 1) * frame_bytes])
+                if got < frame_bytes:
+                    break
+                count += 1
+        finally:
+            if count >= target_frames and proc.poll() is None:
+                # Enough frames; do not wait for ffmpeg to decode the rest of the file
+                proc.kill()
+            proc.stdout.close()
+            code = proc.wait()
+        errf.seek(0)
+        err = errf.read().decode(errors="ignore")
+    if count == 0 and code != 0:
+        raise RuntimeError(f"ffmpeg sampling failed: {err}")
+    return frames[:count], [i * step for i in range(count)]
+
+
+def _decode_at(video_path: Path, seconds: float, width: int, height: int,
+               out: np.ndarray, keyframes_only: bool) -> bool:
+    """Seek to `seconds` and decode a single frame into `out`; False if nothing was decoded."""
+    cmd = ["ffmpeg", "-nostdin", "-v", "error"]
+    if keyframes_only:
+        # Snap to the keyframe at or before the target and never decode inter frames
+        cmd += ["-skip_frame", "nokey", "-noaccurate_seek"]
+    cmd += [
+        "-ss", f"{seconds:.6f}", "-i", str(video_path), "-frames:v", "1",
+        "-vf", f"scale={width}:{height}", "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1",
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0 or len(proc.stdout) < out.nbytes:
+        return False
+    out[...] = np.frombuffer(proc.stdout, dtype=np.uint8, count=out.size).reshape(out.shape)
+    return True
+
+
+def _decode_seek(video_path: Path, indices: List[int], fps: float, width: int, height: int,
+                 keyframes_only: bool) -> Tuple[np.ndarray, List[int]]:
+    frames = np.empty((len(indices), height, width, 3), dtype=np.uint8)
+    # Accurate seeking keeps the first frame with pts >= target, so aim half a frame early
+    times = [max(0.0, (i - 0.5) / fps) for i in indices]
+    with futures.ThreadPoolExecutor(max_workers=config.MAX_WORKERS) as ex:
+        ok = list(ex.map(
+            lambda j: _decode_at(video_path, times[j], width, height, frames[j], keyframes_only),
+            range(len(indices)),
+        ))
+    if not all(ok):
+        frames = frames[np.asarray(ok, dtype=bool)]
+    return frames, [i for i, good in zip(indices, ok) if good]
+
+
+def keyframe_times(video_path: Path) -> List[float]:
+    """Presentation times of the video keyframes, from packet flags (demux only, nothing is decoded)."""
+    code, out, err = utils.run_cmd([
+        "ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0", str(video_path),
+    ])
+    if code != 0:
+        raise RuntimeError(f"ffprobe failed: {err}")
+    times = []
+    for line in out.splitlines():
+        pts, _, flags = line.strip().partition(",")
+        if "K" not in flags:
+            continue
+        try:
+            times.append(float(pts))
+        except ValueError:
+            continue  # N/A
+    return sorted(times)
+
+
+def _decode_keyframes(video_path: Path, indices: List[int], fps: float, start_time: float,
+                      width: int, height: int) -> Tuple[np.ndarray, List[int]]:
+    """
+    Decode the keyframe at or before each target frame. Targets that snap to the same
+    keyframe (GOP longer than the sampling step) yield that frame once, not once per target.
+    """
+    keys = [t - start_time for t in keyframe_times(video_path)]
+    if not keys:
+        return _decode_seek(video_path, indices, fps, width, height, keyframes_only=True)
+    snapped = sorted({keys[max(0, bisect.bisect_right(keys, i / fps + 1e-6) - 1)] for i in indices})
+    frames = np.empty((len(snapped), height, width, 3), dtype=np.uint8)
+    # A quarter frame past the keyframe, so rounding never snaps back to the previous one
+    times = [max(0.0, k + 0.25 / fps) for k in snapped]
+    with futures.ThreadPoolExecutor(max_workers=config.MAX_WORKERS) as ex:
+        ok = list(ex.map(
+            lambda j: _decode_at(video_path, times[j], width, height, frames[j], True),
+            range(len(snapped)),
+        ))
+    if not all(ok):
+        frames = frames[np.asarray(ok, dtype=bool)]
+    return frames, [int(round(k * fps)) for k, good in zip(snapped, ok) if good]
+
+
+def _resolve_sampling(sampling: str, nb_frames: int, fps: float) -> str:
+    if sampling != "auto":
+        return sampling
+    # Short clips are cheaper to decode in one pass than to seek once per frame
+    return "seek" if nb_frames / max(fps, 1e-6) >= config.SEEK_MIN_DURATION_SEC else "stride"
+
+
+def decode_frames(video_path: Path, resize_width: int = config.RESIZE_WIDTH,
+                  target_frames: int = config.FRAME_COUNT,
+                  sampling: str = config.FRAME_SAMPLING,
+                  media: Optional[MediaInfo] = None) -> Tuple[np.ndarray, Dict]:
+    """
+    Sample frames like `sample_frames`, but read raw BGR frames from ffmpeg's stdout
+    into a preallocated (N, H, W, 3) uint8 array instead of writing PNGs to disk.
+
+    `sampling` selects how frames are reached: "stride" decodes the whole file and keeps
+    every step-th frame, "seek" seeks to each target frame in parallel, "keyframe" seeks
+    and snaps to the nearest preceding keyframe (each keyframe is returned once, so a long
+    GOP yields fewer frames), and "auto" picks stride or seek by duration.
+    """
+    utils.require_binaries(["ffmpeg", "ffprobe"])
+    media = _media(video_path, media)
+    nb_frames, fps = media.nb_frames, media.fps
+    step = max(1, nb_frames // max(1, target_frames))
+    width, height = _output_size(media, resize_width)
+    mode = _resolve_sampling(sampling, nb_frames, fps)
+    if mode == "stride":
+        frames, sources = _decode_strided(video_path, step, width, height, target_frames)
+    elif mode == "seek":
+        indices = compute_frame_indices(nb_frames, target_frames)
+        frames, sources = _decode_seek(video_path, indices, fps, width, height, keyframes_only=False)
+    elif mode == "keyframe":
+        indices = compute_frame_indices(nb_frames, target_frames)
+        frames, sources = _decode_keyframes(video_path, indices, fps, media.start_time, width, height)
+    else:
+        raise ValueError(f"Unknown frame sampling mode: {sampling}")
+    if not sources:
+        raise RuntimeError("No frames extracted; check input file and ffmpeg codecs support.")
+
+    return frames, {"duration_sec": media.duration, "frame_step": step, "frame_count": len(sources), "sampling": mode,
+                    "source_frames": sources}
+
+
+def extract_frames(video_path: Path, out_dir: Path, resize_width: int = config.RESIZE_WIDTH,
+                   target_frames: int = config.FRAME_COUNT,
+                   media: Optional[MediaInfo] = None) -> Tuple[Union[np.ndarray, List[Path]], Dict]:
+    """Sample frames using the configured decode mode (`pipe` in memory, `png` on disk)."""
+    if config.FRAME_DECODE_MODE == "png":
+        frames, info = sample_frames(video_path, out_dir, resize_width, target_frames, media=media)
+    else:
+        frames, info = decode_frames(video_path, resize_width, target_frames, media=media)
+    info["decode_mode"] = config.FRAME_DECODE_MODE
+    return frames, info
 
 
 def load_frame(path: Path):
@@ -75,3 +271,8 @@ def load_frame(path: Path):
     return img
 
 
+def as_bgr(frame: Union[np.ndarray, Path]) -> np.ndarray:
+    """Return a BGR array for either an in-memory frame or a frame file on disk."""
+    if isinstance(frame, np.ndarray):
+        return frame
+    return load_frame(frame)
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures as futures
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import config
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+@dataclass
+class Job:
+    task_id: str
+    status: str = "queued"  # queued | running | done | failed
+    stage: str = "queued"
+    progress: float = 0.0
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+    result: Optional[Dict] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    events: List[Dict] = field(default_factory=list)
+    _cond: threading.Condition = field(default_factory=threading.Condition, repr=False)
+    _waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = field(default_factory=list, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def snapshot(self) -> Dict:
+        out = {
+            "task_id": self.task_id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "error": self.error,
+        }
+        if self.status == "done":
+            out["report"] = self.result
+        return out
+
+    def _emit(self, event: str, **changes) -> None:
+        with self._cond:
+            for k, v in changes.items():
+                setattr(self, k, v)
+            self.updated_at = time.time()
+            self.events.append({
+                "event": event, "status": self.status, "stage": self.stage,
+                "progress": round(self.progress, 3), "error": self.error,
+            })
+            self._cond.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for loop, ready in waiters:
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:
+                pass  # that client's event loop is already closed
+
+    def wait_events(self, start: int, timeout: float) -> List[Dict]:
+        """Block until there are events past index `start` (or timeout); return them."""
+        with self._cond:
+            if len(self.events) <= start and not self.finished:
+                self._cond.wait(timeout)
+            return list(self.events[start:])
+
+    async def next_events(self, start: int, timeout: float) -> List[Dict]:
+        """`wait_events` for the event loop: waits on an asyncio.Event, so no thread is held."""
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        with self._cond:
+            if len(self.events) > start or self.finished:
+                return list(self.events[start:])
+            self._waiters.append((loop, ready))
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                if (loop, ready) in self._waiters:
+                    self._waiters.remove((loop, ready))
+        with self._cond:
+            return list(self.events[start:])
+
+
+class JobManager:
+    """
+    Runs submitted analyses on a bounded thread pool and keeps their status in memory.
+    Jobs beyond `max_pending` (queued + running) are refused instead of piling up.
+    """
+
+    def __init__(self, max_workers: int = config.JOB_WORKERS, max_pending: int = config.JOB_MAX_PENDING,
+                 ttl_seconds: int = config.TMP_TTL_SECONDS):
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="df-job")
+        self._jobs: Dict[str, Job] = {}
+        # Futures of jobs that may still be queued, with the cleanup to run if they never start
+        self._queued: Dict[str, Tuple[futures.Future, Optional[Callable[[], None]]]] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, task_id: str, fn: Callable[..., Dict], *args, on_reject: Optional[Callable[[], None]] = None) -> Job:
+        """
+        Queue `fn(*args, progress=...)`; its return value becomes the job result. `on_reject`
+        runs if the job never starts: refused because the queue is full, or cancelled at shutdown.
+        """
+        with self._lock:
+            self._prune()
+            pending = sum(1 for j in self._jobs.values() if not j.finished)
+            if pending >= self.max_pending:
+                if on_reject is not None:
+                    on_reject()
+                raise JobQueueFull(f"Too many pending jobs ({pending})")
+            job = Job(task_id=task_id)
+            job.events.append({"event": "queued", "status": "queued", "stage": "queued", "progress": 0.0, "error": None})
+            self._jobs[task_id] = job
+            self._queued[task_id] = (self._executor.submit(self._run, job, fn, args), on_reject)
+        return job
+
+    def get(self, task_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(task_id)
+
+    def _run(self, job: Job, fn: Callable[..., Dict], args) -> None:
+        job._emit("progress", status="running", stage="started")
+
+        def progress(stage: str, fraction: float) -> None:
+            job._emit("progress", stage=stage, progress=fraction)
+
+        try:
+            result = fn(*args, progress=progress)
+        except Exception as e:
+            job._emit("failed", status="failed", error=getattr(e, "detail", str(e)),
+                      status_code=getattr(e, "status_code", 500))
+            return
+        job._emit("done", status="done", stage="done", progress=1.0, result=result)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        for tid in [t for t, j in self._jobs.items() if j.finished and j.updated_at < cutoff]:
+            del self._jobs[tid]
+        for tid in [t for t, (fut, _) in self._queued.items() if fut.done()]:
+            del self._queued[tid]
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stop the pool; jobs still queued are marked failed and their inputs cleaned up."""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        with self._lock:
+            queued, self._queued = self._queued, {}
+            cancelled = [(self._jobs[tid], cleanup) for tid, (fut, cleanup) in queued.items()
+                         if fut.cancelled() and tid in self._jobs]
+        for job, cleanup in cancelled:
+            job._emit("failed", status="failed", error="Server shut down before the job started", status_code=503)
+            if cleanup is not None:
+                cleanup()
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_manager() -> JobManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
+
+
+def shutdown_manager() -> None:
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.shutdown()
+            _manager = None
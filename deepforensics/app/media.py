@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from . import config, utils
+
+
+CACHE_VERSION = 1
+
+
+@dataclass
+class MediaInfo:
+    """ffprobe/exiftool results for one input, probed once and shared by every stage."""
+    sha256: str
+    size: int
+    probe: Dict
+    exif: Optional[Dict] = None
+
+    @property
+    def format(self) -> Dict:
+        return self.probe.get("format", {}) or {}
+
+    @property
+    def video_stream(self) -> Dict:
+        for s in self.probe.get("streams", []):
+            if s.get("codec_type") == "video":
+                return s
+        return {}
+
+    @property
+    def duration(self) -> float:
+        try:
+            return float(self.format.get("duration", 0.0))
+        except Exception:
+            return 0.0
+
+    @property
+    def fps(self) -> float:
+        try:
+            r_num, r_den = self.video_stream["r_frame_rate"].split("/")
+            return float(r_num) / float(r_den)
+        except Exception:
+            return 30.0
+
+    @property
+    def start_time(self) -> float:
+        """Container start time; input seeks (`-ss`) are relative to it."""
+        try:
+            return float(self.format.get("start_time", 0.0))
+        except Exception:
+            return 0.0
+
+    @property
+    def nb_frames(self) -> int:
+        try:
+            nb = int(self.video_stream.get("nb_frames"))
+            if nb > 0:
+                return nb
+        except Exception:
+            pass
+        # fallback by duration * fps estimation
+        return max(1, int(self.duration * self.fps))
+
+    def summary(self) -> Dict:
+        s = self.video_stream
+        return {
+            "duration_sec": self.duration,
+            "fps": round(self.fps, 3),
+            "width": s.get("width"),
+            "height": s.get("height"),
+            "codec": s.get("codec_name"),
+            "encoder": self.format.get("tags", {}).get("encoder") if self.format.get("tags") else None,
+        }
+
+
+def _cache_path(sha256: str, size: int) -> Path:
+    return config.CACHE_DIR / "media" / f"{sha256}_{size}.json"
+
+
+def _load_cached(path: Path) -> Optional[MediaInfo]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != CACHE_VERSION:
+            return None
+        return MediaInfo(sha256=data["sha256"], size=data["size"], probe=data["probe"], exif=data.get("exif"))
+    except Exception:
+        return None
+
+
+def _store_cached(path: Path, info: MediaInfo) -> None:
+    utils.safe_mkdir(path.parent)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, **asdict(info)}, f)
+        os.replace(tmp, path)
+    except Exception:
+        utils.cleanup_path(tmp)
+
+
+def probe_media(video_path: Path, sha256: Optional[str] = None, use_cache: bool = config.MEDIA_CACHE_ENABLED,
+                privacy_mode: bool = False) -> MediaInfo:
+    """
+    Run ffprobe (and exiftool when installed) once for `video_path`.
+    Results are cached on disk keyed by content hash plus file size. In privacy mode nothing
+    is written: the probe holds GPS, serial numbers, owner names and creation times.
+    """
+    size = Path(video_path).stat().st_size
+    digest = sha256 or utils.sha256_file(video_path)
+    cache_path = _cache_path(digest, size)
+    if use_cache and cache_path.exists():
+        cached = _load_cached(cache_path)
+        if cached is not None:
+            return cached
+
+    probe = utils.ffprobe_json(video_path)
+    # The probed path is a per-request temp file; never persist it
+    probe.get("format", {}).pop("filename", None)
+    exif = utils.exiftool_dict(video_path)
+    if exif:
+        for k in ("File Name", "Directory", "SourceFile", "FileName"):
+            exif.pop(k, None)
+    info = MediaInfo(sha256=digest, size=size, probe=probe, exif=exif)
+    if use_cache and not privacy_mode:
+        _store_cached(cache_path, info)
+    return info
@@ -4,14 +4,19 @@ from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 from . import utils
+from .media import MediaInfo
 
 
-def analyze(video_path: Path) -> Tuple[Dict, List[str], float]:
+def analyze(video_path: Path, media: Optional[MediaInfo] = None) -> Tuple[Dict, List[str], float]:
     """
     Returns (details, flags, metadata_flag_score)
+    Reuses the probe results in `media` when given instead of running ffprobe/exiftool again.
     """
-    probe = utils.ffprobe_json(video_path)
-    exif = utils.exiftool_dict(video_path)
+    if media is not None:
+        probe, exif = media.probe, media.exif
+    else:
+        probe = utils.ffprobe_json(video_path)
+        exif = utils.exiftool_dict(video_path)
 
     flags: List[str] = []
     details: Dict = {
@@ -32,8 +37,9 @@ def analyze(video_path: Path) -> Tuple[Dict, List[str], float]:
     camera_model = None
     if exif:
         camera_model = exif.get("Model") or exif.get("Make")
-        if exif.get("Create Date") and not create_time:
-            details["create_time"] = exif.get("Create Date")
+        exif_create = exif.get("CreateDate") or exif.get("Create Date")
+        if exif_create and not create_time:
+            details["create_time"] = exif_create
 
     if not camera_model:
         flags.append("missing_exif")
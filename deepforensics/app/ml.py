@@ -2,19 +2,20 @@ from __future__ import annotations
 
 import json
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterable
 
 import numpy as np
 
-from . import config
+from . import config, ollama, rules as rules_mod
 from . import utils
-import requests
+from .media import MediaInfo
 
 
-def stub_predict(video_path: Path, metadata_flags: list[str], face_region_scores: list[dict]) -> Dict:
+def stub_predict(video_path: Path, metadata_flags: list[str], face_region_scores: list[dict],
+                 sha256: str | None = None, rules: rules_mod.RuleSet | None = None) -> Dict:
     """
     Deterministic local stub with simple heuristics. No network calls.
-    Optional filename rules in examples/stub_rules.json
+    Optional overrides by content hash, filename or pattern in examples/stub_rules.json (see rules.py).
     """
     base_score = 0.12
     rule = "baseline_low"
@@ -45,18 +46,16 @@ def stub_predict(video_path: Path, metadata_flags: list[str], face_region_scores
     if not explanation_parts:
         explanation_parts.append("Basic analysis detected no significant manipulation indicators. For detailed frame-by-frame analysis, enable Ollama model.")
 
-    # Optional per-filename overrides
-    if config.STUB_RULES_PATH.exists():
-        try:
-            with open(config.STUB_RULES_PATH, "r", encoding="utf-8") as f:
-                rules = json.load(f)
-            name = Path(video_path).name
-            if name in rules:
-                base_score = float(rules[name])
-                rule = "stub_rules_override"
-                explanation_parts.append(f"Score overridden by stub_rules.json configuration.")
-        except Exception:
-            pass
+    # Optional overrides (compiled once, reloaded when the rules file changes)
+    rules = rules_mod.get_rules() if rules is None else rules
+    if len(rules):
+        if sha256 is None and rules.uses_hashes and Path(video_path).is_file():
+            sha256 = utils.sha256_file(Path(video_path))
+        match = rules.match(Path(video_path).name, sha256, metadata_flags)
+        if match is not None:
+            base_score = match.score
+            rule = "stub_rules_override"
+            explanation_parts.append(f"Score overridden by stub_rules.json configuration (matched by {match.by}).")
 
     verdict = "AUTHENTIC" if base_score < 0.4 else ("MANIPULATED" if base_score >= 0.7 else "UNCERTAIN")
     
@@ -74,9 +73,7 @@ def stub_predict(video_path: Path, metadata_flags: list[str], face_region_scores
     }
 
 
-def _ensure_local_host(url: str) -> None:
-    if not (url.startswith("http://127.0.0.1") or url.startswith("http://localhost")):
-        raise RuntimeError("Refusing non-local Ollama host. Set DF_OLLAMA_HOST to 127.0.0.1 only.")
+_ensure_local_host = ollama.ensure_local_host
 
 
 def ollama_predict(
@@ -84,6 +81,10 @@ def ollama_predict(
     metadata_flags: list[str],
     face_region_scores: list[dict],
     frame_images_b64: list[str] | None = None,
+    media: MediaInfo | None = None,
+    frame_labels: list[str] | None = None,
+    sha256: str | None = None,
+    privacy_mode: bool = False,
 ) -> Dict:
     _ensure_local_host(config.OLLAMA_HOST)
     model = config.OLLAMA_MODEL
@@ -140,41 +141,24 @@ Respond in valid JSON format:
 - Face region analysis: {face_count} face regions detected
 - Maximum face-region suspiciousness score: {max_face_score:.3f}
 - Average face-region suspiciousness score: {avg_face_score:.3f}
-- Top 3 face-region scores: {[f"{s.get('score', 0):.3f} (frame {s.get('frame_index', '?')})" for s in face_region_scores[:3]]}
+- Top 3 face-region scores: {[f"{s.get('score', 0):.3f} (sample {s.get('frame_index', '?')})" for s in face_region_scores[:3]]}
+- Video properties: {media.summary() if media is not None else 'Unknown'}
 
 IMPORTANT: You will receive {len(frame_images_b64) if frame_images_b64 else 0} frame images. Analyze each frame visually for manipulation artifacts, then provide:
 1. Per-frame analysis (one entry per frame in frame_analysis array)
 2. Overall verdict and explanation synthesizing all frames
 
-Frame images will follow this message. Label them as "frame 0", "frame 1", "frame 2", etc. in your frame_analysis."""
+Frame images will follow this message, each introduced with its frame number; use that number as frame_index in your frame_analysis."""
     
-    content = [
-        {"type": "text", "text": prompt},
-        {"type": "text", "text": context},
-    ]
-    if config.OLLAMA_ENABLE_VISION and frame_images_b64:
-        for idx, b in enumerate(frame_images_b64[:3]):
-            content.append({"type": "image", "image": b})
-            # Add frame label hint
-            content.append({"type": "text", "text": f"This is frame {idx}. Analyze it for visual manipulation artifacts."})
-
-    body = {
-        "model": model,
-        "messages": [
-            {"role": "user", "content": content}
-        ],
-        "stream": False,
-    }
+    images = list(frame_images_b64[:config.THUMBNAIL_COUNT]) if config.OLLAMA_ENABLE_VISION and frame_images_b64 else []
+    text_parts = [prompt, context]
+    # Native chat API: images ride along with the message, in order (frame 0, frame 1, ...)
+    labels = frame_labels or [f"frame {idx}" for idx in range(len(images))]
+    text_parts += [f"Image {idx} is {label}. Analyze it for visual manipulation artifacts." for idx, label in enumerate(labels[:len(images)])]
     try:
-        r = requests.post(
-            f"{config.OLLAMA_HOST}/v1/chat/completions",
-            json=body,
-            timeout=config.OLLAMA_TIMEOUT,
-        )
-        r.raise_for_status()
-        data = r.json()
-        # Extract content text from response
-        text = data.get("choices", [{}])[0].get("message", {}).get("content", "{}")
+        # In privacy mode the answer (which describes the frames) is not written to the disk cache
+        out = ollama.get_client().chat("\n\n".join(text_parts), images, persist=not privacy_mode)
+        text = out["text"]
         
         # Try to parse JSON response
         score = 0.5
@@ -226,27 +210,44 @@ Frame images will follow this message. Label them as "frame 0", "frame 1", "fram
                 "key_findings": key_findings if key_findings else None,
                 "confidence": confidence,
                 "full_text": text[:1000] if len(text) > 1000 else text,  # Keep truncated raw for debugging
+                "cached": out["cached"],
             },
         }
     except Exception as e:
         # Fallback to stub
-        stub = stub_predict(video_path, metadata_flags, face_region_scores)
+        stub = stub_predict(video_path, metadata_flags, face_region_scores, sha256)
         stub["raw_response"]["ollama_error"] = str(e)
         return stub
 
 
-def predict(video_path: Path, metadata_flags: list[str], face_region_scores: list[dict], frame_images_b64: list[str] | None = None) -> Dict:
+def predict(video_path: Path, metadata_flags: list[str], face_region_scores: list[dict], frame_images_b64: list[str] | None = None,
+            media: MediaInfo | None = None, frame_labels: list[str] | None = None, sha256: str | None = None,
+            privacy_mode: bool = False) -> Dict:
     if config.ML_PROVIDER == "ollama":
         try:
-            return ollama_predict(video_path, metadata_flags, face_region_scores, frame_images_b64)
+            return ollama_predict(video_path, metadata_flags, face_region_scores, frame_images_b64, media, frame_labels,
+                                  sha256, privacy_mode)
         except Exception as e:
             # Fallback to stub with error message
-            stub_result = stub_predict(video_path, metadata_flags, face_region_scores)
+            stub_result = stub_predict(video_path, metadata_flags, face_region_scores, sha256)
             stub_result["raw_response"]["ollama_attempted"] = True
             stub_result["raw_response"]["ollama_error"] = str(e)
             stub_result["raw_response"]["note"] = f"Ollama was requested but failed: {str(e)}. Showing stub analysis instead. Ensure Ollama is running: 'ollama serve' and model is pulled: 'ollama pull {config.OLLAMA_MODEL}'"
             return stub_result
     
-    return stub_predict(video_path, metadata_flags, face_region_scores)
+    return stub_predict(video_path, metadata_flags, face_region_scores, sha256)
+
+
+def predict_many(items: Iterable[Dict]) -> list[Dict]:
+    """
+    Stub predictions for many videos against one version of the rules. Each item holds
+    `video_path`, `metadata_flags`, `face_region_scores` and optionally `sha256`.
+    """
+    rules = rules_mod.get_rules()
+    return [
+        stub_predict(it["video_path"], it.get("metadata_flags") or [], it.get("face_region_scores") or [],
+                     it.get("sha256"), rules)
+        for it in items
+    ]
 
 
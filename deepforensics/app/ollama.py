@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import config, utils
+
+
+class OllamaError(RuntimeError):
+    pass
+
+
+class OllamaBusy(OllamaError):
+    pass
+
+
+def ensure_local_host(url: str) -> None:
+    if not (url.startswith("http://127.0.0.1") or url.startswith("http://localhost")):
+        raise RuntimeError("Refusing non-local Ollama host. Set DF_OLLAMA_HOST to 127.0.0.1 only.")
+
+
+class OllamaClient:
+    """
+    Shared client for the local Ollama server:
+
+    - one keep-alive `requests.Session` instead of a new connection per call
+    - at most `max_inflight` generations at once; callers wait up to `timeout` for a slot
+    - the model is preloaded and kept resident with `keep_alive`
+    - responses are cached on disk by model + prompt + image hashes, and identical
+      concurrent requests share one generation
+    """
+
+    def __init__(self, host: str = config.OLLAMA_HOST, model: str = config.OLLAMA_MODEL,
+                 timeout: float = config.OLLAMA_TIMEOUT, max_inflight: int = config.OLLAMA_MAX_INFLIGHT,
+                 keep_alive: str = config.OLLAMA_KEEP_ALIVE, cache_dir: Optional[Path] = None):
+        ensure_local_host(host)
+        self.host = host.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self._cache_dir = cache_dir
+        self._slots = threading.BoundedSemaphore(max(1, max_inflight))
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, max_inflight))
+        self._session.mount("http://", adapter)
+        self._inflight: Dict[str, threading.Event] = {}
+        self._inflight_lock = threading.Lock()
+
+    @property
+    def cache_dir(self) -> Path:
+        return self._cache_dir or config.CACHE_DIR / "ollama"
+
+    def close(self) -> None:
+        self._session.close()
+
+    def preload(self) -> bool:
+        """Load the model and keep it resident; an empty generate request does only that."""
+        try:
+            r = self._session.post(f"{self.host}/api/generate", json={"model": self.model, "keep_alive": self.keep_alive},
+                                   timeout=max(self.timeout, 120))
+            r.raise_for_status()
+            return True
+        except requests.RequestException:
+            return False
+
+    def preload_async(self) -> threading.Thread:
+        t = threading.Thread(target=self.preload, name="df-ollama-preload", daemon=True)
+        t.start()
+        return t
+
+    def cache_key(self, prompt: str, images: List[str]) -> str:
+        h = hashlib.sha256()
+        h.update(json.dumps({"model": self.model, "prompt": prompt}, sort_keys=True).encode("utf-8"))
+        for b in images:
+            h.update(hashlib.sha256(b.encode("ascii")).digest())
+        return h.hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        try:
+            with open(self.cache_dir / f"{key}.json", "r", encoding="utf-8") as f:
+                return json.load(f)["text"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _cache_put(self, key: str, text: str) -> None:
+        utils.safe_mkdir(self.cache_dir)
+        path = self.cache_dir / f"{key}.json"
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"model": self.model, "text": text}, f)
+            os.replace(tmp, path)
+        except OSError:
+            utils.cleanup_path(tmp)
+
+    def _generate(self, prompt: str, images: List[str]) -> str:
+        message: Dict = {"role": "user", "content": prompt}
+        if images:
+            message["images"] = images
+        body = {"model": self.model, "messages": [message], "stream": False, "format": "json", "keep_alive": self.keep_alive}
+        if not self._slots.acquire(timeout=self.timeout):
+            raise OllamaBusy(f"No Ollama slot free within {self.timeout}s")
+        try:
+            r = self._session.post(f"{self.host}/api/chat", json=body, timeout=self.timeout)
+            r.raise_for_status()
+            return r.json().get("message", {}).get("content", "{}")
+        finally:
+            self._slots.release()
+
+    def chat(self, prompt: str, images: Optional[List[str]] = None, persist: bool = True) -> Dict:
+        """
+        Run one generation (or serve it from cache); returns `{"text", "cached"}`.
+        With `persist=False` a new answer is not written to the disk cache.
+        """
+        images = list(images or [])
+        if not config.OLLAMA_CACHE_ENABLED:
+            return {"text": self._generate(prompt, images), "cached": False}
+        key = self.cache_key(prompt, images)
+        while True:
+            text = self._cache_get(key)
+            if text is not None:
+                return {"text": text, "cached": True}
+            with self._inflight_lock:
+                event = self._inflight.get(key)
+                leader = event is None
+                if leader:
+                    event = self._inflight[key] = threading.Event()
+            if leader:
+                break
+            # Same request already running: wait for its cached result (or take over if it failed)
+            event.wait(self.timeout)
+        try:
+            text = self._generate(prompt, images)
+            if persist:
+                self._cache_put(key, text)
+            return {"text": text, "cached": False}
+        finally:
+            with self._inflight_lock:
+                if self._inflight.get(key) is event:
+                    del self._inflight[key]
+            event.set()
+
+
+_client: Optional[OllamaClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> OllamaClient:
+    global _client
+    with _client_lock:
+        if _client is None or _client.host != config.OLLAMA_HOST.rstrip("/") or _client.model != config.OLLAMA_MODEL:
+            if _client is not None:
+                _client.close()
+            _client = OllamaClient(config.OLLAMA_HOST, config.OLLAMA_MODEL, config.OLLAMA_TIMEOUT,
+                                   config.OLLAMA_MAX_INFLIGHT, config.OLLAMA_KEEP_ALIVE)
+        return _client
+
+
+def shutdown_client() -> None:
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
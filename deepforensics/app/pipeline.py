@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from . import blobs as blobs_mod, cache as cache_mod, config, devices as devices_mod, ingest, media as media_mod, metadata as metadata_mod, ml as ml_mod, prnu as prnu_mod, ensemble as ensemble_mod, reports as reports_mod, thumbnails as thumbnails_mod, utils
+
+
+ProgressCallback = Callable[[str, float], None]
+
+
+class AnalysisError(Exception):
+    """Pipeline failure carrying the HTTP status the API should answer with."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def save_report(report: Dict) -> Optional[Path]:
+    """Index the report in the report store and, with `REPORT_FILES`, write it as JSON as before."""
+    reports_mod.get_store().put(report)
+    if not config.REPORT_FILES:
+        return None
+    utils.safe_mkdir(config.REPORTS_DIR)
+    report_path = config.REPORTS_DIR / f"{report['task_id']}.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, separators=(",", ":"))
+    return report_path
+
+
+def heatmap_url(task_id: str, frame_index: int) -> str:
+    return f"/report/{task_id}/heatmap/{frame_index}"
+
+
+def _heatmap_images(heatmap_frames: List[Dict], task_id: str) -> Optional[List[str]]:
+    images = [h.get("image") or heatmap_url(task_id, h["frame_index"]) for h in heatmap_frames
+              if h.get("image") or h.get("data")]
+    return images or None
+
+
+def run_identify(in_path: Path, upload_sha256: str, tmpdir: Path, top_k: int = config.IDENTIFY_TOP_K) -> Dict:
+    """Estimate the clip fingerprint and rank enrolled devices against it (no full analysis)."""
+    try:
+        media = media_mod.probe_media(in_path, sha256=upload_sha256)
+        frames, _ = ingest.extract_frames(in_path, tmpdir / "frames", media=media)
+        clip_prnu, _ = prnu_mod.process_frames_for_prnu(frames)
+    except Exception as e:
+        raise AnalysisError(400, f"PRNU estimation failed: {e}")
+    index = devices_mod.get_index()
+    return {"sha256": upload_sha256, "devices": len(index), "candidates": index.identify(clip_prnu, top_k)}
+
+
+def run_analysis(in_path: Path, filename: str, upload_size: int, upload_sha256: str, privacy_mode: bool,
+                 device_id: Optional[str], tmpdir: Path, task_id: Optional[str] = None,
+                 progress: Optional[ProgressCallback] = None, identify: bool = False) -> Dict:
+    """
+    Run ingest -> PRNU -> faces -> metadata -> ML -> ensemble for an uploaded file and save the report.
+    With `identify`, the clip fingerprint is also ranked against every enrolled device.
+    Blocking; callers on the event loop must run it in a worker thread.
+    `progress(stage, fraction)` is called as each stage starts.
+    Wall time per stage is reported under `timings` (seconds).
+    """
+    timings: Dict[str, float] = {}
+    current = [None, time.perf_counter()]
+
+    def _progress(stage: Optional[str], fraction: float = 1.0) -> None:
+        now = time.perf_counter()
+        if current[0] is not None:
+            timings[current[0]] = round(timings.get(current[0], 0.0) + now - current[1], 4)
+        current[0], current[1] = stage, now
+        if progress is not None and stage is not None:
+            progress(stage, fraction)
+
+    started_at = datetime.utcnow().isoformat() + "Z"
+    task_id = task_id or utils.make_task_id()
+    evidence_dir = utils.safe_mkdir(config.EVIDENCE_DIR / task_id)
+    try:
+        # Identical content analysed with the same settings: serve the stored result
+        result_cache = cache_mod.get_cache()
+        cache_key = cache_mod.make_key(upload_sha256, device_id, privacy_mode, identify)
+        _progress("cache", 0.05)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            report = {"task_id": task_id, **cached}
+            report["source"] = {**cached.get("source", {}), "filename": filename}
+            report["cache"] = {"hit": True}
+            prnu_out = report.get("prnu") or {}
+            if prnu_out.get("heatmap_frames") and not privacy_mode:
+                # Renderer URLs are per task; the stored heatmap data is shared
+                prnu_out["heatmap_images"] = _heatmap_images(prnu_out["heatmap_frames"], task_id)
+                prnu_out["heatmap_image"] = (prnu_out["heatmap_images"] or [None])[0]
+            report["timestamps"] = {"started_at": started_at, "finished_at": datetime.utcnow().isoformat() + "Z"}
+            _progress(None)
+            report["timings"] = timings
+            save_report(report)
+            return report
+
+        # Ingest frames
+        _progress("ingest", 0.1)
+        frames_dir = tmpdir / "frames"
+        try:
+            media = media_mod.probe_media(in_path, sha256=upload_sha256, privacy_mode=privacy_mode)
+            frames, ingest_info = ingest.extract_frames(in_path, frames_dir, media=media)
+        except Exception as ie:
+            raise AnalysisError(400, f"Frame sampling failed: {ie}")
+
+        # PRNU
+        _progress("prnu", 0.25)
+        try:
+            # Region scores and the temporal signal need every frame's residual: keep the stack
+            clip_prnu, residuals = prnu_mod.process_frames_for_prnu(frames, keep_residuals=True)
+        except Exception as pe:
+            raise AnalysisError(500, f"PRNU processing failed: {pe}")
+        _progress("faces", 0.5)
+        face_scores, heatmaps, dense_regions = prnu_mod.region_scores_and_heatmaps(frames, residuals, evidence_dir)
+        # Noise-pattern continuity across frames: one product over the residuals already in memory
+        _progress("temporal", 0.6)
+        temporal = prnu_mod.temporal_consistency(residuals)
+
+        # Metadata
+        _progress("metadata", 0.65)
+        try:
+            meta_details, meta_flags, meta_score = metadata_mod.analyze(in_path, media)
+        except Exception as me:
+            raise AnalysisError(500, f"Metadata analysis failed: {me}")
+
+        # ML provider (stub by default, optional Ollama if enabled)
+        _progress("ml", 0.75)
+        face_scores_json = [
+            {"frame_index": s.frame_index, "bbox": list(s.bbox), "score": s.score} for s in face_scores
+        ]
+        frame_b64 = frame_labels = None
+        if config.ML_PROVIDER == "ollama" and config.OLLAMA_ENABLE_VISION:
+            try:
+                thumbs = thumbnails_mod.build_thumbnails(frames, face_scores_json,
+                                                         source_frames=ingest_info.get("source_frames"))
+                frame_b64, frame_labels = [t.b64 for t in thumbs], [t.label for t in thumbs]
+            except Exception:
+                frame_b64 = frame_labels = None
+        ml_out = ml_mod.predict(in_path, meta_flags, face_scores_json, frame_b64, media, frame_labels, upload_sha256,
+                                privacy_mode=privacy_mode)
+
+        # PRNU similarity: if device enrolled, compare to fingerprint; else use proxy from faces
+        prnu_similarity = 0.0
+        prnu_reference_used = False
+        prnu_match = None
+        if device_id:
+            index = devices_mod.get_index()
+            ref, ref_key = index.reference(device_id)
+            if ref is not None:
+                try:
+                    prnu_similarity, prnu_match = prnu_mod.match_similarity(clip_prnu, ref, ref_key)
+                    prnu_reference_used = True
+                except Exception:
+                    prnu_reference_used = False
+        if not prnu_reference_used:
+            if face_scores:
+                prnu_similarity = 1.0 - max(s.score for s in face_scores)
+                prnu_similarity = float(np.clip(prnu_similarity, 0.0, 1.0))
+
+        identification = devices_mod.get_index().identify(clip_prnu) if identify else None
+
+        _progress("ensemble", 0.9)
+        ens = ensemble_mod.score_and_decide(ml_out["score"], prnu_similarity, meta_score,
+                                            temporal.score if temporal is not None else None)
+
+        # Serialize outputs
+        _progress("report", 0.95)
+        # Save a representative residual image
+        residual_paths: List[str] = []
+        if len(residuals):
+            rep = (residuals[0] - residuals[0].min())
+            if rep.max() > 0:
+                rep = rep / rep.max()
+            rep_img = (rep * 255).astype("uint8")
+            rep_path = evidence_dir / "residual_sample.png"
+            cv2.imwrite(str(rep_path), rep_img)
+            residual_paths.append(str(rep_path))
+
+        # Reference frames: in-memory frames are only written out when evidence is kept
+        frame_paths: List[str] = []
+        for i, fr in enumerate(frames[:3]):
+            if not isinstance(fr, np.ndarray):
+                frame_paths.append(fr.as_posix())
+            elif not privacy_mode:
+                fp = evidence_dir / f"frame_{i:03d}.png"
+                cv2.imwrite(str(fp), fr)
+                frame_paths.append(fp.as_posix())
+
+        # Heatmaps: stored as compact data and rendered on demand via the API;
+        # in privacy mode the evidence is deleted, so the top frames are rendered into the blob store
+        heatmap_frames: List[Dict] = []
+        for hm in heatmaps:
+            entry = {"frame_index": hm.frame_index, "score": hm.score, "faces": hm.faces}
+            if privacy_mode:
+                ok, png = cv2.imencode(".png", prnu_mod.render_heatmap(hm.path))
+                if ok:
+                    entry["blob"] = blobs_mod.get_store().put(png.tobytes(), ".png")
+                    entry["image"] = blobs_mod.blob_url(entry["blob"])
+            else:
+                entry["data"] = hm.path.as_posix()
+            heatmap_frames.append(entry)
+        heatmap_list = _heatmap_images(heatmap_frames, task_id)
+
+        report: Dict = {
+            "task_id": task_id,
+            "source": {
+                "filename": filename,
+                "filesize": upload_size,
+                "sha256": upload_sha256,
+                "duration_sec": ingest_info.get("duration_sec", 0.0),
+            },
+            "ml": ml_out,
+            "metadata": {"flags": meta_flags, "details": meta_details},
+            "prnu": {
+                "clip_score": float(np.mean(np.abs(clip_prnu))),
+                "similarity": prnu_similarity,
+                "reference_used": prnu_reference_used,
+                "match": prnu_match,
+                "identification": identification,
+                "face_region_scores": face_scores_json,
+                "dense_region_scores": [
+                    {"frame_index": s.frame_index, "bbox": list(s.bbox), "score": s.score} for s in dense_regions
+                ],
+                "heatmap_image": heatmap_list[0] if heatmap_list else None,
+                "heatmap_images": heatmap_list,
+                "heatmap_frames": heatmap_frames,
+                "residual_images": residual_paths,
+            },
+            "temporal": temporal.to_dict() if temporal is not None else None,
+            "ensemble": {
+                **ens,
+                "explanation": "local_stub+PRNU proxy+metadata rules",
+            },
+            "evidence": {
+                "frames": frame_paths,
+                "residuals": residual_paths,
+            },
+            "cache": {"hit": False},
+            "timestamps": {"started_at": started_at, "finished_at": datetime.utcnow().isoformat() + "Z"},
+            "timings": timings,
+        }
+        _progress(None)
+
+        save_report(report)
+        result_cache.put(cache_key, report, privacy_mode)
+
+        return report
+    except AnalysisError:
+        raise
+    except Exception as e:
+        raise AnalysisError(500, f"Analysis failed: {e}")
+    finally:
+        # Privacy cleanup
+        if privacy_mode:
+            utils.cleanup_path(evidence_dir)
+            utils.cleanup_path(tmpdir)
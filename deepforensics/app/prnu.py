@@ -1,9 +1,16 @@
 from __future__ import annotations
 
 import concurrent.futures as futures
+import itertools
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import cv2
 import numpy as np
@@ -30,10 +37,8 @@ def _wavelet_denoise(gray: np.ndarray) -> np.ndarray:
 
 def extract_residual(bgr: np.ndarray) -> np.ndarray:
     gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY).astype(np.float32)
-    den = _wavelet_denoise(gray)
-    # Ensure same size due to possible wavelet reconstruction size drift
-    if den.shape != gray.shape:
-        den = cv2.resize(den, (gray.shape[1], gray.shape[0]), interpolation=cv2.INTER_CUBIC)
+    # Odd sizes reconstruct one sample larger; the extra border sample is dropped, not resampled
+    den = _wavelet_denoise(gray)[:gray.shape[0], :gray.shape[1]]
     resid = gray - den
     resid -= resid.mean()
     std = resid.std() + 1e-6
@@ -41,19 +46,184 @@ def extract_residual(bgr: np.ndarray) -> np.ndarray:
     return resid
 
 
+def _soft_threshold(c: np.ndarray, thr: np.ndarray) -> np.ndarray:
+    mag = np.abs(c)
+    mag -= thr
+    np.maximum(mag, 0.0, out=mag)
+    return np.copysign(mag, c, out=mag)
+
+
+def _dwt2_t(x: np.ndarray, wavelet: str):
+    """
+    One 2D DWT level over the trailing axes of a stack using only contiguous
+    last-axis passes (pywt is much slower along a strided axis). Outputs come
+    back with the two trailing axes swapped.
+    """
+    lo, hi = pywt.dwt(x, wavelet, axis=-1)
+    lo = np.ascontiguousarray(lo.swapaxes(-1, -2))
+    hi = np.ascontiguousarray(hi.swapaxes(-1, -2))
+    ll, lh = pywt.dwt(lo, wavelet, axis=-1)
+    hl, hh = pywt.dwt(hi, wavelet, axis=-1)
+    return ll, (lh, hl, hh)
+
+
+def _idwt2_t(ll: np.ndarray, details, wavelet: str, shape: Tuple[int, int]) -> np.ndarray:
+    """Inverse of `_dwt2_t`; `shape` is the trailing shape of the level's input."""
+    lh, hl, hh = details
+    lo = pywt.idwt(ll, lh, wavelet, axis=-1)[..., :shape[0]]
+    hi = pywt.idwt(hl, hh, wavelet, axis=-1)[..., :shape[0]]
+    lo = np.ascontiguousarray(lo.swapaxes(-1, -2))
+    hi = np.ascontiguousarray(hi.swapaxes(-1, -2))
+    return pywt.idwt(lo, hi, wavelet, axis=-1)[..., :shape[1]]
+
+
+def _wavelet_denoise_batch(gray: np.ndarray, n_pixels: int, level: int = 2) -> np.ndarray:
+    """Denoise an (N, H, W) float32 stack in one decomposition along the trailing axes."""
+    n = gray.shape[0]
+    k = np.float32(np.sqrt(2 * np.log(n_pixels)))
+    shapes = []
+    details = []
+    approx = gray
+    for _ in range(level):
+        shapes.append(approx.shape[-2:])
+        approx, (cH, cV, cD) = _dwt2_t(approx, "db2")
+        # Per-frame noise estimate from the diagonal subband, broadcast over (H, W)
+        sigma = np.median(np.abs(cD).reshape(n, -1), axis=1) / np.float32(0.6745) + np.float32(1e-6)
+        thr = (sigma * k).astype(np.float32)[:, None, None]
+        details.append((_soft_threshold(cH, thr), _soft_threshold(cV, thr), _soft_threshold(cD, thr)))
+    for shape, det in zip(reversed(shapes), reversed(details)):
+        approx = _idwt2_t(approx, det, "db2", shape)
+    return np.clip(approx, 0, 255, out=approx)
+
+
+def extract_residuals_batch(bgr: np.ndarray, level: int = 2) -> np.ndarray:
+    """
+    Batched `extract_residual` for an (N, H, W, 3) uint8 stack; returns (N, H, W) float32.
+    Each level is reconstructed to exactly its input size, so borders (odd sizes included)
+    are handled as in the per-frame path.
+    """
+    n, h, w = bgr.shape[:3]
+    gray = cv2.cvtColor(np.ascontiguousarray(bgr).reshape(n * h, w, 3), cv2.COLOR_BGR2GRAY)
+    gray = gray.reshape(n, h, w).astype(np.float32)
+    den = _wavelet_denoise_batch(gray, h * w, level)
+    resid = gray - den
+    resid -= resid.mean(axis=(1, 2), keepdims=True)
+    resid /= resid.std(axis=(1, 2), keepdims=True) + 1e-6
+    return resid
+
+
 def _residual_from_path(path: Path) -> np.ndarray:
     img = ingest.load_frame(path)
     return extract_residual(img)
 
 
-def aggregate_residuals(residuals: List[np.ndarray]) -> np.ndarray:
-    # Median aggregation
-    stack = np.stack(residuals, axis=0)
-    med = np.median(stack, axis=0)
-    med -= med.mean()
-    std = med.std() + 1e-6
-    med /= std
-    return med.astype(np.float32)
+def _normalize(fp: np.ndarray) -> np.ndarray:
+    fp = fp - fp.mean()
+    fp /= fp.std() + 1e-6
+    return fp.astype(np.float32)
+
+
+def aggregate_residuals(residuals: Union[np.ndarray, List[np.ndarray]]) -> np.ndarray:
+    # Median aggregation; an (N, H, W) stack is used as-is without another copy
+    stack = residuals if isinstance(residuals, np.ndarray) else np.stack(residuals, axis=0)
+    return _normalize(np.median(stack, axis=0))
+
+
+class PRNUAccumulator:
+    """
+    Streaming maximum-likelihood PRNU estimate K = sum(W*I) / sum(I^2) over residuals W
+    and frame intensities I (in [0, 1]; 1 when unknown). State is two H x W float64
+    sums, so any number of frames can be folded in with constant memory.
+    Residuals of a different size are resized to the first one seen.
+    """
+
+    def __init__(self):
+        self.num: Optional[np.ndarray] = None
+        self.den: Optional[np.ndarray] = None
+        self.count = 0
+
+    @property
+    def shape(self) -> Optional[Tuple[int, int]]:
+        return None if self.num is None else self.num.shape
+
+    def _fit(self, a: np.ndarray) -> np.ndarray:
+        if self.num is not None and a.shape != self.num.shape:
+            a = cv2.resize(a.astype(np.float32), (self.num.shape[1], self.num.shape[0]), interpolation=cv2.INTER_AREA)
+        return a.astype(np.float64, copy=False)
+
+    def update(self, resid: np.ndarray, intensity: Optional[np.ndarray] = None) -> "PRNUAccumulator":
+        w = self._fit(resid)
+        if self.num is None:
+            self.num = np.zeros(w.shape, dtype=np.float64)
+            self.den = np.zeros(w.shape, dtype=np.float64)
+        if intensity is None:
+            self.num += w
+            self.den += 1.0
+        else:
+            i = self._fit(intensity)
+            self.num += w * i
+            self.den += i * i
+        self.count += 1
+        return self
+
+    def update_many(self, residuals, intensities=None) -> "PRNUAccumulator":
+        if intensities is None:
+            for r in residuals:
+                self.update(r)
+        else:
+            for r, i in zip(residuals, intensities):
+                self.update(r, i)
+        return self
+
+    def merge(self, other: "PRNUAccumulator") -> "PRNUAccumulator":
+        """Fold in another accumulator's sums (e.g. one video's worth of frames)."""
+        if other.num is None:
+            return self
+        if self.num is None:
+            self.num, self.den = other.num.copy(), other.den.copy()
+        else:
+            self.num += self._fit(other.num)
+            self.den += self._fit(other.den)
+        self.count += other.count
+        return self
+
+    def finalize(self) -> np.ndarray:
+        """Zero-mean, unit-variance float32 fingerprint (same scale as aggregate_residuals)."""
+        if self.num is None:
+            raise ValueError("No residuals accumulated")
+        return _normalize(self.num / (self.den + 1e-6))
+
+    def state(self) -> Dict[str, np.ndarray]:
+        if self.num is None:
+            return {"count": np.array(0)}
+        return {"num": self.num, "den": self.den, "count": np.array(self.count)}
+
+    @classmethod
+    def from_state(cls, state) -> "PRNUAccumulator":
+        acc = cls()
+        if "num" in state:
+            acc.num = np.array(state["num"], dtype=np.float64)
+            acc.den = np.array(state["den"], dtype=np.float64)
+        acc.count = int(state["count"])
+        return acc
+
+
+def frame_intensity(frame: Union[np.ndarray, Path]) -> np.ndarray:
+    """Grayscale intensity of one frame in [0, 1]."""
+    return cv2.cvtColor(ingest.as_bgr(frame), cv2.COLOR_BGR2GRAY).astype(np.float32) / 255.0
+
+
+def frame_intensities(frames: Union[np.ndarray, List[Path]]):
+    """Per-frame grayscale intensity in [0, 1], one frame at a time."""
+    for f in frames:
+        yield frame_intensity(f)
+
+
+def estimate_fingerprint(frames: Union[np.ndarray, List[Path]], residuals: Union[np.ndarray, List[np.ndarray]],
+                         method: str = config.PRNU_AGGREGATE) -> np.ndarray:
+    if method == "median":
+        return aggregate_residuals(residuals)
+    return PRNUAccumulator().update_many(residuals, frame_intensities(frames)).finalize()
 
 
 @dataclass
@@ -63,77 +233,656 @@ class FaceRegionScore:
     score: float
 
 
-def _detect_faces(gray: np.ndarray) -> List[Tuple[int, int, int, int]]:
-    cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-    face_cascade = cv2.CascadeClassifier(cascade_path)
-    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+_cascade_local = threading.local()
+
+
+def _face_cascade() -> "cv2.CascadeClassifier":
+    # Loaded once per process (and per thread: a classifier must not be shared across threads)
+    cascade = getattr(_cascade_local, "cascade", None)
+    if cascade is None:
+        cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        cascade = cv2.CascadeClassifier(cascade_path)
+        _cascade_local.cascade = cascade
+    return cascade
+
+
+def _detect_faces(gray: np.ndarray, min_size: int = 30) -> List[Tuple[int, int, int, int]]:
+    faces = _face_cascade().detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_size, min_size))
     return [(int(x), int(y), int(w), int(h)) for (x, y, w, h) in faces]
 
 
-def create_heatmap_overlay(frame_bgr: np.ndarray, face_resid: np.ndarray, bg_resid: np.ndarray, bbox: Tuple[int, int, int, int]) -> np.ndarray:
-    # Build a heat layer the same size as frame, fill with zeros, then place ROI heatmap
-    h, w = frame_bgr.shape[:2]
-    x, y, bw, bh = bbox
+def _detect_faces_scaled(task) -> List[Tuple[int, int, int, int]]:
+    """Worker: detect on a downscaled gray frame and map boxes back to full resolution."""
+    small, scale = task
+    min_size = max(12, int(round(30 * scale)))
+    return [
+        (int(round(x / scale)), int(round(y / scale)), int(round(w / scale)), int(round(h / scale)))
+        for (x, y, w, h) in _detect_faces(small, min_size)
+    ]
+
+
+def _track_boxes(prev_gray: np.ndarray, gray: np.ndarray, boxes: List[Tuple[int, int, int, int]],
+                 margin: float = 0.25, min_score: float = 0.5) -> List[Tuple[int, int, int, int]]:
+    """
+    Move each box to its best template match in a window around its previous position.
+    Boxes that match below `min_score` (scene cut, fast motion) or cannot be matched at all
+    are dropped rather than left where they were.
+    """
+    H, W = gray.shape[:2]
+    out: List[Tuple[int, int, int, int]] = []
+    for (x, y, w, h) in boxes:
+        x, y = max(0, min(x, W - 1)), max(0, min(y, H - 1))
+        w, h = min(w, W - x), min(h, H - y)
+        if w < 4 or h < 4:
+            continue
+        templ = prev_gray[y:y + h, x:x + w]
+        mx, my = int(w * margin) + 1, int(h * margin) + 1
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        x1, y1 = min(W, x + w + mx), min(H, y + h + my)
+        window = gray[y0:y1, x0:x1]
+        if window.shape[0] < h or window.shape[1] < w or templ.std() < 1e-3:
+            continue
+        res = cv2.matchTemplate(window, templ, cv2.TM_CCOEFF_NORMED)
+        _, best, _, loc = cv2.minMaxLoc(res)
+        if best >= min_score:
+            out.append((x0 + loc[0], y0 + loc[1], w, h))
+    return out
+
+
+def _detect_task(gray: np.ndarray, detect_width: int):
+    scale = 1.0
+    if detect_width and gray.shape[1] > detect_width:
+        scale = detect_width / float(gray.shape[1])
+        gray = cv2.resize(gray, (detect_width, max(1, int(round(gray.shape[0] * scale)))), interpolation=cv2.INTER_AREA)
+    return gray, scale
+
+
+def detect_faces_tracked(grays: List[np.ndarray], every: int = config.FACE_DETECT_EVERY,
+                         detect_width: int = config.FACE_DETECT_WIDTH,
+                         parallel: bool = True) -> List[List[Tuple[int, int, int, int]]]:
+    """
+    Face boxes for every frame. Haar detection runs only on every `every`-th frame,
+    downscaled to `detect_width` (0 keeps full size), in parallel on the shared pool;
+    boxes are propagated to the frames in between by template-matching refinement.
+    A frame where a box loses its track is detected again instead.
+    """
+    n = len(grays)
+    if n == 0:
+        return []
+    every = max(1, every)
+    keys = list(range(0, n, every))
+    tasks = [_detect_task(grays[i], detect_width) for i in keys]
+    if parallel and len(tasks) > 1:
+        detected = _pool_map(_detect_faces_scaled, tasks)
+    else:
+        detected = [_detect_faces_scaled(t) for t in tasks]
+
+    boxes: List[List[Tuple[int, int, int, int]]] = [[] for _ in range(n)]
+    for i, found in zip(keys, detected):
+        boxes[i] = found
+        for j in range(i + 1, min(i + every, n)):
+            tracked = _track_boxes(grays[j - 1], grays[j], boxes[j - 1])
+            if len(tracked) < len(boxes[j - 1]):
+                tracked = _detect_faces_scaled(_detect_task(grays[j], detect_width))
+            boxes[j] = tracked
+    return boxes
+
+
+def heatmap_roi(face_resid: np.ndarray, bg_resid: np.ndarray) -> np.ndarray:
+    """Normalised |face - background| residual difference as a uint8 intensity patch."""
     diff = np.abs(face_resid - bg_resid)
     diff = cv2.GaussianBlur(diff, (0, 0), 3)
     diff = diff - diff.min()
     if diff.max() > 0:
         diff = diff / diff.max()
-    heat_roi = (diff * 255).astype(np.uint8)
-    heat_color_roi = cv2.applyColorMap(heat_roi, cv2.COLORMAP_JET)
-
-    heat_full = np.zeros_like(frame_bgr)
-    # Clip bbox to frame bounds for safety
-    x2, y2 = min(x + bw, w), min(y + bh, h)
-    bw = max(0, x2 - x)
-    bh = max(0, y2 - y)
-    if bw > 0 and bh > 0 and heat_color_roi.shape[0] == bh and heat_color_roi.shape[1] == bw:
-        heat_full[y:y+bh, x:x+bw] = heat_color_roi
-
-    overlay = cv2.addWeighted(frame_bgr, 0.6, heat_full, 0.4, 0)
+    return (diff * 255).astype(np.uint8)
+
+
+def composite_heatmap(frame_bgr: np.ndarray, rois: List[Tuple[Tuple[int, int, int, int], np.ndarray]]) -> np.ndarray:
+    """Blend every (bbox, heat patch) of a frame onto it in one pass."""
+    h, w = frame_bgr.shape[:2]
+    # Outside the boxes the heat layer is zero, i.e. the frame is just dimmed
+    overlay = cv2.convertScaleAbs(frame_bgr, alpha=0.6)
+    for (x, y, bw, bh), heat in rois:
+        # Clip bbox to frame bounds for safety
+        x2, y2 = min(x + bw, w), min(y + bh, h)
+        bw = max(0, x2 - x)
+        bh = max(0, y2 - y)
+        if bw > 0 and bh > 0 and heat.shape[0] == bh and heat.shape[1] == bw:
+            color = cv2.applyColorMap(heat, cv2.COLORMAP_JET)
+            overlay[y:y+bh, x:x+bw] = cv2.addWeighted(frame_bgr[y:y+bh, x:x+bw], 0.6, color, 0.4, 0)
     return overlay
 
 
-def process_frames_for_prnu(frames: List[Path]) -> Tuple[np.ndarray, List[np.ndarray]]:
-    residuals: List[np.ndarray] = []
-    with futures.ProcessPoolExecutor(max_workers=config.MAX_WORKERS) as ex:
-        for resid in ex.map(_residual_from_path, frames):
-            residuals.append(resid)
-    clip_prnu = aggregate_residuals(residuals)
+def create_heatmap_overlay(frame_bgr: np.ndarray, face_resid: np.ndarray, bg_resid: np.ndarray, bbox: Tuple[int, int, int, int]) -> np.ndarray:
+    return composite_heatmap(frame_bgr, [(bbox, heatmap_roi(face_resid, bg_resid))])
+
+
+@dataclass
+class HeatmapData:
+    frame_index: int
+    score: float
+    faces: int
+    path: Path
+
+
+def save_heatmap_data(path: Path, frame_bgr: np.ndarray, rois: List[Tuple[Tuple[int, int, int, int], np.ndarray]],
+                      scores: List[float]) -> Path:
+    """Store a frame's heat patches compactly (JPEG frame + uint8 patches); rendered on demand."""
+    ok, jpg = cv2.imencode(".jpg", frame_bgr, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise RuntimeError("Failed to encode heatmap frame")
+    arrays = {
+        "frame": jpg.ravel(),
+        "boxes": np.array([r[0] for r in rois], dtype=np.int32).reshape(-1, 4),
+        "scores": np.asarray(scores, dtype=np.float32),
+    }
+    for i, (_, heat) in enumerate(rois):
+        arrays[f"roi_{i}"] = heat
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+    return path
+
+
+def render_heatmap(path: Path) -> np.ndarray:
+    with np.load(path) as data:
+        frame = cv2.imdecode(data["frame"], cv2.IMREAD_COLOR)
+        rois = [(tuple(int(v) for v in box), data[f"roi_{i}"]) for i, box in enumerate(data["boxes"])]
+    return composite_heatmap(frame, rois)
+
+
+def render_heatmap_png(path: Path) -> Path:
+    """PNG for a stored heatmap, rendered once and reused while newer than its data."""
+    out = path.with_suffix(".png")
+    try:
+        if out.stat().st_mtime_ns >= path.stat().st_mtime_ns:
+            return out
+    except OSError:
+        pass
+    tmp = out.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp.png")
+    if not cv2.imwrite(str(tmp), render_heatmap(path)):
+        raise RuntimeError("Failed to write heatmap image")
+    os.replace(tmp, out)
+    return out
+
+
+_pool: Optional[futures.ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _warmup(_: int) -> bool:
+    # Pulls cv2/numpy/pywt into the worker and runs one tiny extraction
+    extract_residual(np.zeros((32, 32, 3), dtype=np.uint8))
+    return True
+
+
+def start_pool(workers: int = config.MAX_WORKERS) -> futures.ProcessPoolExecutor:
+    """Create the app-lifetime PRNU worker pool and warm every worker."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if os.name == "posix":
+                # Workers must inherit the parent's resource tracker; otherwise each starts its
+                # own, which treats the shared blocks it attached to as leaks and unlinks them
+                resource_tracker.ensure_running()
+            pool = futures.ProcessPoolExecutor(max_workers=workers)
+            list(pool.map(_warmup, range(workers)))
+            _pool = pool
+        return _pool
+
+
+def get_pool() -> futures.ProcessPoolExecutor:
+    return _pool if _pool is not None else start_pool()
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def _reset_broken_pool(broken: futures.ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _bounded_map(pool: futures.Executor, fn, items, window: int) -> List:
+    """
+    Ordered map that keeps at most `window` tasks of this call in flight.
+    Concurrent requests therefore interleave in the shared pool's FIFO queue
+    instead of one request's whole batch running ahead of everyone else.
+    """
+    items = list(items)
+    results: List = [None] * len(items)
+    pending: Dict[futures.Future, int] = {}
+    it = iter(range(len(items)))
+    for i in itertools.islice(it, max(1, window)):
+        pending[pool.submit(fn, items[i])] = i
+    while pending:
+        done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+        for fut in done:
+            results[pending.pop(fut)] = fut.result()
+            nxt = next(it, None)
+            if nxt is not None:
+                pending[pool.submit(fn, items[nxt])] = nxt
+    return results
+
+
+def _residuals_into_shm(task) -> int:
+    """
+    Worker: compute residuals for `count` frames and write them into rows
+    [dest, dest + count) of the shared float32 residual block. Frames come either from
+    rows [src, src + count) of a shared uint8 frame block or from image files.
+    """
+    kind, ref, resid_name, shape, dest, count = task
+    resid_shm = shared_memory.SharedMemory(name=resid_name)
+    frames_shm = None
+    try:
+        out = np.ndarray(shape, dtype=np.float32, buffer=resid_shm.buf)
+        if kind == "shm":
+            frames_name, frames_shape, src = ref
+            frames_shm = shared_memory.SharedMemory(name=frames_name)
+            staged = np.ndarray(frames_shape, dtype=np.uint8, buffer=frames_shm.buf)
+            out[dest:dest + count] = extract_residuals_batch(staged[src:src + count])
+            del staged
+        else:
+            out[dest:dest + count] = extract_residuals_batch(np.stack([ingest.load_frame(Path(p)) for p in ref]))
+        # Views must be released before the blocks can be closed
+        del out
+    finally:
+        resid_shm.close()
+        if frames_shm is not None:
+            frames_shm.close()
+    return count
+
+
+def _pool_map(fn, items: List) -> List:
+    pool = get_pool()
+    try:
+        return _bounded_map(pool, fn, items, config.PRNU_INFLIGHT_PER_REQUEST)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed); replace the pool and retry once
+        _reset_broken_pool(pool)
+        return _bounded_map(get_pool(), fn, items, config.PRNU_INFLIGHT_PER_REQUEST)
+
+
+def _shared_stack(shm: shared_memory.SharedMemory, shape: Tuple[int, ...]) -> np.ndarray:
+    """
+    float32 array read in place from `shm` (already unlinked). The block is closed when the
+    array is collected; every view of it keeps it alive, so the mapping outlives all of them.
+    """
+    stack = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    # Never at interpreter exit: unmapping under a live view would crash instead of raising
+    weakref.finalize(stack, shm.close).atexit = False
+    return stack
+
+
+def _residual_batches(pool: futures.Executor, frames: Union[np.ndarray, List[Path]],
+                      on_batch: Callable[[int, np.ndarray], None], keep: bool) -> Optional[np.ndarray]:
+    """
+    Extract residuals on `pool`, calling `on_batch(start, residuals)` in this thread as each
+    batch lands (the rows are reused afterwards, so it must not keep them). At most
+    PRNU_INFLIGHT_PER_REQUEST batches are in flight, and frames and residuals pass through
+    shared blocks sized for those slots only. With `keep`, the residual block holds all
+    N frames instead and is returned as the stack.
+    """
+    n = len(frames)
+    in_memory = isinstance(frames, np.ndarray)
+    h, w = frames.shape[1:3] if in_memory else ingest.load_frame(frames[0]).shape[:2]
+    batch = max(1, config.PRNU_BATCH_SIZE)
+    ranges = [(i, min(i + batch, n)) for i in range(0, n, batch)]
+    slots = min(len(ranges), max(1, config.PRNU_INFLIGHT_PER_REQUEST))
+    shape = (n if keep else slots * batch, h, w)
+
+    resid_shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * np.dtype(np.float32).itemsize)
+    frames_shm = shared_memory.SharedMemory(create=True, size=slots * batch * h * w * 3) if in_memory else None
+    try:
+        resid = np.ndarray(shape, dtype=np.float32, buffer=resid_shm.buf)
+        staged = np.ndarray((slots * batch, h, w, 3), dtype=np.uint8, buffer=frames_shm.buf) if in_memory else None
+        free = list(range(slots))
+        pending: Dict[futures.Future, Tuple[int, int, int, int]] = {}
+        todo = iter(ranges)
+
+        def submit(start: int, stop: int) -> None:
+            slot = free.pop()
+            dest = start if keep else slot * batch
+            if in_memory:
+                staged[slot * batch:slot * batch + stop - start] = frames[start:stop]
+                task = ("shm", (frames_shm.name, staged.shape, slot * batch), resid_shm.name, shape, dest, stop - start)
+            else:
+                task = ("paths", [str(p) for p in frames[start:stop]], resid_shm.name, shape, dest, stop - start)
+            pending[pool.submit(_residuals_into_shm, task)] = (start, stop, slot, dest)
+
+        for start, stop in itertools.islice(todo, slots):
+            submit(start, stop)
+        while pending:
+            done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for fut in done:
+                fut.result()
+                start, stop, slot, dest = pending.pop(fut)
+                on_batch(start, resid[dest:dest + stop - start])
+                free.append(slot)
+                nxt = next(todo, None)
+                if nxt is not None:
+                    submit(*nxt)
+        del resid, staged
+    except BaseException:
+        resid_shm.close()
+        raise
+    finally:
+        # The workers are done with both names; the residual mapping itself stays valid
+        resid_shm.unlink()
+        if frames_shm is not None:
+            frames_shm.close()
+            frames_shm.unlink()
+    if keep:
+        return _shared_stack(resid_shm, shape)
+    resid_shm.close()
+    return None
+
+
+def accumulate_prnu(frames: Union[np.ndarray, List[Path]],
+                    keep_residuals: bool = False) -> Tuple[PRNUAccumulator, Optional[np.ndarray]]:
+    """
+    Extract per-frame residuals on the shared pool and fold each batch into a PRNUAccumulator
+    as it arrives, so memory stays O(batches in flight x H x W) however many frames there are.
+    With `keep_residuals` the (N, H, W) float32 stack is also returned (else None); it is
+    the shared block itself, freed once the caller drops it and every view of it.
+    """
+    if len(frames) == 0:
+        raise ValueError("No frames to process")
+
+    def run(pool: futures.Executor) -> Tuple[PRNUAccumulator, Optional[np.ndarray]]:
+        acc = PRNUAccumulator()
+
+        def fold(start: int, residuals: np.ndarray) -> None:
+            for j, r in enumerate(residuals):
+                acc.update(r, frame_intensity(frames[start + j]))
+
+        return acc, _residual_batches(pool, frames, fold, keep_residuals)
+
+    pool = get_pool()
+    try:
+        return run(pool)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed); replace the pool and start over once
+        _reset_broken_pool(pool)
+        return run(get_pool())
+
+
+def process_frames_for_prnu(frames: Union[np.ndarray, List[Path]], keep_residuals: bool = False,
+                            method: str = config.PRNU_AGGREGATE) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Clip PRNU of `frames`, streamed through `accumulate_prnu`. The full residual stack is
+    only built when `keep_residuals` is set (the analysis needs per-frame residuals for
+    region scores and the temporal signal) or the median estimator is selected, which
+    needs every frame at once; it is returned in the first case and None otherwise.
+    """
+    acc, residuals = accumulate_prnu(frames, keep_residuals=keep_residuals or method == "median")
+    if method == "median":
+        clip_prnu = aggregate_residuals(residuals)
+        if not keep_residuals:
+            residuals = None
+    else:
+        clip_prnu = acc.finalize()
     return clip_prnu, residuals
 
 
-def face_region_scores_and_heatmaps(frames: List[Path], residuals: List[np.ndarray], evidence_dir: Path) -> Tuple[List[FaceRegionScore], List[Path]]:
+@dataclass
+class ConsistencyMap:
+    """
+    Summed-area tables of resid, bg, resid^2, bg^2 and resid*bg for one frame, so the
+    Pearson correlation between residual and background over any box costs O(1).
+    """
+    frame_index: int
+    tables: np.ndarray  # (5, H+1, W+1) float64
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.tables.shape[1] - 1, self.tables.shape[2] - 1
+
+    def box_sums(self, xs: np.ndarray, ys: np.ndarray, ws: np.ndarray, hs: np.ndarray) -> np.ndarray:
+        t = self.tables
+        return t[:, ys + hs, xs + ws] - t[:, ys, xs + ws] - t[:, ys + hs, xs] + t[:, ys, xs]
+
+    def correlations(self, xs, ys, ws, hs) -> np.ndarray:
+        """Pearson correlation of resid vs bg inside each box; flat boxes count as consistent (1.0)."""
+        xs, ys, ws, hs = (np.asarray(v, dtype=np.intp) for v in (xs, ys, ws, hs))
+        sr, sb, srr, sbb, srb = self.box_sums(xs, ys, ws, hs)
+        n = (ws * hs).astype(np.float64)
+        var_r = np.maximum(srr - sr * sr / n, 0.0)
+        var_b = np.maximum(sbb - sb * sb / n, 0.0)
+        cov = srb - sr * sb / n
+        flat = (var_r / n < 1e-12) | (var_b / n < 1e-12)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = cov / np.sqrt(var_r * var_b)
+        corr = np.where(flat, 1.0, corr)
+        return np.clip(corr, -1.0, 1.0)
+
+    def box_score(self, bbox: Tuple[int, int, int, int]) -> Optional[float]:
+        """Suspiciousness (1 - corr) of a box clipped to the frame; None if the box is empty."""
+        H, W = self.shape
+        x, y, w, h = bbox
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(W, x + w), min(H, y + h)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        corr = self.correlations([x0], [y0], [x1 - x0], [y1 - y0])[0]
+        return float(1.0 - corr)
+
+    def dense(self, window: int, stride: Optional[int] = None) -> Tuple[np.ndarray, int]:
+        """Sliding-window suspiciousness grid for square windows; returns (grid, stride)."""
+        H, W = self.shape
+        stride = stride or max(1, window // 2)
+        if window > H or window > W:
+            return np.zeros((0, 0), dtype=np.float32), stride
+        gy, gx = np.meshgrid(np.arange(0, H - window + 1, stride), np.arange(0, W - window + 1, stride), indexing="ij")
+        size = np.full(gx.shape, window)
+        corr = self.correlations(gx, gy, size, size)
+        return (1.0 - corr).astype(np.float32), stride
+
+
+def consistency_map(resid: np.ndarray, frame_index: int = 0) -> ConsistencyMap:
+    r = np.asarray(resid, dtype=np.float64)
+    # Background residual: blur to remove local detail
+    bg = cv2.GaussianBlur(r, (31, 31), 0)
+    tables = np.stack([
+        cv2.integral(src, sdepth=cv2.CV_64F) for src in (r, bg, r * r, bg * bg, r * bg)
+    ])
+    return ConsistencyMap(frame_index=frame_index, tables=tables)
+
+
+def _dense_candidates(cmap: ConsistencyMap, windows: Tuple[int, ...], per_window: int) -> List[Tuple[float, int, Tuple[int, int, int, int]]]:
+    out = []
+    for win in windows:
+        grid, stride = cmap.dense(win)
+        if grid.size == 0:
+            continue
+        take = min(grid.size, per_window)
+        for f in np.argpartition(grid.ravel(), -take)[-take:]:
+            gy, gx = divmod(int(f), grid.shape[1])
+            out.append((float(grid.flat[f]), cmap.frame_index, (gx * stride, gy * stride, win, win)))
+    return out
+
+
+def _top_regions(candidates, top_k: int, max_overlap: float = 0.3) -> List[FaceRegionScore]:
+    """Greedy pick of the highest scores, suppressing windows that overlap an earlier pick in the same frame."""
+    picked: List[FaceRegionScore] = []
+    for score, idx, box in sorted(candidates, key=lambda c: c[0], reverse=True):
+        if len(picked) >= top_k:
+            break
+        if any(p.frame_index == idx and _iou(p.bbox, box) > max_overlap for p in picked):
+            continue
+        picked.append(FaceRegionScore(frame_index=idx, bbox=box, score=score))
+    return picked
+
+
+def _iou(a: Tuple[int, int, int, int], b: Tuple[int, int, int, int]) -> float:
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union else 0.0
+
+
+def region_scores_and_heatmaps(frames: Union[np.ndarray, List[Path]], residuals: Union[np.ndarray, List[np.ndarray]], evidence_dir: Path,
+                               windows: Tuple[int, ...] = config.PRNU_DENSE_WINDOWS,
+                               top_k: int = config.PRNU_DENSE_TOP_K,
+                               heatmap_top_k: int = config.HEATMAP_TOP_K) -> Tuple[List[FaceRegionScore], List[HeatmapData], List[FaceRegionScore]]:
+    """
+    Face scores, heatmap data for the `heatmap_top_k` highest-scoring face frames, and the
+    `top_k` most suspicious sliding windows over all frames (faces or not).
+    Each frame's summed-area tables are built once and shared.
+    """
     scores: List[FaceRegionScore] = []
-    heatmaps: List[Path] = []
-    for idx, (frame_path, resid) in enumerate(zip(frames, residuals)):
-        frame = ingest.load_frame(frame_path)
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = _detect_faces(gray)
-        if not faces:
+    candidates = []
+    frame_rois: Dict[int, List[Tuple[Tuple[int, int, int, int], np.ndarray]]] = {}
+    bgr_frames = [ingest.as_bgr(f) for f in frames] if not isinstance(frames, np.ndarray) else frames
+    grays = [cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in bgr_frames]
+    all_faces = detect_faces_tracked(grays)
+    for idx, (resid, faces) in enumerate(zip(residuals, all_faces)):
+        if not faces and not windows:
             continue
-        # Background residual: blur to remove face detail
-        bg_resid = cv2.GaussianBlur(resid, (31, 31), 0)
+        cmap = consistency_map(resid, idx)
+        if windows:
+            candidates.extend(_dense_candidates(cmap, windows, top_k * 4))
+        bg_resid = None
         for (x, y, w, h) in faces:
-            face_r = resid[y:y+h, x:x+w]
-            bg_r = bg_resid[y:y+h, x:x+w]
-            if face_r.size == 0 or bg_r.size == 0:
+            score = cmap.box_score((x, y, w, h))  # lower corr -> higher suspiciousness
+            if score is None:
                 continue
-            # Pearson correlation
-            f = face_r.flatten()
-            b = bg_r.flatten()
-            if f.std() < 1e-6 or b.std() < 1e-6:
-                corr = 1.0
-            else:
-                corr = float(np.corrcoef(f, b)[0, 1])
-            score = 1.0 - max(-1.0, min(1.0, corr))  # lower corr -> higher suspiciousness
             scores.append(FaceRegionScore(frame_index=idx, bbox=(x, y, w, h), score=score))
+            if bg_resid is None:
+                bg_resid = cv2.GaussianBlur(resid, (31, 31), 0)
+            frame_rois.setdefault(idx, []).append(((x, y, w, h), heatmap_roi(resid[y:y+h, x:x+w], bg_resid[y:y+h, x:x+w])))
+
+    # Only the most suspicious frames keep heatmap data; nothing is rendered here
+    by_frame: Dict[int, List[float]] = {}
+    for s in scores:
+        by_frame.setdefault(s.frame_index, []).append(s.score)
+    ranked = sorted(by_frame, key=lambda i: max(by_frame[i]), reverse=True)[:heatmap_top_k]
+    heatmaps: List[HeatmapData] = []
+    for idx in ranked:
+        path = save_heatmap_data(evidence_dir / f"heatmap_frame_{idx:03d}.npz", bgr_frames[idx], frame_rois[idx], by_frame[idx])
+        heatmaps.append(HeatmapData(frame_index=idx, score=max(by_frame[idx]), faces=len(by_frame[idx]), path=path))
+    return scores, heatmaps, _top_regions(candidates, top_k)
+
+
+def face_region_scores_and_heatmaps(frames: Union[np.ndarray, List[Path]], residuals: Union[np.ndarray, List[np.ndarray]], evidence_dir: Path) -> Tuple[List[FaceRegionScore], List[Path]]:
+    scores, heatmaps, _ = region_scores_and_heatmaps(frames, residuals, evidence_dir, windows=(), heatmap_top_k=len(residuals))
+    return scores, [render_heatmap_png(h.path) for h in heatmaps]
+
+
+def residual_gram(residuals: Union[np.ndarray, List[np.ndarray]]) -> np.ndarray:
+    """
+    Pearson correlation between every pair of residuals, from one (N, P) x (P, N) product
+    over the flattened stack. Centering and scaling are applied to the small N x N result,
+    so the stack is never copied.
+    """
+    stack = np.asarray(residuals, dtype=np.float32)
+    flat = stack.reshape(len(stack), -1)
+    n_pix = flat.shape[1]
+    gram = (flat @ flat.T).astype(np.float64)
+    means = flat.mean(axis=1, dtype=np.float64)
+    gram -= n_pix * np.outer(means, means)
+    norms = np.sqrt(np.maximum(np.diag(gram), 0.0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = gram / np.outer(norms, norms)
+    corr[~np.isfinite(corr)] = 0.0
+    return np.clip(corr, -1.0, 1.0)
+
+
+def _robust_z(x: np.ndarray, floor: float) -> np.ndarray:
+    """(x - median) / MAD, with the spread at least `floor` so near-constant series don't flag noise."""
+    med = float(np.median(x))
+    spread = max(1.4826 * float(np.median(np.abs(x - med))), floor, 1e-6)
+    return (x - med) / spread
+
+
+def _local_drop(x: np.ndarray, window: int = 3) -> np.ndarray:
+    """Each value minus the median of its `window` neighbours on either side (itself excluded)."""
+    out = np.empty_like(x)
+    for i in range(len(x)):
+        neighbours = np.concatenate([x[max(0, i - window):i], x[i + 1:i + 1 + window]])
+        out[i] = x[i] - np.median(neighbours)
+    return out
+
+
+@dataclass
+class TemporalConsistency:
+    score: float  # 0 = one consistent noise pattern, 1 = a segment shares none of it with the rest
+    frame_to_clip: List[float]  # each frame vs the clip PRNU of the other frames (leave-one-out)
+    adjacent: List[float]  # frame i vs frame i+1
+    breaks: List[int]  # i such that the pattern breaks between frames i and i+1
+    segments: List[Dict]  # runs of frames between breaks: start, end, within, cross, score
+    outlier_frames: List[int]
 
-            heat = create_heatmap_overlay(frame, face_r, bg_r, (x, y, w, h))
-            out_path = evidence_dir / f"heatmap_frame_{idx:03d}.png"
-            cv2.imwrite(str(out_path), heat)
-            heatmaps.append(out_path)
-    return scores, heatmaps
+    def to_dict(self) -> Dict:
+        return {
+            "score": self.score,
+            "frame_to_clip": self.frame_to_clip,
+            "adjacent": self.adjacent,
+            "breaks": self.breaks,
+            "segments": self.segments,
+            "outlier_frames": self.outlier_frames,
+        }
+
+
+def temporal_consistency(residuals: Union[np.ndarray, List[np.ndarray]], z_threshold: float = config.TEMPORAL_BREAK_Z,
+                         min_frames: int = config.TEMPORAL_MIN_FRAMES) -> Optional[TemporalConsistency]:
+    """
+    Temporal residual-consistency of a clip from its per-frame residuals.
+    Adjacent-frame correlations that drop far below their neighbours (robust z-score under
+    `-z_threshold`) are splice points; each segment between them is scored by how much
+    less it correlates with the other frames than within itself. Returns None for clips
+    shorter than `min_frames`.
+    """
+    n = len(residuals)
+    if n < max(3, min_frames):
+        return None
+    corr = residual_gram(residuals)
+    adjacent = np.diag(corr, k=1)
+    # Leave-one-out: frame i against the mean of the other (unit-norm) residuals
+    row_sums = corr.sum(axis=1)
+    rest_norm = np.sqrt(np.maximum(corr.sum() - 2.0 * row_sums + 1.0, 1e-12))
+    frame_to_clip = (row_sums - 1.0) / rest_norm
+
+    # A break is a drop against the neighbouring pairs, so a segment with a lower but steady
+    # level (different content, same camera) does not break at every frame
+    typical = float(np.median(adjacent))
+    floor = 0.1 * abs(typical)
+    breaks = [int(i) for i in np.flatnonzero(_robust_z(_local_drop(adjacent), floor) < -z_threshold)]
+    outliers = [int(i) for i in np.flatnonzero(_robust_z(frame_to_clip, 0.1 * abs(float(np.median(frame_to_clip)))) < -z_threshold)]
+
+    segments: List[Dict] = []
+    bounds = [0] + [b + 1 for b in breaks] + [n]
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        inside = np.arange(start, stop)
+        rest = np.setdiff1d(np.arange(n), inside)
+        if len(inside) > 1:
+            block = corr[np.ix_(inside, inside)]
+            within = float((block.sum() - len(inside)) / (len(inside) * (len(inside) - 1)))
+        else:
+            within = typical
+        cross = float(corr[np.ix_(inside, rest)].mean()) if len(rest) else within
+        seg_score = float(np.clip(1.0 - cross / within, 0.0, 1.0)) if within > 1e-6 else 0.0
+        segments.append({"start": int(start), "end": int(stop - 1), "within": within, "cross": cross,
+                         "score": seg_score if breaks else 0.0})
+
+    score = max(seg["score"] for seg in segments)
+    return TemporalConsistency(
+        score=float(score),
+        frame_to_clip=[float(v) for v in frame_to_clip],
+        adjacent=[float(v) for v in adjacent],
+        breaks=breaks,
+        segments=segments,
+        outlier_frames=outliers,
+    )
 
 
 def correlation_similarity(a: np.ndarray, b: np.ndarray) -> float:
@@ -148,3 +897,94 @@ def correlation_similarity(a: np.ndarray, b: np.ndarray) -> float:
     return float(np.clip(corr, -1.0, 1.0))
 
 
+@dataclass
+class ReferenceSpectrum:
+    shape: Tuple[int, int]      # reference size
+    dft_shape: Tuple[int, int]  # padded size used for the DFT
+    spectrum: np.ndarray        # packed real DFT (cv2 CCS) of the zero-mean reference
+
+
+_spectra: "OrderedDict[str, ReferenceSpectrum]" = OrderedDict()
+_spectra_lock = threading.Lock()
+
+
+def reference_spectrum(ref: np.ndarray, key: Optional[str] = None) -> ReferenceSpectrum:
+    """DFT of a reference fingerprint; with a `key` it is computed once and kept in a small LRU."""
+    if key is not None:
+        with _spectra_lock:
+            hit = _spectra.get(key)
+            if hit is not None:
+                _spectra.move_to_end(key)
+                return hit
+    r = np.asarray(ref, dtype=np.float32)
+    h, w = r.shape
+    dh, dw = cv2.getOptimalDFTSize(h), cv2.getOptimalDFTSize(w)
+    padded = np.zeros((dh, dw), dtype=np.float32)
+    padded[:h, :w] = r - r.mean()
+    spec = ReferenceSpectrum(shape=(h, w), dft_shape=(dh, dw), spectrum=cv2.dft(padded))
+    if key is not None:
+        with _spectra_lock:
+            _spectra[key] = spec
+            while len(_spectra) > config.PRNU_SPECTRUM_CACHE:
+                _spectra.popitem(last=False)
+    return spec
+
+
+def _pce_at_scale(clip: np.ndarray, spec: ReferenceSpectrum, exclude: int) -> Tuple[float, Tuple[int, int]]:
+    dh, dw = spec.dft_shape
+    h, w = min(clip.shape[0], spec.shape[0]), min(clip.shape[1], spec.shape[1])
+    q = np.zeros((dh, dw), dtype=np.float32)
+    q[:h, :w] = clip[:h, :w] - clip[:h, :w].mean()
+    # xc[dy, dx] = sum ref[y + dy, x + dx] * clip[y, x]: the peak sits at the clip's offset in the reference
+    xc = cv2.idft(cv2.mulSpectrums(spec.spectrum, cv2.dft(q), 0, conjB=True), flags=cv2.DFT_REAL_OUTPUT)
+    py, px = np.unravel_index(int(np.argmax(xc)), xc.shape)
+    peak = float(xc[py, px])
+    r = exclude // 2
+    ys = np.arange(py - r, py + r + 1) % dh
+    xs = np.arange(px - r, px + r + 1) % dw
+    near = xc[np.ix_(ys, xs)]
+    total = float(np.dot(xc.ravel(), xc.ravel()))
+    energy = (total - float(np.dot(near.ravel(), near.ravel()))) / max(1, xc.size - near.size)
+    pce = peak * peak / energy if energy > 0 else 0.0
+    # Shifts past the middle wrap around to negative offsets
+    dy = py - dh if py > dh // 2 else py
+    dx = px - dw if px > dw // 2 else px
+    return float(np.sign(peak) * pce), (int(dy), int(dx))
+
+
+def pce_match(clip: np.ndarray, ref: np.ndarray, ref_key: Optional[str] = None,
+              scales: Tuple[float, ...] = config.PRNU_PCE_SCALES, exclude: int = config.PRNU_PCE_EXCLUDE) -> Dict:
+    """
+    Peak-to-correlation energy of the clip fingerprint against a reference over all translations
+    (FFT cross-correlation) and the given clip scales, so cropped or re-framed clips still match.
+    `scale` < 1 means the clip was upscaled from a crop of the reference frame.
+    """
+    spec = reference_spectrum(ref, ref_key)
+    c = np.asarray(clip, dtype=np.float32)
+    best = {"pce": -np.inf, "shift": (0, 0), "scale": 1.0}
+    for s in scales:
+        q = c
+        if s != 1.0:
+            size = (max(1, int(round(c.shape[1] * s))), max(1, int(round(c.shape[0] * s))))
+            q = cv2.resize(c, size, interpolation=cv2.INTER_AREA if s < 1.0 else cv2.INTER_CUBIC)
+        pce, shift = _pce_at_scale(q, spec, exclude)
+        if pce > best["pce"]:
+            best = {"pce": pce, "shift": shift, "scale": s}
+    return best
+
+
+def pce_similarity(pce: float, threshold: float = config.PRNU_PCE_THRESHOLD) -> float:
+    """Map PCE to [0, 1]; 0.5 at the detection threshold."""
+    pce = max(0.0, pce)
+    return float(pce / (pce + threshold))
+
+
+def match_similarity(clip: np.ndarray, ref: np.ndarray, ref_key: Optional[str] = None,
+                     method: str = config.PRNU_MATCH_METHOD) -> Tuple[float, Dict]:
+    """Similarity in [0, 1] between a clip fingerprint and a device reference, with match details."""
+    if method == "pce":
+        m = pce_match(clip, ref, ref_key)
+        return pce_similarity(m["pce"]), {"method": "pce", **m, "shift": list(m["shift"])}
+    corr = correlation_similarity(clip, ref)
+    # map from [-1,1] to [0,1]
+    return (corr + 1.0) / 2.0, {"method": "corr", "correlation": corr}
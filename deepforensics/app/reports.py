@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import base64
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from . import blobs, config, utils
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    task_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    decision TEXT,
+    weighted_score REAL,
+    ml_provider TEXT,
+    sha256 TEXT,
+    filename TEXT,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_created ON reports (created_at, task_id);
+CREATE INDEX IF NOT EXISTS reports_decision ON reports (decision, created_at, task_id);
+CREATE INDEX IF NOT EXISTS reports_provider ON reports (ml_provider, created_at, task_id);
+CREATE INDEX IF NOT EXISTS reports_sha256 ON reports (sha256, created_at);
+"""
+
+_SUMMARY_COLUMNS = ("task_id", "created_at", "decision", "weighted_score", "ml_provider", "sha256", "filename")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None).isoformat() + "Z"
+
+
+def _columns(report: Dict, fallback_ts: Optional[float] = None) -> Tuple:
+    stamps = report.get("timestamps") or {}
+    created = _timestamp(stamps.get("finished_at")) or _timestamp(stamps.get("started_at"))
+    if created is None:
+        created = fallback_ts if fallback_ts is not None else datetime.now(timezone.utc).timestamp()
+    ens = report.get("ensemble") or {}
+    source = report.get("source") or {}
+    score = ens.get("weighted_score")
+    return (
+        report["task_id"],
+        created,
+        ens.get("decision"),
+        float(score) if score is not None else None,
+        (report.get("ml") or {}).get("provider"),
+        source.get("sha256"),
+        source.get("filename"),
+        json.dumps(report, separators=(",", ":")),
+    )
+
+
+def encode_cursor(created_at: float, task_id: str) -> str:
+    raw = json.dumps([created_at, task_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, task_id = json.loads(raw)
+        return float(created_at), str(task_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+
+
+class ReportStore:
+    """
+    Reports in one SQLite database (WAL mode, so listing never blocks writers): the full report
+    as JSON plus indexed columns for filtering. Listing is newest first with keyset pagination,
+    so every page costs the same however deep the client pages.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or config.REPORTS_DB)
+        self._local = threading.local()
+        self._conns: List[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            utils.safe_mkdir(self.path.parent)
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def close(self) -> None:
+        with self._conns_lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
+        self._local = threading.local()
+
+    def put(self, report: Dict) -> None:
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?, ?, ?, ?, ?)", _columns(report))
+
+    def get_raw(self, task_id: str) -> Optional[str]:
+        """The report as stored (compact JSON), without decoding it."""
+        row = self._conn().execute("SELECT body FROM reports WHERE task_id = ?", (task_id,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, task_id: str) -> Optional[Dict]:
+        raw = self.get_raw(task_id)
+        return json.loads(raw) if raw is not None else None
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+
+    def query(self, decision: Optional[Sequence[str]] = None, since: Optional[float] = None,
+              until: Optional[float] = None, ml_provider: Optional[str] = None, sha256: Optional[str] = None,
+              min_score: Optional[float] = None, max_score: Optional[float] = None, limit: int = 50,
+              cursor: Optional[str] = None, include_report: bool = False) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Report summaries matching every given filter, newest first, at most `limit` of them.
+        `since`/`until` are epoch seconds (inclusive / exclusive). Returns the page and the cursor
+        for the next one (None on the last page).
+        """
+        where: List[str] = []
+        args: List = []
+        if decision:
+            where.append(f"decision IN ({', '.join('?' * len(decision))})")
+            args.extend(decision)
+        for column, op, value in (("created_at", ">=", since), ("created_at", "<", until),
+                                  ("ml_provider", "=", ml_provider), ("sha256", "=", sha256),
+                                  ("weighted_score", ">=", min_score), ("weighted_score", "<=", max_score)):
+            if value is not None:
+                where.append(f"{column} {op} ?")
+                args.append(value)
+        if cursor:
+            where.append("(created_at, task_id) < (?, ?)")
+            args.extend(decode_cursor(cursor))
+        columns = ", ".join(_SUMMARY_COLUMNS + (("body",) if include_report else ()))
+        sql = f"SELECT {columns} FROM reports"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at DESC, task_id DESC LIMIT ?"
+        rows = self._conn().execute(sql, (*args, limit + 1)).fetchall()
+
+        items: List[Dict] = []
+        for row in rows[:limit]:
+            item = dict(zip(_SUMMARY_COLUMNS, row))
+            item["created_at"] = _iso(row[1])
+            if include_report:
+                item["report"] = json.loads(row[-1])
+            items.append(item)
+        next_cursor = encode_cursor(rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+        return items, next_cursor
+
+    def import_files(self, paths: Iterable[Path], batch: int = 500) -> Dict[str, int]:
+        """
+        Add report JSON files not already in the store (existing task ids are left alone).
+        Inline base64 heatmaps are moved to the blob store on the way in.
+        """
+        counts = {"imported": 0, "skipped": 0, "failed": 0}
+        conn = self._conn()
+        pending: List[Tuple] = []
+
+        def flush() -> None:
+            with conn:
+                before = conn.total_changes
+                conn.executemany("INSERT OR IGNORE INTO reports VALUES (?, ?, ?, ?, ?, ?, ?, ?)", pending)
+                added = conn.total_changes - before
+            counts["imported"] += added
+            counts["skipped"] += len(pending) - added
+            pending.clear()
+
+        for p in paths:
+            try:
+                with open(p, "r", encoding="utf-8") as f:
+                    report = json.load(f)
+                report.setdefault("task_id", p.stem)
+                blobs.externalize_images(report)
+                pending.append(_columns(report, fallback_ts=p.stat().st_mtime))
+            except (OSError, ValueError, TypeError, AttributeError):
+                counts["failed"] += 1
+                continue
+            if len(pending) >= batch:
+                flush()
+        if pending:
+            flush()
+        return counts
+
+    def import_dir(self, root: Optional[Path] = None) -> Dict[str, int]:
+        return self.import_files(sorted(Path(root or config.REPORTS_DIR).glob("*.json")))
+
+
+_store: Optional[ReportStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ReportStore:
+    global _store
+    with _store_lock:
+        if _store is None or _store.path != Path(config.REPORTS_DB):
+            if _store is not None:
+                _store.close()
+            _store = ReportStore()
+        return _store
+
+
+def shutdown_store() -> None:
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+            _store = None
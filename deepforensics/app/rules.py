@@ -0,0 +1,185 @@
+"""
+Score overrides for the local stub provider, read from `STUB_RULES_PATH`.
+
+The file is either the original flat map of filename -> score
+
+    {"sample_fake_1.mp4": 0.85, "sample_pristine_1.mp4": 0.1}
+
+or an object with any of these sections:
+
+    {
+      "sha256":    {"<hex digest>": 0.9, ...},
+      "filenames": {"sample_fake_1.mp4": 0.85, ...},
+      "rules": [
+        {"glob": "*_deepfake_*.mp4", "score": 0.9},
+        {"regex": "^cam[0-9]+_", "flags": ["recompression_detected"], "score": 0.6}
+      ]
+    }
+
+A content hash match wins over a filename match, which wins over `rules`. Rules are tried in
+order and the first one whose conditions all hold (glob / regex on the filename, every listed
+metadata flag present) applies. The file is compiled once and recompiled only when it changes.
+"""
+from __future__ import annotations
+
+import fnmatch
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional, Pattern, Tuple
+
+from . import config
+
+
+_SECTIONS = ("sha256", "filenames", "rules")
+
+
+@dataclass(frozen=True)
+class Match:
+    score: float
+    by: str  # sha256 | filename | rule
+    rule: Optional[int] = None  # index into "rules" when by == "rule"
+
+
+@dataclass(frozen=True)
+class _Rule:
+    score: float
+    pattern: Optional[Pattern] = None
+    flags: FrozenSet[str] = frozenset()
+
+    def matches(self, name: str, flags: FrozenSet[str]) -> bool:
+        if self.pattern is not None and self.pattern.search(name) is None:
+            return False
+        return self.flags <= flags
+
+
+def _score(value) -> float:
+    return min(1.0, max(0.0, float(value)))
+
+
+def _compile_rule(spec: Dict) -> _Rule:
+    if not isinstance(spec, dict) or "score" not in spec:
+        raise ValueError(f"Rule needs a score: {spec!r}")
+    if "glob" in spec and "regex" in spec:
+        raise ValueError(f"Rule has both glob and regex: {spec!r}")
+    pattern = None
+    if "glob" in spec:
+        pattern = re.compile(fnmatch.translate(str(spec["glob"])))
+    elif "regex" in spec:
+        pattern = re.compile(str(spec["regex"]))
+    flags = spec.get("flags") or []
+    if isinstance(flags, str):
+        flags = [flags]
+    return _Rule(score=_score(spec["score"]), pattern=pattern, flags=frozenset(flags))
+
+
+@dataclass
+class RuleSet:
+    """Compiled rules: exact hash and filename lookups are dict hits, patterns a short ordered scan."""
+
+    by_sha256: Dict[str, float] = field(default_factory=dict)
+    by_filename: Dict[str, float] = field(default_factory=dict)
+    rules: List[_Rule] = field(default_factory=list)
+    signature: Optional[str] = None  # identifies the file version this was compiled from
+
+    @classmethod
+    def from_dict(cls, data: Dict, signature: Optional[str] = None) -> "RuleSet":
+        if not isinstance(data, dict):
+            raise ValueError("Stub rules must be a JSON object")
+        if not any(k in data for k in _SECTIONS):
+            data = {"filenames": data}
+        return cls(
+            by_sha256={str(k).lower(): _score(v) for k, v in (data.get("sha256") or {}).items()},
+            by_filename={str(k): _score(v) for k, v in (data.get("filenames") or {}).items()},
+            rules=[_compile_rule(r) for r in data.get("rules") or []],
+            signature=signature,
+        )
+
+    def __len__(self) -> int:
+        return len(self.by_sha256) + len(self.by_filename) + len(self.rules)
+
+    @property
+    def uses_hashes(self) -> bool:
+        return bool(self.by_sha256)
+
+    def match(self, filename: str, sha256: Optional[str] = None, flags: Iterable[str] = ()) -> Optional[Match]:
+        if sha256 and self.by_sha256:
+            score = self.by_sha256.get(sha256.lower())
+            if score is not None:
+                return Match(score, "sha256")
+        score = self.by_filename.get(filename)
+        if score is not None:
+            return Match(score, "filename")
+        if self.rules:
+            flag_set = frozenset(flags)
+            for i, rule in enumerate(self.rules):
+                if rule.matches(filename, flag_set):
+                    return Match(rule.score, "rule", i)
+        return None
+
+    def match_many(self, items: Iterable[Tuple[str, Optional[str], Iterable[str]]]) -> List[Optional[Match]]:
+        """`match` over `(filename, sha256, flags)` tuples against one compiled version."""
+        return [self.match(name, sha, flags) for name, sha, flags in items]
+
+
+_EMPTY = RuleSet(signature="none")
+
+
+class RuleLoader:
+    """
+    Holds the compiled rules of one file and recompiles them only when its size or mtime
+    changes. A file that fails to parse keeps the previously compiled rules (see `error`).
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self._path = path
+        self._lock = threading.Lock()
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._rules: RuleSet = _EMPTY
+        self.error: Optional[str] = None
+
+    @property
+    def path(self) -> Path:
+        return self._path or config.STUB_RULES_PATH
+
+    def get(self) -> RuleSet:
+        path = self.path
+        try:
+            st = os.stat(path)
+            stamp: Optional[Tuple[int, int]] = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            stamp = None
+        if stamp == self._stamp:
+            return self._rules
+        with self._lock:
+            if stamp == self._stamp:
+                return self._rules
+            if stamp is None:
+                self._rules, self.error = _EMPTY, None
+            else:
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                    self._rules = RuleSet.from_dict(data, signature=f"{stamp[0]}:{stamp[1]}")
+                    self.error = None
+                except (OSError, ValueError, TypeError, re.error) as e:
+                    self.error = f"{path.name}: {e}"
+            self._stamp = stamp
+            return self._rules
+
+
+_loader: Optional[RuleLoader] = None
+_loader_lock = threading.Lock()
+
+
+def get_rules() -> RuleSet:
+    """The current stub rules, recompiled if `STUB_RULES_PATH` changed since the last call."""
+    global _loader
+    with _loader_lock:
+        if _loader is None or _loader.path != config.STUB_RULES_PATH:
+            _loader = RuleLoader()
+        loader = _loader
+    return loader.get()
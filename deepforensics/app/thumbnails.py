@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import base64
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+from . import config, ingest
+
+
+@dataclass
+class Thumbnail:
+    frame_index: int  # position in the sampled frames
+    bbox: Optional[Tuple[int, int, int, int]]  # crop in frame coordinates; None = whole frame
+    size: Tuple[int, int]  # (w, h) after downscaling
+    jpeg: bytes
+    source_frame: Optional[int] = None  # frame number in the video, when the sampler reports it
+
+    @property
+    def b64(self) -> str:
+        return base64.b64encode(self.jpeg).decode()
+
+    @property
+    def label(self) -> str:
+        frame = self.frame_index if self.source_frame is None else self.source_frame
+        return f"frame {frame}" + (" (face crop)" if self.bbox else "")
+
+
+def dhash(gray: np.ndarray, size: int = 8) -> int:
+    """Difference hash: sign of horizontal gradients on a (size+1) x size thumbnail."""
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def _hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def select_frames(hashes: Sequence[int], face_scores: Sequence[Dict], count: int,
+                  min_distance: int = config.THUMBNAIL_MIN_HASH_DISTANCE) -> List[Tuple[int, Optional[Tuple[int, int, int, int]]]]:
+    """
+    Pick up to `count` (frame_index, face bbox or None): frames with the most suspicious faces
+    first, then the frames most different (by dHash) from those already picked.
+    Near-duplicates of a picked frame (Hamming distance < `min_distance`) are skipped.
+    """
+    picked: List[Tuple[int, Optional[Tuple[int, int, int, int]]]] = []
+
+    def distinct(i: int) -> bool:
+        return all(_hamming(hashes[i], hashes[j]) >= min_distance for j, _ in picked)
+
+    for s in sorted(face_scores, key=lambda s: s.get("score", 0.0), reverse=True):
+        i = int(s["frame_index"])
+        if len(picked) >= count:
+            break
+        if 0 <= i < len(hashes) and distinct(i):
+            picked.append((i, tuple(int(v) for v in s["bbox"])))
+
+    remaining = [i for i in range(len(hashes)) if all(i != j for j, _ in picked)]
+    while len(picked) < count and remaining:
+        if not picked:
+            best = remaining[0]
+        else:
+            # Farthest-point: the frame whose nearest picked frame is furthest away
+            best = max(remaining, key=lambda i: min(_hamming(hashes[i], hashes[j]) for j, _ in picked))
+            if not distinct(best):
+                break
+        picked.append((best, None))
+        remaining.remove(best)
+    return picked
+
+
+def _crop(frame: np.ndarray, bbox: Tuple[int, int, int, int], margin: float) -> Tuple[np.ndarray, Tuple[int, int, int, int]]:
+    H, W = frame.shape[:2]
+    x, y, w, h = bbox
+    mx, my = int(w * margin), int(h * margin)
+    x0, y0 = max(0, x - mx), max(0, y - my)
+    x1, y1 = min(W, x + w + mx), min(H, y + h + my)
+    return frame[y0:y1, x0:x1], (x0, y0, x1 - x0, y1 - y0)
+
+
+def encode_budgeted(img: np.ndarray, max_pixels: int = config.THUMBNAIL_MAX_PIXELS,
+                    max_bytes: int = config.THUMBNAIL_MAX_BYTES) -> Tuple[bytes, Tuple[int, int]]:
+    """JPEG within both budgets: downscale to `max_pixels`, then lower quality, then shrink further."""
+    h, w = img.shape[:2]
+    scale = min(1.0, (max_pixels / float(w * h)) ** 0.5)
+    while True:
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        small = img if size == (w, h) else cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        for quality in (85, 75, 65, 55, 45):
+            ok, buf = cv2.imencode(".jpg", small, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                raise RuntimeError("Failed to encode thumbnail")
+            if buf.size <= max_bytes:
+                return buf.tobytes(), size
+        if size[0] <= 16 or size[1] <= 16:
+            return buf.tobytes(), size
+        scale *= 0.75
+
+
+def build_thumbnails(frames: Union[np.ndarray, List[Path]], face_scores: Sequence[Dict],
+                     count: int = config.THUMBNAIL_COUNT, max_pixels: int = config.THUMBNAIL_MAX_PIXELS,
+                     max_bytes: int = config.THUMBNAIL_MAX_BYTES, margin: float = 0.5,
+                     source_frames: Optional[Sequence[int]] = None) -> List[Thumbnail]:
+    """
+    Size-budgeted JPEG thumbnails of the most informative frames (face crops where available).
+    `source_frames` maps each sampled frame to its frame number in the video, used in the labels.
+    """
+    if count <= 0 or len(frames) == 0:
+        return []
+    if isinstance(frames, np.ndarray):
+        hashes = [dhash(cv2.cvtColor(f, cv2.COLOR_BGR2GRAY)) for f in frames]
+    else:
+        hashes = [dhash(cv2.imread(str(p), cv2.IMREAD_GRAYSCALE)) for p in frames]
+    out: List[Thumbnail] = []
+    for idx, bbox in select_frames(hashes, face_scores, count):
+        frame = ingest.as_bgr(frames[idx])
+        crop_box = None
+        if bbox is not None:
+            frame, crop_box = _crop(frame, bbox, margin)
+        jpeg, size = encode_budgeted(frame, max_pixels, max_bytes)
+        source = int(source_frames[idx]) if source_frames is not None and idx < len(source_frames) else None
+        out.append(Thumbnail(frame_index=idx, bbox=crop_box, size=size, jpeg=jpeg, source_frame=source))
+    return out
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import base64
+import hashlib
 import json
 import os
 import shutil
@@ -10,7 +11,7 @@ import uuid
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
-from . import config
+from . import config, exiftool
 
 
 def redact_path(path: str) -> str:
@@ -38,17 +39,58 @@ def ffprobe_json(video_path: Path) -> Dict:
 
 def exiftool_dict(video_path: Path) -> Optional[Dict]:
     # Optional; skip if not installed
-    if shutil.which("exiftool") is None:
+    pool = exiftool.get_pool()
+    if pool is None:
         return None
-    code, out, err = run_cmd(["exiftool", str(video_path)])
-    if code != 0:
+    try:
+        if not exiftool.argfile_safe(video_path):
+            return exiftool.run_once(video_path)
+        return pool.execute(video_path)
+    except Exception:
         return None
-    result: Dict[str, str] = {}
-    for line in out.splitlines():
-        if ":" in line:
-            k, v = line.split(":", 1)
-            result[k.strip()] = v.strip()
-    return result
+
+
+def sha256_file(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def safe_filename(name: Optional[str], default: str = "upload.bin") -> str:
+    # Control characters (newlines above all) would break line-based tools such as exiftool's argfile
+    base = "".join("_" if ord(c) < 32 or ord(c) == 127 else c for c in Path(name or "").name)
+    return base or default
+
+
+async def save_upload(upload, dest: Path, max_bytes: int = config.MAX_UPLOAD_BYTES,
+                      chunk_size: int = config.UPLOAD_CHUNK_SIZE) -> Tuple[int, str]:
+    """
+    Stream an upload to `dest` in bounded chunks, hashing it in the same pass.
+    Returns (size, sha256 hex). Raises UploadTooLarge as soon as `max_bytes` is exceeded.
+    """
+    h = hashlib.sha256()
+    size = 0
+    try:
+        with open(dest, "wb") as out:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds limit of {max_bytes} bytes")
+                h.update(chunk)
+                out.write(chunk)
+    except UploadTooLarge:
+        cleanup_path(dest)
+        raise
+    return size, h.hexdigest()
 
 
 def make_task_id() -> str:
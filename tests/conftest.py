@@ -1,8 +1,25 @@
 import sys
 from pathlib import Path
 
+import pytest
+
 # Ensure repo root is on sys.path
 ROOT = Path(__file__).resolve().parent.parent
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    """Point every cache and store at tmp_path so tests neither reuse nor leave behind real state."""
+    from deepforensics.app import config, reports
+
+    monkeypatch.setattr(config, "CACHE_DIR", tmp_path / "state" / "cache")
+    monkeypatch.setattr(config, "EVIDENCE_DIR", tmp_path / "state" / "evidence")
+    monkeypatch.setattr(config, "REPORTS_DIR", tmp_path / "state" / "reports")
+    monkeypatch.setattr(config, "REPORTS_DB", tmp_path / "state" / "reports.sqlite3")
+    monkeypatch.setattr(config, "BLOB_DIR", tmp_path / "state" / "blobs")
+    # Tests of the result cache turn it back on
+    monkeypatch.setattr(config, "RESULT_CACHE_ENABLED", False)
+    yield
+    reports.shutdown_store()
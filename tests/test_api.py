@@ -3,10 +3,11 @@ import io
 import tempfile
 import shutil
 import pytest
+from fastapi import FastAPI, File, Request, UploadFile
 from fastapi.testclient import TestClient
 
-from deepforensics.app.api import app
-from deepforensics.app import utils
+from deepforensics.app.api import UploadLimitMiddleware, app
+from deepforensics.app import config, utils
 
 
 def ffmpeg_available():
@@ -28,6 +29,118 @@ def test_analyze_endpoint_returns_report():
             r = client.post("/analyze", files=files, data=data)
         assert r.status_code == 200, r.text
         j = r.json()
-        for k in ["task_id", "source", "ml", "metadata", "prnu", "ensemble", "timestamps"]:
+        for k in ["task_id", "source", "ml", "metadata", "prnu", "temporal", "ensemble", "timestamps"]:
             assert k in j
 
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg/ffprobe not available")
+def test_analyze_reports_streamed_sha256_and_rejects_oversize(monkeypatch):
+    monkeypatch.setattr(config, "RESULT_CACHE_ENABLED", True)
+    client = TestClient(app)
+    with tempfile.TemporaryDirectory() as td:
+        video = Path(td) / "gen.mp4"
+        code, out, err = utils.run_cmd([
+            "ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc=size=160x120:rate=5:duration=1", str(video)
+        ])
+        assert code == 0
+        with open(video, "rb") as fh:
+            r = client.post("/analyze", files={"file": (video.name, fh, "video/mp4")}, data={"privacy_mode": "true"})
+        assert r.status_code == 200, r.text
+        assert r.json()["source"]["sha256"] == utils.sha256_file(video)
+        with open(video, "rb") as fh:
+            again = client.post("/analyze", files={"file": ("copy.mp4", fh, "video/mp4")}, data={"privacy_mode": "true"})
+        assert again.json()["cache"]["hit"] is True
+        assert again.json()["source"]["filename"] == "copy.mp4"
+        assert again.json()["ensemble"] == r.json()["ensemble"]
+
+        monkeypatch.setattr(config, "MAX_UPLOAD_BYTES", 1024)
+        with open(video, "rb") as fh:
+            r = client.post("/analyze", files={"file": (video.name, fh, "video/mp4")}, data={"privacy_mode": "true"})
+        assert r.status_code == 413
+
+
+def test_upload_limit_middleware_rejects_by_content_length():
+    small = FastAPI()
+    small.add_middleware(UploadLimitMiddleware, max_bytes=100)
+
+    @small.post("/echo")
+    async def echo(request: Request):
+        return {"n": len(await request.body())}
+
+    client = TestClient(small)
+    assert client.post("/echo", content=b"x" * 50).json() == {"n": 50}
+    assert client.post("/echo", content=b"x" * 500).status_code == 413
+
+
+def test_upload_limit_middleware_rejects_chunked_multipart():
+    small = FastAPI()
+    small.add_middleware(UploadLimitMiddleware, max_bytes=1000)
+
+    @small.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"n": len(await file.read())}
+
+    def multipart(size):
+        # A generator body is sent chunked, without Content-Length
+        yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.bin"\r\n\r\n'
+        for _ in range(size // 100):
+            yield b"x" * 100
+        yield b"\r\n--b--\r\n"
+
+    client = TestClient(small)
+    headers = {"content-type": "multipart/form-data; boundary=b"}
+    assert client.post("/upload", content=multipart(500), headers=headers).json() == {"n": 500}
+    r = client.post("/upload", content=multipart(5000), headers=headers)
+    assert r.status_code == 413 and r.json() == {"detail": "Request body too large"}
+
+
+def test_heatmap_endpoint_renders_stored_frame(tmp_path, monkeypatch):
+    import json
+    import numpy as np
+    from deepforensics.app import prnu
+
+    monkeypatch.setattr(config, "REPORTS_DIR", tmp_path)
+    frame = np.full((60, 80, 3), 100, np.uint8)
+    data = prnu.save_heatmap_data(tmp_path / "heatmap_frame_002.npz", frame,
+                                  [((10, 10, 20, 20), np.full((20, 20), 200, np.uint8))], [0.7])
+    report = {"task_id": "t1", "prnu": {"heatmap_frames": [
+        {"frame_index": 2, "score": 0.7, "faces": 1, "data": data.as_posix()},
+    ]}}
+    (tmp_path / "t1.json").write_text(json.dumps(report))
+
+    client = TestClient(app)
+    r = client.get("/report/t1/heatmap/2")
+    assert r.status_code == 200 and r.headers["content-type"] == "image/png"
+    assert r.content[:8] == b"\x89PNG\r\n\x1a\n"
+    assert client.get("/report/t1/heatmap/3").status_code == 404
+    data.unlink()
+    assert client.get("/report/t1/heatmap/2").status_code == 410
+
+
+def test_report_and_blob_conditional_requests_and_gzip(tmp_path, monkeypatch):
+    from deepforensics.app import blobs, reports
+
+    monkeypatch.setattr(config, "REPORTS_DB", tmp_path / "reports.sqlite3")
+    monkeypatch.setattr(config, "BLOB_DIR", tmp_path / "blobs")
+    png = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 8
+    name = blobs.get_store().put(png, ".png")
+    assert blobs.get_store().put(png, ".png") == name
+    report = {"task_id": "t2", "prnu": {"heatmap_frames": [{"frame_index": 0, "image": blobs.blob_url(name)}]},
+              "ml": {"explanation": "x" * 4000}}
+    try:
+        reports.get_store().put(report)
+        client = TestClient(app)
+        r = client.get("/report/t2", headers={"Accept-Encoding": "gzip"})
+        assert r.status_code == 200 and r.json() == report
+        assert r.headers["content-encoding"] == "gzip" and r.headers["etag"]
+        again = client.get("/report/t2", headers={"If-None-Match": r.headers["etag"]})
+        assert again.status_code == 304 and again.content == b""
+
+        b = client.get(report["prnu"]["heatmap_frames"][0]["image"], headers={"Accept-Encoding": "gzip"})
+        assert b.status_code == 200 and b.content == png and b.headers["content-type"] == "image/png"
+        assert "content-encoding" not in b.headers and "immutable" in b.headers["cache-control"]
+        assert client.get(f"/blobs/{name}", headers={"If-None-Match": b.headers["etag"]}).status_code == 304
+        assert client.get("/blobs/" + "0" * 64 + ".png").status_code == 404
+        assert client.get("/blobs/..%2Fsecret").status_code == 404
+    finally:
+        reports.shutdown_store()
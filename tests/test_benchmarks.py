@@ -0,0 +1,38 @@
+import importlib.util
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+_spec = importlib.util.spec_from_file_location("bench_pipeline", ROOT / "benchmarks" / "bench_pipeline.py")
+bench = sys.modules["bench_pipeline"] = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(bench)
+
+
+def test_compare_flags_slow_or_larger_stages_only():
+    baseline = {"clips": {"small": {
+        "decode_frames": {"wall_s": 0.1, "cpu_s": 0.1, "peak_rss_mb": 200.0},
+        "ml.predict": {"wall_s": 0.001, "cpu_s": 0.001, "peak_rss_mb": 200.0},
+    }}}
+    R = bench.StageResult
+    ok = {"small": {"decode_frames": R(0.12, 0.5, 210.0), "ml.predict": R(0.02, 0.02, 200.0), "new_stage": R(9.0, 9.0, 999.0)}}
+    assert bench.compare(ok, baseline, tolerance=0.3, slack_s=0.05) == []
+    slow = {"small": {"decode_frames": R(0.2, 0.1, 300.0)}}
+    found = bench.compare(slow, baseline, tolerance=0.3, slack_s=0.05)
+    assert len(found) == 2 and found[0].startswith("small/decode_frames: wall")
+
+
+@pytest.mark.skipif(os.environ.get("DF_RUN_BENCH") != "1", reason="set DF_RUN_BENCH=1 to run the benchmark gate")
+@pytest.mark.skipif(shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None, reason="ffmpeg/ffprobe not available")
+def test_small_clip_has_no_stage_regressions():
+    calibration_s = bench.calibrate()
+    results = bench.run(["small"], repeat=3)
+    calibration_s = (calibration_s + bench.calibrate()) / 2.0
+    assert set(results["small"]) == set(bench.STAGES)
+    baseline = json.loads(bench.BASELINE_PATH.read_text())
+    print("\n" + bench.format_table(results, baseline, calibration_s))
+    assert bench.compare(results, baseline, tolerance=0.3, slack_s=0.05, calibration_s=calibration_s) == []
@@ -0,0 +1,81 @@
+from pathlib import Path
+import os
+import tempfile
+import time
+
+import pytest
+
+from deepforensics.app import cache, config
+
+
+@pytest.fixture(autouse=True)
+def cache_enabled(monkeypatch):
+    monkeypatch.setattr(config, "RESULT_CACHE_ENABLED", True)
+
+
+def _report(tag: str, heatmap: str | None = None):
+    frames = []
+    if heatmap and not heatmap.startswith("data:"):
+        frames = [{"frame_index": 0, "score": 0.5, "faces": 1, "data": heatmap}]
+    return {
+        "task_id": f"task-{tag}",
+        "source": {"filename": "a.mp4", "sha256": tag},
+        "ml": {"score": 0.1},
+        "prnu": {"similarity": 0.9, "heatmap_image": heatmap, "heatmap_images": [heatmap] if heatmap else None,
+                 "heatmap_frames": frames, "residual_images": []},
+        "ensemble": {"weighted_score": 0.2, "decision": "SAFE"},
+        "evidence": {"frames": [], "residuals": []},
+        "timestamps": {"started_at": "x", "finished_at": "y"},
+    }
+
+
+def test_key_depends_on_content_settings_and_device(monkeypatch):
+    base = cache.make_key("abc", None, True)
+    assert base == cache.make_key("abc", None, True)
+    assert base != cache.make_key("abd", None, True)
+    assert base != cache.make_key("abc", "cam1", True)
+    assert base != cache.make_key("abc", None, False)
+    monkeypatch.setattr(config, "FRAME_COUNT", config.FRAME_COUNT + 1)
+    assert base != cache.make_key("abc", None, True)
+    key = cache.make_key("abc", None, True)
+    monkeypatch.setattr(config, "PRNU_PCE_THRESHOLD", config.PRNU_PCE_THRESHOLD * 2)
+    assert key != cache.make_key("abc", None, True)
+    key = cache.make_key("abc", None, True)
+    monkeypatch.setattr(config, "PRNU_PCE_SCALES", (1.0,))
+    assert key != cache.make_key("abc", None, True)
+    monkeypatch.setattr(config, "ML_PROVIDER", "ollama")
+    key = cache.make_key("abc", None, True)
+    monkeypatch.setattr(config, "THUMBNAIL_COUNT", config.THUMBNAIL_COUNT + 1)
+    assert key != cache.make_key("abc", None, True)
+    key = cache.make_key("abc", None, True)
+    monkeypatch.setattr(config, "OLLAMA_ENABLE_VISION", not config.OLLAMA_ENABLE_VISION)
+    assert key != cache.make_key("abc", None, True)
+
+
+def test_privacy_mode_entries_keep_no_artifacts():
+    with tempfile.TemporaryDirectory() as td:
+        rc = cache.ResultCache(root=Path(td))
+        rc.put("k", _report("a", heatmap="data:image/png;base64,AAAA"), privacy_mode=True)
+        got = rc.get("k")
+        assert got["prnu"]["heatmap_image"] is None and got["prnu"]["heatmap_images"] is None
+        assert "evidence" not in got and "task_id" not in got
+        assert got["ensemble"]["decision"] == "SAFE"
+
+
+def test_missing_evidence_invalidates_and_lru_evicts():
+    with tempfile.TemporaryDirectory() as td:
+        rc = cache.ResultCache(root=Path(td) / "results", max_entries=2)
+        heat = Path(td) / "heat.npz"
+        heat.write_bytes(b"npz")
+        rc.put("kept", _report("a", heatmap=str(heat)), privacy_mode=False)
+        assert rc.get("kept") is not None
+        heat.unlink()
+        assert rc.get("kept") is None
+
+        for i, key in enumerate(["k1", "k2"]):
+            rc.put(key, _report(key), privacy_mode=True)
+            os.utime(rc._path(key), (time.time() - 100 + i, time.time() - 100 + i))
+        rc.get("k1")  # refresh k1 so k2 is the least recently used
+        rc.put("k3", _report("k3"), privacy_mode=True)
+        assert rc.get("k2") is None
+        assert rc.get("k1") is not None and rc.get("k3") is not None
@@ -0,0 +1,41 @@
+from pathlib import Path
+import json
+import shutil
+
+import pytest
+
+from deepforensics.__main__ import main
+from deepforensics.app import utils
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg/ffprobe not available")
+def test_batch_streams_jsonl_and_resumes_by_content_hash(tmp_path, capsys, monkeypatch):
+    from deepforensics.app import config
+
+    monkeypatch.setattr(config, "CACHE_DIR", tmp_path / "cache")  # results of other tests must not be reused
+    videos = tmp_path / "videos"
+    (videos / "sub").mkdir(parents=True)
+    for name, src in [("a.mp4", "testsrc"), ("sub/b.mp4", "testsrc2")]:
+        code, _, _ = utils.run_cmd([
+            "ffmpeg", "-y", "-f", "lavfi", "-i", f"{src}=size=160x120:rate=5:duration=1", str(videos / name)
+        ])
+        assert code == 0
+    shutil.copy(videos / "a.mp4", videos / "a_copy.mp4")
+    (videos / "notes.txt").write_text("not a video")
+    out = tmp_path / "results.jsonl"
+
+    assert main(["batch", str(videos), "--out", str(out), "--workers", "2"]) == 0
+    lines = [json.loads(line) for line in out.read_text().splitlines()]
+    assert [rec["status"] for rec in lines] == ["ok", "ok"]
+    assert {rec["sha256"] for rec in lines} == {utils.sha256_file(videos / "a.mp4"), utils.sha256_file(videos / "sub/b.mp4")}
+    assert all("decision" in rec["report"]["ensemble"] and rec["report"]["timings"] for rec in lines)
+    summary = capsys.readouterr().out
+    assert "2 analysed, 1 skipped, 0 failed" in summary and "videos/min" in summary and "prnu" in summary
+
+    assert main(["batch", str(videos), "--out", str(out)]) == 0
+    assert len(out.read_text().splitlines()) == 2
+    assert "0 analysed, 3 skipped" in capsys.readouterr().out
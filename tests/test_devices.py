@@ -0,0 +1,155 @@
+from pathlib import Path
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from deepforensics.app import config, devices, prnu, utils
+
+
+def _state(tmp: Path, seed: int, n: int = 4) -> Path:
+    rng = np.random.default_rng(seed)
+    acc = prnu.PRNUAccumulator().update_many(
+        rng.standard_normal((n, 16, 24)).astype(np.float32), rng.uniform(0.2, 0.8, (n, 16, 24)).astype(np.float32)
+    )
+    path = tmp / f"state_{seed}.npz"
+    np.savez(path, **acc.state())
+    return path
+
+
+def test_incremental_enrollment_matches_one_shot_and_dedupes(tmp_path):
+    a, b, c = (_state(tmp_path, s) for s in (1, 2, 3))
+    inc = devices.DeviceStore(root=tmp_path / "inc")
+    inc.add("cam1", [("sha-a", "a.mp4", a)])
+    meta, added = inc.add("cam1", [("sha-b", "b.mp4", b), ("sha-a", "a-again.mp4", a), ("sha-c", "c.mp4", c)])
+    assert added == ["sha-b", "sha-c"]
+    assert meta["frames"] == 12 and meta["resolution"] == [16, 24]
+    assert set(meta["sources"]) == {"sha-a", "sha-b", "sha-c"}
+    assert inc.add("cam1", [("sha-b", "b.mp4", b)])[1] == []
+
+    one = devices.DeviceStore(root=tmp_path / "one")
+    one.add("cam1", [("sha-a", "a.mp4", a), ("sha-b", "b.mp4", b), ("sha-c", "c.mp4", c)])
+    fp_inc = np.load(devices.fingerprint_path("cam1", inc.root))
+    fp_one = np.load(devices.fingerprint_path("cam1", one.root))
+    assert np.allclose(fp_inc, fp_one, atol=1e-6)
+    assert json.loads((inc.root / "device_cam1" / "meta.json").read_text())["frames"] == 12
+    assert not [p for p in inc.root.rglob("*.tmp")]
+
+    with pytest.raises(ValueError):
+        inc.add("../evil", [("sha-a", "a.mp4", a)])
+
+
+def test_legacy_fingerprint_is_not_overwritten(tmp_path, monkeypatch):
+    from deepforensics.app.api import app
+
+    monkeypatch.setattr(config, "FINGERPRINT_DIR", tmp_path / "fp")
+    store = devices.DeviceStore()
+    legacy = np.arange(16 * 24, dtype=np.float32).reshape(16, 24)
+    utils.safe_mkdir(store.root)
+    np.save(devices.fingerprint_path("old", store.root), legacy)
+    assert store.is_legacy("old")
+    with pytest.raises(devices.LegacyFingerprint, match="enroll all of its footage again"):
+        store.add("old", [("sha-a", "a.mp4", _state(tmp_path, 5))])
+    assert np.array_equal(np.load(devices.fingerprint_path("old", store.root)), legacy)
+
+    r = TestClient(app).post("/enroll", data={"device_id": "old"}, files=[("files", ("a.mp4", b"not a video", "video/mp4"))])
+    assert r.status_code == 409 and "device_old.npy" in r.json()["detail"]
+    assert np.array_equal(np.load(devices.fingerprint_path("old", store.root)), legacy)
+
+
+def test_concurrent_adds_of_same_source_count_it_once(tmp_path):
+    store = devices.DeviceStore(root=tmp_path / "fp")
+    state = _state(tmp_path, 4)
+    threads = [threading.Thread(target=store.add, args=("cam2", [("sha-x", "x.mp4", state)])) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert store.meta("cam2")["frames"] == 4
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None, reason="ffmpeg/ffprobe not available")
+def test_enroll_endpoint_only_processes_new_footage(tmp_path, monkeypatch):
+    from deepforensics.app.api import app
+
+    monkeypatch.setattr(config, "FINGERPRINT_DIR", tmp_path / "fp")
+    monkeypatch.setattr(devices, "_store", None)
+    videos = []
+    for i, src in enumerate(["testsrc", "testsrc2"]):
+        v = tmp_path / f"v{i}.mp4"
+        code, _, _ = utils.run_cmd(["ffmpeg", "-y", "-f", "lavfi", "-i", f"{src}=size=160x120:rate=5:duration=1", str(v)])
+        assert code == 0
+        videos.append(v)
+    client = TestClient(app)
+
+    def enroll(paths):
+        files = [("files", (p.name, open(p, "rb"), "video/mp4")) for p in paths]
+        r = client.post("/enroll", data={"device_id": "cam3"}, files=files)
+        assert r.status_code == 200, r.text
+        return r.json()
+
+    first = enroll(videos[:1])
+    assert first["status"] == "enrolled" and first["added"] == ["v0.mp4"]
+    second = enroll(videos)
+    assert second["added"] == ["v1.mp4"] and second["skipped"] == ["v0.mp4"]
+    assert second["sources"] == 2 and second["frames"] > first["frames"]
+    assert enroll(videos[:1])["status"] == "unchanged"
+    assert devices.fingerprint_path("cam3").exists()
+
+
+def test_fingerprint_index_identifies_source_and_tracks_enrollments(tmp_path, monkeypatch):
+    rng = np.random.default_rng(8)
+    fps = rng.standard_normal((40, 48, 64)).astype(np.float32)
+    for i, fp in enumerate(fps):
+        np.save(devices.fingerprint_path(f"cam{i}", tmp_path), fp)
+    np.save(devices.fingerprint_path("wide", tmp_path), rng.standard_normal((48, 96)).astype(np.float32))
+
+    index = devices.FingerprintIndex(root=tmp_path, sketch_dim=1024)
+    clip = fps[17] + 3.0 * rng.standard_normal((48, 64)).astype(np.float32)
+    ranked = index.identify(clip, top_k=3, candidates=4)
+    assert len(index) == 41
+    assert ranked[0]["device_id"] == "cam17"
+    expected = np.corrcoef(clip.ravel(), fps[17].ravel())[0, 1]
+    assert abs(ranked[0]["correlation"] - expected) < 1e-4
+    assert ranked[0]["correlation"] > ranked[1]["correlation"]
+    ref = index.fingerprint("cam17")
+    assert ref.shape == (48, 64) and abs(float(np.linalg.norm(ref)) - 1.0) < 1e-4
+
+    # A cropped clip is found by PCE although full-frame correlation cannot see it; only the
+    # best `pce_top` of the pre-ranked candidates get the multi-scale search
+    calls = []
+    pce_match = prnu.pce_match
+
+    def counting(*args, **kwargs):
+        calls.append(len(kwargs["scales"]))
+        return pce_match(*args, **kwargs)
+
+    monkeypatch.setattr(prnu, "pce_match", counting)
+    cropped = fps[17][4:40, 8:56] + 0.5 * rng.standard_normal((36, 48)).astype(np.float32)
+    ranked = index.identify(cropped, top_k=3, candidates=64, method="pce", pce_top=2)
+    assert ranked[0]["device_id"] == "cam17" and ranked[0]["shift"] == [4, 8]
+    assert ranked[0]["similarity"] > 0.9 > ranked[1]["similarity"]
+    assert calls.count(1) == 41 and calls.count(len(config.PRNU_PCE_SCALES)) == 2
+    calls.clear()
+    index.identify(cropped, candidates=4, method="pce", pce_top=2)
+    assert len(calls) == 4 + 1 + 2  # candidates of both resolution groups, then the top two
+
+    signature = index.signature()
+    before = index.reference("cam17")
+    # A generation written later by another process is not this index's to delete
+    newer = tmp_path / "index" / "matrix_48x64.ffffffffffff.f32"
+    newer.write_bytes(b"")
+    os.utime(newer, ns=(time.time_ns() + 10**12, time.time_ns() + 10**12))
+    np.save(devices.fingerprint_path("cam40", tmp_path), fps[3])
+    assert index.signature() != signature
+    assert index.fingerprint("cam40") is not None and len(index) == 42
+    current = {f"matrix_48x64.{index.signature()[:12]}.f32", f"matrix_48x96.{index.signature()[:12]}.f32"}
+    # one per resolution, the older generation removed
+    assert {p.name for p in (tmp_path / "index").glob("matrix_*")} == current | {newer.name}
+    # A reference taken before the refresh still reads its own generation, with its own key
+    assert np.allclose(before[0], index.fingerprint("cam17")) and before[1] == index.spectrum_key("cam17")
@@ -0,0 +1,20 @@
+import pytest
+
+from deepforensics.app import config, ensemble
+
+
+def test_temporal_term_is_added_without_rescaling_the_other_weights(monkeypatch):
+    base = ensemble.score_and_decide(0.5, 0.6, 0.0)
+    assert base["weighted_score"] == pytest.approx(0.6 * 0.5 + 0.3 * 0.4)
+    assert base["decision"] == "SUSPECT"
+    assert ensemble.score_and_decide(0.5, 0.6, 0.0, None) == base
+
+    # The pipeline always passes the temporal score: a consistent clip (0.0) keeps its score and decision
+    assert config.W_TEMPORAL > 0
+    assert ensemble.score_and_decide(0.5, 0.6, 0.0, 0.0) == base
+    spliced = ensemble.score_and_decide(0.5, 0.6, 0.0, 1.0)
+    assert spliced["weighted_score"] == pytest.approx(0.42 + config.W_TEMPORAL)
+    assert ensemble.score_and_decide(1.0, 0.0, 1.0, 1.0)["weighted_score"] == 1.0
+
+    monkeypatch.setattr(config, "W_TEMPORAL", 0.0)
+    assert ensemble.score_and_decide(0.5, 0.6, 0.0, 1.0) == base
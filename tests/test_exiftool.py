@@ -0,0 +1,87 @@
+from pathlib import Path
+import sys
+import tempfile
+import textwrap
+import pytest
+
+from deepforensics.app import exiftool, utils
+
+
+FAKE_EXIFTOOL = textwrap.dedent("""
+    import json, sys, time
+    if "-stay_open" not in sys.argv:  # one-shot: exiftool -j ... <path>
+        print(json.dumps([{"SourceFile": sys.argv[-1], "Model": "OneShot"}]))
+        sys.exit(0)
+    args = []
+    for line in sys.stdin:
+        line = line.rstrip("\\n")
+        if line.startswith("-execute"):
+            path = args[-1]
+            if "crash" in path and "crashed" not in open(sys.argv[1]).read():
+                open(sys.argv[1], "a").write("crashed")
+                sys.exit(1)
+            if "hang" in path:
+                time.sleep(30)
+            print(json.dumps([{"SourceFile": path, "Model": "FakeCam", "CreateDate": "2024:01:01 00:00:00"}]))
+            print("{ready%s}" % line[len("-execute"):], flush=True)
+            args = []
+        elif args[-1:] == ["-stay_open"] and line == "False":
+            break
+        else:
+            args.append(line)
+""")
+
+
+def _fake_command(td: Path):
+    script = td / "fake_exiftool.py"
+    script.write_text(FAKE_EXIFTOOL)
+    state = td / "state.txt"
+    state.write_text("")
+    return [sys.executable, str(script), str(state)]
+
+
+def test_pool_reuses_worker_and_parses_json():
+    with tempfile.TemporaryDirectory() as td:
+        pool = exiftool.ExifToolPool(size=1, command=_fake_command(Path(td)))
+        try:
+            a = pool.execute(Path("a.mp4"))
+            worker = pool._workers[0]
+            pid = worker._proc.pid
+            b = pool.execute(Path("b.mp4"))
+            assert a["Model"] == "FakeCam" and a["SourceFile"] == "a.mp4"
+            assert b["SourceFile"] == "b.mp4"
+            assert worker._proc.pid == pid
+        finally:
+            pool.close()
+
+
+def test_pool_restarts_after_crash_and_times_out():
+    with tempfile.TemporaryDirectory() as td:
+        pool = exiftool.ExifToolPool(size=1, command=_fake_command(Path(td)))
+        try:
+            pool.execute(Path("warm.mp4"))
+            # First call kills the worker; the pool retries on a fresh process
+            assert pool.execute(Path("crash.mp4"))["Model"] == "FakeCam"
+            with pytest.raises(exiftool.ExifToolTimeout):
+                pool.execute(Path("hang.mp4"), timeout=0.5)
+            assert pool.execute(Path("after.mp4"))["SourceFile"] == "after.mp4"
+        finally:
+            pool.close()
+
+
+def test_paths_with_newlines_never_reach_the_argfile():
+    with tempfile.TemporaryDirectory() as td:
+        command = _fake_command(Path(td))
+        pool = exiftool.ExifToolPool(size=1, command=command)
+        try:
+            evil = Path(td) / "clip.mp4\n-o\n/tmp/owned\n-execute9"
+            with pytest.raises(exiftool.ExifToolUnsafePath):
+                pool.execute(evil)
+            assert not pool._workers[0].alive  # nothing was written to a worker
+            assert pool.execute(Path("next.mp4"))["SourceFile"] == "next.mp4"
+            once = exiftool.run_once(evil, command=command)
+            assert once == {"SourceFile": str(evil), "Model": "OneShot"}
+        finally:
+            pool.close()
+    assert utils.safe_filename("clip.mp4\n-o\r\n/tmp/owned") == "owned"
+    assert utils.safe_filename("clip.mp4\n-o\r-w") == "clip.mp4_-o_-w"
@@ -2,6 +2,7 @@ from pathlib import Path
 import os
 import tempfile
 import shutil
+import numpy as np
 import pytest
 
 from deepforensics.app import ingest, utils
@@ -25,3 +26,66 @@ def test_sample_frames_returns_expected_count():
         assert 1 <= len(frames) <= 10
         assert info["frame_count"] == len(frames)
 
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg/ffprobe not available")
+def test_decode_frames_matches_png_sampling():
+    with tempfile.TemporaryDirectory() as td:
+        td_path = Path(td)
+        video = td_path / "gen.mp4"
+        code, out, err = utils.run_cmd([
+            "ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc=size=320x240:rate=10:duration=2", str(video)
+        ])
+        assert code == 0, f"ffmpeg gen failed: {err}"
+        stack, info = ingest.decode_frames(video, target_frames=10, resize_width=160)
+        paths, _ = ingest.sample_frames(video, td_path / "frames", target_frames=10, resize_width=160)
+        assert stack.dtype == np.uint8
+        assert stack.shape == (len(paths), 120, 160, 3)
+        assert info["frame_count"] == len(paths)
+        for arr, p in zip(stack, paths):
+            assert np.array_equal(arr, ingest.load_frame(p))
+
+
+def test_compute_frame_indices_matches_stride_select():
+    for nb_frames, target in [(300, 30), (95, 30), (20, 30), (1, 30), (1000, 7)]:
+        step = max(1, nb_frames // target)
+        kept = [n for n in range(nb_frames) if n % step == 0][:target]
+        assert ingest.compute_frame_indices(nb_frames, target) == kept
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg/ffprobe not available")
+def test_seek_sampling_matches_strided_frames():
+    with tempfile.TemporaryDirectory() as td:
+        video = Path(td) / "gen.mp4"
+        code, out, err = utils.run_cmd([
+            "ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc=size=320x240:rate=10:duration=3",
+            "-g", "7", str(video)
+        ])
+        assert code == 0, f"ffmpeg gen failed: {err}"
+        strided, s_info = ingest.decode_frames(video, target_frames=6, resize_width=160, sampling="stride")
+        seeked, k_info = ingest.decode_frames(video, target_frames=6, resize_width=160, sampling="seek")
+        assert s_info["frame_step"] == k_info["frame_step"] == 5
+        assert s_info["source_frames"] == k_info["source_frames"] == [0, 5, 10, 15, 20, 25]
+        assert seeked.shape == strided.shape == (6, 120, 160, 3)
+        assert np.array_equal(seeked, strided)
+        keyframes, _ = ingest.decode_frames(video, target_frames=6, resize_width=160, sampling="keyframe")
+        assert keyframes.shape[1:] == (120, 160, 3)
+        assert 1 <= len(keyframes) <= 6
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg/ffprobe not available")
+def test_keyframe_sampling_returns_each_keyframe_once():
+    with tempfile.TemporaryDirectory() as td:
+        video = Path(td) / "gop.mp4"
+        # GOP of 25 frames, sampling step of 2: up to 13 targets snap to each keyframe
+        code, out, err = utils.run_cmd([
+            "ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc=size=320x240:rate=10:duration=6",
+            "-g", "25", "-keyint_min", "25", "-sc_threshold", "0", str(video)
+        ])
+        assert code == 0, f"ffmpeg gen failed: {err}"
+        assert ingest.keyframe_times(video) == [0.0, 2.5, 5.0]
+        keyframes, info = ingest.decode_frames(video, target_frames=30, resize_width=160, sampling="keyframe")
+        assert info["frame_count"] == len(keyframes) == 3
+        assert info["source_frames"] == [0, 25, 50]
+        strided, _ = ingest.decode_frames(video, target_frames=60, resize_width=160, sampling="stride")
+        assert np.array_equal(keyframes, strided[[0, 25, 50]])
@@ -0,0 +1,101 @@
+from pathlib import Path
+import shutil
+import tempfile
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+
+from deepforensics.app import jobs, utils
+from deepforensics.app.api import app
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+def test_job_manager_reports_progress_and_bounds_queue():
+    release = threading.Event()
+
+    def work(x, progress=None):
+        progress("stage_a", 0.5)
+        release.wait(5)
+        return {"value": x}
+
+    mgr = jobs.JobManager(max_workers=1, max_pending=1)
+    try:
+        job = mgr.submit("t1", work, 7)
+        rejected = []
+        with pytest.raises(jobs.JobQueueFull):
+            mgr.submit("t2", work, 8, on_reject=lambda: rejected.append(True))
+        assert rejected == [True]
+        release.set()
+        deadline = time.time() + 5
+        while not job.finished and time.time() < deadline:
+            time.sleep(0.01)
+        assert job.snapshot()["report"] == {"value": 7}
+        stages = [e["stage"] for e in job.wait_events(0, 0)]
+        assert "stage_a" in stages and stages[-1] == "done"
+    finally:
+        mgr.shutdown()
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg/ffprobe not available")
+def test_jobs_endpoint_runs_pipeline_in_background():
+    client = TestClient(app)
+    with tempfile.TemporaryDirectory() as td:
+        video = Path(td) / "gen.mp4"
+        code, out, err = utils.run_cmd([
+            "ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc=size=160x120:rate=5:duration=1", str(video)
+        ])
+        assert code == 0
+        with open(video, "rb") as fh:
+            r = client.post("/jobs", files={"file": (video.name, fh, "video/mp4")}, data={"privacy_mode": "true"})
+        assert r.status_code == 202, r.text
+        task_id = r.json()["task_id"]
+
+        events = client.get(f"/jobs/{task_id}/events")
+        assert events.headers["content-type"].startswith("text/event-stream")
+        assert "event: done" in events.text
+
+        status = client.get(f"/jobs/{task_id}").json()
+        assert status["status"] == "done"
+        assert status["report"]["task_id"] == task_id
+        assert client.get(f"/report/{task_id}").status_code == 200
+        assert client.get("/jobs/does-not-exist").status_code == 404
+
+
+def test_next_events_wakes_on_emit_and_shutdown_fails_queued_jobs():
+    import asyncio
+
+    release = threading.Event()
+    cleaned = []
+
+    def work(x, progress=None):
+        release.wait(5)
+        return {"value": x}
+
+    mgr = jobs.JobManager(max_workers=1, max_pending=4)
+    running = mgr.submit("t1", work, 1)
+    queued = mgr.submit("t2", work, 2, on_reject=lambda: cleaned.append("t2"))
+
+    async def wait_for_done():
+        seen = 0
+        while True:
+            events = await running.next_events(seen, 5.0)
+            seen += len(events)
+            if events and events[-1]["event"] == "done":
+                return events[-1]
+
+    async def scenario():
+        waiter = asyncio.ensure_future(wait_for_done())
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        mgr.shutdown()  # t2 is still queued behind t1
+        release.set()
+        return await asyncio.wait_for(waiter, 5)
+
+    assert asyncio.run(scenario())["status"] == "done"
+    assert queued.status == "failed" and queued.status_code == 503
+    assert queued.wait_events(0, 0)[-1]["event"] == "failed"
+    assert cleaned == ["t2"]
@@ -0,0 +1,45 @@
+from pathlib import Path
+import tempfile
+import shutil
+import pytest
+
+from deepforensics.app import config, ingest, media, metadata as metadata_mod, utils
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg/ffprobe not available")
+def test_probe_media_is_cached_by_content(monkeypatch):
+    with tempfile.TemporaryDirectory() as td:
+        td_path = Path(td)
+        monkeypatch.setattr(config, "CACHE_DIR", td_path / "cache")
+        video = td_path / "gen.mp4"
+        code, out, err = utils.run_cmd([
+            "ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc=size=160x120:rate=5:duration=2", str(video)
+        ])
+        assert code == 0
+        # Privacy mode probes but keeps nothing on disk
+        private = media.probe_media(video, privacy_mode=True)
+        assert private.nb_frames == 10 and not list((td_path / "cache").rglob("*.json"))
+        info = media.probe_media(video)
+        assert info.sha256 == utils.sha256_file(video)
+        assert info.nb_frames == 10
+        assert abs(info.duration - 2.0) < 0.1
+        assert "filename" not in info.probe.get("format", {})
+
+        # A renamed copy of the same content must not spawn ffprobe/exiftool again
+        copy = td_path / "renamed.mp4"
+        shutil.copy(video, copy)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("subprocess should not run on a cache hit")
+
+        monkeypatch.setattr(utils, "ffprobe_json", fail)
+        monkeypatch.setattr(utils, "exiftool_dict", fail)
+        cached = media.probe_media(copy)
+        assert cached.probe == info.probe
+        assert ingest.compute_frame_step(copy, 5, media=cached) == 2
+        details, flags, score = metadata_mod.analyze(copy, cached)
+        assert isinstance(flags, list)
@@ -0,0 +1,116 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from deepforensics.app import config, ml, ollama
+
+
+class FakeOllama(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        st = self.server.state
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with st["lock"]:
+            st["requests"].append((self.path, self.client_address[1], body))
+            st["active"] += 1
+            st["peak"] = max(st["peak"], st["active"])
+        time.sleep(st["delay"] if self.path == "/api/chat" else 0)
+        with st["lock"]:
+            st["active"] -= 1
+        reply = {"model": body["model"], "done": True}
+        if self.path == "/api/chat":
+            reply["message"] = {"role": "assistant", "content": json.dumps({"score": 0.8, "verdict": "MANIPULATED", "confidence": "high"})}
+        data = json.dumps(reply).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def fake_ollama(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllama)
+    server.state = {"lock": threading.Lock(), "requests": [], "active": 0, "peak": 0, "delay": 0.0}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(config, "CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(config, "OLLAMA_HOST", f"http://127.0.0.1:{server.server_address[1]}")
+    yield server
+    ollama.shutdown_client()
+    server.shutdown()
+    server.server_close()
+
+
+def test_client_reuses_connection_caches_and_preloads(fake_ollama):
+    client = ollama.OllamaClient(config.OLLAMA_HOST, "llava:7b", timeout=5, max_inflight=1, keep_alive="30m")
+    assert client.preload()
+    first = client.chat("prompt", ["aW1n"])
+    second = client.chat("prompt", ["aW1n"])
+    third = client.chat("prompt", ["b3RoZXI="])
+    assert (first["cached"], second["cached"], third["cached"]) == (False, True, False)
+    reqs = fake_ollama.state["requests"]
+    assert [r[0] for r in reqs] == ["/api/generate", "/api/chat", "/api/chat"]
+    assert reqs[0][2]["keep_alive"] == "30m" and reqs[1][2]["keep_alive"] == "30m"
+    assert reqs[1][2]["messages"][0]["images"] == ["aW1n"]
+    assert len({r[1] for r in reqs}) == 1  # one keep-alive connection
+    client.close()
+
+
+def test_concurrent_calls_are_bounded_and_identical_ones_shared(fake_ollama):
+    fake_ollama.state["delay"] = 0.1
+    client = ollama.OllamaClient(config.OLLAMA_HOST, "llava:7b", timeout=5, max_inflight=2)
+    prompts = [f"p{i % 4}" for i in range(12)]
+    results = [None] * len(prompts)
+
+    def call(i):
+        results[i] = client.chat(prompts[i])
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(prompts))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert fake_ollama.state["peak"] <= 2
+    assert len(fake_ollama.state["requests"]) == 4  # one generation per distinct prompt
+    assert sum(not r["cached"] for r in results) == 4
+    client.close()
+
+
+def test_predict_uses_shared_client(fake_ollama, monkeypatch):
+    monkeypatch.setattr(config, "ML_PROVIDER", "ollama")
+    out = ml.predict("clip.mp4", [], [{"frame_index": 0, "bbox": [0, 0, 1, 1], "score": 0.9}], ["aW1n"])
+    assert out["provider"] == "ollama:" + config.OLLAMA_MODEL and out["score"] == 0.8
+    assert out["raw_response"]["cached"] is False
+    again = ml.predict("clip.mp4", [], [{"frame_index": 0, "bbox": [0, 0, 1, 1], "score": 0.9}], ["aW1n"])
+    assert again["raw_response"]["cached"] is True
+    assert len(fake_ollama.state["requests"]) == 1
+
+
+def test_privacy_mode_answers_are_not_cached_on_disk(fake_ollama, monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "ML_PROVIDER", "ollama")
+    faces = [{"frame_index": 0, "bbox": [0, 0, 1, 1], "score": 0.9}]
+    out = ml.predict("clip.mp4", [], faces, ["aW1n"], privacy_mode=True)
+    assert out["score"] == 0.8 and out["raw_response"]["cached"] is False
+    assert not list((tmp_path / "cache").rglob("*.json"))
+    again = ml.predict("clip.mp4", [], faces, ["aW1n"], privacy_mode=True)
+    assert again["raw_response"]["cached"] is False
+    assert len(fake_ollama.state["requests"]) == 2
+
+
+def test_predict_sends_every_thumbnail_under_its_label(fake_ollama, monkeypatch):
+    monkeypatch.setattr(config, "ML_PROVIDER", "ollama")
+    monkeypatch.setattr(config, "THUMBNAIL_COUNT", 4)
+    images = ["aW1n", "aW1o", "aW1p", "aW1q", "aW1r"]
+    labels = ["frame 0", "frame 48", "frame 96 (face crop)", "frame 144", "frame 192"]
+    ml.predict("clip.mp4", [], [], images, None, labels)
+    message = fake_ollama.state["requests"][0][2]["messages"][0]
+    assert message["images"] == images[:4]
+    assert "Image 3 is frame 144." in message["content"] and "frame 192" not in message["content"]
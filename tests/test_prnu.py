@@ -1,5 +1,7 @@
+import mmap
 import numpy as np
 import cv2
+import pytest
 
 from deepforensics.app import prnu
 
@@ -14,3 +16,273 @@ def test_extract_residual_shape_and_variance():
     assert resid.shape == (h, w)
     assert float(np.std(resid)) > 0.0
 
+
+
+def test_shared_pool_is_reused_across_calls():
+    frames = np.random.default_rng(0).integers(0, 255, size=(3, 32, 48, 3), dtype=np.uint8)
+    try:
+        pool = prnu.start_pool(workers=2)
+        clip, residuals = prnu.process_frames_for_prnu(frames, keep_residuals=True)
+        assert prnu.get_pool() is pool
+        prnu.process_frames_for_prnu(frames)
+        assert prnu.get_pool() is pool
+        assert clip.shape == (32, 48) and len(residuals) == 3
+        assert np.allclose(residuals[1], prnu.extract_residual(frames[1]), atol=1e-4)
+    finally:
+        prnu.shutdown_pool()
+    assert prnu._pool is None
+
+
+def test_residual_stack_is_the_shared_block_and_freed_with_its_last_view():
+    frames = np.random.default_rng(3).integers(0, 255, size=(4, 24, 40, 3), dtype=np.uint8)
+    try:
+        prnu.start_pool(workers=2)
+        _, residuals = prnu.process_frames_for_prnu(frames, keep_residuals=True)
+    finally:
+        prnu.shutdown_pool()
+    # Read in place from the shared block rather than copied out of it
+    assert not residuals.flags.owndata and isinstance(residuals.base, mmap.mmap)
+    block = residuals.base
+    view = residuals[2]
+    del residuals
+    assert np.allclose(view, prnu.extract_residual(frames[2]), atol=1e-4)
+    assert not block.closed
+    del view
+    assert block.closed  # unmapped together with the last view
+
+
+def test_clip_prnu_streams_batches_through_slot_sized_blocks(monkeypatch):
+    frames = np.random.default_rng(6).integers(0, 255, size=(12, 24, 40, 3), dtype=np.uint8)
+    monkeypatch.setattr(prnu.config, "PRNU_BATCH_SIZE", 2)
+    monkeypatch.setattr(prnu.config, "PRNU_INFLIGHT_PER_REQUEST", 2)
+    sizes = []
+    real = prnu.shared_memory.SharedMemory
+
+    def recording(*args, **kwargs):
+        if kwargs.get("create"):
+            sizes.append(kwargs["size"])
+        return real(*args, **kwargs)
+
+    monkeypatch.setattr(prnu.shared_memory, "SharedMemory", recording)
+    try:
+        prnu.start_pool(workers=2)
+        clip, none = prnu.process_frames_for_prnu(frames)
+        streamed = list(sizes)
+        sizes.clear()
+        clip_kept, stack = prnu.process_frames_for_prnu(frames, keep_residuals=True)
+    finally:
+        prnu.shutdown_pool()
+    assert none is None
+    # 2 slots x 2 frames: residual and frame blocks hold 4 frames, not 12
+    assert streamed == [4 * 24 * 40 * 4, 4 * 24 * 40 * 3]
+    assert sizes[0] == 12 * 24 * 40 * 4
+    assert np.allclose(clip, clip_kept, atol=1e-5)
+    assert np.allclose(clip, prnu.estimate_fingerprint(frames, stack), atol=1e-5)
+
+
+def test_bounded_map_limits_in_flight_and_keeps_order():
+    import concurrent.futures as futures
+    import threading
+    import time
+
+    lock = threading.Lock()
+    state = {"now": 0, "peak": 0}
+
+    def work(x):
+        with lock:
+            state["now"] += 1
+            state["peak"] = max(state["peak"], state["now"])
+        time.sleep(0.01)
+        with lock:
+            state["now"] -= 1
+        return x * 2
+
+    with futures.ThreadPoolExecutor(max_workers=8) as ex:
+        out = prnu._bounded_map(ex, work, range(20), window=3)
+    assert out == [x * 2 for x in range(20)]
+    assert state["peak"] <= 3
+
+
+def test_residuals_from_paths_and_arrays_match(tmp_path):
+    frames = np.random.default_rng(1).integers(0, 255, size=(4, 24, 40, 3), dtype=np.uint8)
+    paths = []
+    for i, fr in enumerate(frames):
+        p = tmp_path / f"frame_{i:04d}.png"
+        cv2.imwrite(str(p), fr)
+        paths.append(p)
+    try:
+        prnu.start_pool(workers=2)
+        clip_a, res_a = prnu.process_frames_for_prnu(frames, keep_residuals=True)
+        clip_p, res_p = prnu.process_frames_for_prnu(paths, keep_residuals=True)
+    finally:
+        prnu.shutdown_pool()
+    assert isinstance(res_a, np.ndarray) and res_a.shape == (4, 24, 40)
+    assert np.allclose(res_a, res_p)
+    assert np.allclose(clip_a, prnu.estimate_fingerprint(frames, list(res_a)), atol=1e-5)
+
+
+@pytest.mark.parametrize("h, w", [(64, 96), (359, 640), (93, 61), (66, 98)])
+def test_batched_residuals_match_per_frame_path(h, w):
+    frames = np.random.default_rng(2).integers(0, 255, size=(3, h, w, 3), dtype=np.uint8)
+    batched = prnu.extract_residuals_batch(frames)
+    assert batched.dtype == np.float32 and batched.shape == (3, h, w)
+    for fr, res in zip(frames, batched):
+        assert np.allclose(res, prnu.extract_residual(fr), atol=1e-3)
+
+
+def test_face_boxes_are_tracked_between_keyframes(monkeypatch):
+    rng = np.random.default_rng(3)
+    texture = cv2.GaussianBlur(rng.integers(0, 255, size=(40, 40), dtype=np.uint8), (5, 5), 0)
+    grays = []
+    for i in range(4):
+        g = np.full((120, 160), 128, np.uint8)
+        g[30 + 2 * i:70 + 2 * i, 50 + 3 * i:90 + 3 * i] = texture
+        grays.append(g)
+    calls = []
+
+    def fake_detect(gray, min_size=30):
+        calls.append(gray.shape)
+        return [(50, 30, 40, 40)]
+
+    monkeypatch.setattr(prnu, "_detect_faces", fake_detect)
+    boxes = prnu.detect_faces_tracked(grays, every=4, detect_width=0, parallel=False)
+    assert len(calls) == 1
+    assert [b[0] for b in boxes] == [(50 + 3 * i, 30 + 2 * i, 40, 40) for i in range(4)]
+
+    calls.clear()
+    monkeypatch.setattr(prnu, "_detect_faces", lambda gray, min_size=30: calls.append(gray.shape) or [(25, 15, 20, 20)])
+    boxes = prnu.detect_faces_tracked(grays, every=2, detect_width=80, parallel=False)
+    assert calls == [(60, 80), (60, 80)]
+    # Boxes found on the half-size frame are mapped back to full resolution
+    assert boxes[0] == [(50, 30, 40, 40)] and boxes[1] == [(53, 32, 40, 40)]
+
+
+def test_lost_face_track_is_detected_again_not_carried_forward(monkeypatch):
+    rng = np.random.default_rng(3)
+    texture = cv2.GaussianBlur(rng.integers(0, 255, size=(40, 40), dtype=np.uint8), (5, 5), 0)
+    grays = [np.full((120, 160), 128, np.uint8) for _ in range(2)]
+    for g in grays:
+        g[30:70, 50:90] = texture
+    # Scene cut after frame 1: unrelated content where the face was
+    grays += [cv2.GaussianBlur(rng.integers(0, 255, size=(120, 160), dtype=np.uint8), (9, 9), 0) for _ in range(2)]
+    calls = []
+
+    def fake_detect(gray, min_size=30):
+        calls.append(gray.shape)
+        return [(50, 30, 40, 40)] if len(calls) == 1 else []
+
+    monkeypatch.setattr(prnu, "_detect_faces", fake_detect)
+    boxes = prnu.detect_faces_tracked(grays, every=4, detect_width=0, parallel=False)
+    assert boxes == [[(50, 30, 40, 40)], [(50, 30, 40, 40)], [], []]
+    assert len(calls) == 2  # the keyframe, then the frame where the track was lost
+
+
+def test_integral_box_correlation_matches_corrcoef():
+    resid = np.random.default_rng(4).standard_normal((90, 120)).astype(np.float32)
+    cmap = prnu.consistency_map(resid)
+    bg = cv2.GaussianBlur(resid, (31, 31), 0)
+    for (x, y, w, h) in [(0, 0, 120, 90), (10, 5, 33, 40), (80, 50, 40, 40)]:
+        expected = np.corrcoef(resid[y:y+h, x:x+w].ravel(), bg[y:y+h, x:x+w].ravel())[0, 1]
+        assert abs(cmap.box_score((x, y, w, h)) - (1.0 - expected)) < 1e-6
+    # Boxes are clipped to the frame; boxes outside it have no score
+    assert cmap.box_score((100, 70, 50, 50)) == cmap.box_score((100, 70, 20, 20))
+    assert cmap.box_score((200, 0, 10, 10)) is None
+
+
+def test_dense_regions_localise_non_face_edit(tmp_path):
+    rng = np.random.default_rng(5)
+    frames = np.zeros((2, 128, 192, 3), np.uint8)
+    # Smooth residual everywhere except one white-noise patch (e.g. an inpainted area)
+    resid = cv2.GaussianBlur(rng.standard_normal((2, 128, 192)).astype(np.float32).transpose(1, 2, 0), (0, 0), 6)
+    resid = np.ascontiguousarray(resid.transpose(2, 0, 1))
+    resid[1, 64:96, 128:160] = rng.standard_normal((32, 32))
+    faces, heatmaps, regions = prnu.region_scores_and_heatmaps(frames, resid, tmp_path, windows=(32,), top_k=2)
+    assert faces == [] and heatmaps == []
+    top = regions[0]
+    assert top.frame_index == 1 and prnu._iou(top.bbox, (128, 64, 32, 32)) > 0.25
+    assert top.score > regions[1].score
+
+
+def test_heatmaps_are_stored_as_data_and_composited_per_frame(tmp_path, monkeypatch):
+    rng = np.random.default_rng(6)
+    frames = rng.integers(0, 255, size=(4, 96, 128, 3), dtype=np.uint8)
+    resid = rng.standard_normal((4, 96, 128)).astype(np.float32)
+    two_faces = [(4, 4, 40, 40), (70, 40, 40, 40)]
+    monkeypatch.setattr(prnu, "detect_faces_tracked", lambda grays: [two_faces, [], two_faces[:1], two_faces[1:]])
+    scores, heatmaps, _ = prnu.region_scores_and_heatmaps(frames, resid, tmp_path, windows=())
+    assert len(scores) == 4 and not list(tmp_path.glob("*.png"))
+    worst = {}
+    for s in scores:
+        worst[s.frame_index] = max(worst.get(s.frame_index, 0.0), s.score)
+    assert [h.frame_index for h in heatmaps] == sorted(worst, key=worst.get, reverse=True)
+    _, top2, _ = prnu.region_scores_and_heatmaps(frames, resid, tmp_path, windows=(), heatmap_top_k=2)
+    assert [h.frame_index for h in top2] == [h.frame_index for h in heatmaps[:2]]
+
+    # Both faces of frame 0 are composited into one image
+    hm = next(h for h in heatmaps if h.frame_index == 0)
+    assert hm.faces == 2
+    jpg = cv2.imdecode(cv2.imencode(".jpg", frames[0], [cv2.IMWRITE_JPEG_QUALITY, 90])[1], cv2.IMREAD_COLOR)
+    bg = cv2.GaussianBlur(resid[0], (31, 31), 0)
+    rois = [((x, y, w, h), prnu.heatmap_roi(resid[0][y:y+h, x:x+w], bg[y:y+h, x:x+w])) for (x, y, w, h) in two_faces]
+    assert np.array_equal(prnu.render_heatmap(hm.path), prnu.composite_heatmap(jpg, rois))
+
+    png = prnu.render_heatmap_png(hm.path)
+    mtime = png.stat().st_mtime_ns
+    assert prnu.render_heatmap_png(hm.path) == png and png.stat().st_mtime_ns == mtime
+
+
+def test_streaming_fingerprint_matches_batch_mle_and_resumes_from_state():
+    rng = np.random.default_rng(7)
+    resid = rng.standard_normal((12, 24, 32)).astype(np.float32)
+    inten = rng.uniform(0.1, 0.9, size=(12, 24, 32)).astype(np.float32)
+    expected = (resid.astype(np.float64) * inten).sum(0) / ((inten.astype(np.float64) ** 2).sum(0) + 1e-6)
+    expected = (expected - expected.mean()) / (expected.std() + 1e-6)
+
+    acc = prnu.PRNUAccumulator().update_many(resid[:5], inten[:5])
+    acc = prnu.PRNUAccumulator.from_state(acc.state()).update_many(resid[5:], inten[5:])
+    assert acc.count == 12 and acc.shape == (24, 32)
+    assert np.allclose(acc.finalize(), expected, atol=1e-5)
+
+    # Residuals of another size are resized onto the first one's grid
+    acc.update(rng.standard_normal((48, 64)).astype(np.float32))
+    assert acc.finalize().shape == (24, 32)
+
+
+def test_pce_matches_cropped_and_rescaled_clip():
+    rng = np.random.default_rng(9)
+    ref = rng.standard_normal((120, 160)).astype(np.float32)
+    crop = cv2.resize(ref[12:102, 20:140], (160, 120), interpolation=cv2.INTER_CUBIC)
+    clip = crop + 4.0 * rng.standard_normal((120, 160)).astype(np.float32)
+    m = prnu.pce_match(clip, ref, ref_key="test-ref")
+    assert m["scale"] == 0.75 and m["shift"] == (12, 20)
+    assert prnu.pce_similarity(m["pce"]) > 0.9
+    # Plain correlation cannot see the re-framed clip
+    assert abs(prnu.correlation_similarity(clip, ref)) < 0.05
+    assert prnu.reference_spectrum(ref, "test-ref") is prnu.reference_spectrum(ref, "test-ref")
+
+    other = rng.standard_normal((120, 160)).astype(np.float32)
+    assert prnu.pce_similarity(prnu.pce_match(other, ref)["pce"]) < 0.5
+    sim, detail = prnu.match_similarity(clip, ref, method="corr")
+    assert detail["method"] == "corr" and 0.45 < sim < 0.55
+
+
+def test_temporal_consistency_flags_spliced_segment():
+    rng = np.random.default_rng(7)
+    k1, k2 = (rng.normal(0, 1, (90, 120)).astype(np.float32) for _ in range(2))
+
+    def clip(sources):
+        return np.stack([0.3 * (k1 if s == 1 else k2) + rng.normal(0, 1, (90, 120)).astype(np.float32) for s in sources])
+
+    steady = clip([1] * 12)
+    assert np.allclose(prnu.residual_gram(steady), np.corrcoef(steady.reshape(12, -1)), atol=1e-5)
+    clean = prnu.temporal_consistency(steady)
+    assert clean.score == 0.0 and clean.breaks == [] and len(clean.adjacent) == 11
+
+    spliced = prnu.temporal_consistency(clip([1] * 8 + [2] * 4))
+    assert spliced.breaks == [7] and spliced.score > 0.9
+    assert [(s["start"], s["end"]) for s in spliced.segments] == [(0, 7), (8, 11)]
+
+    inserted = prnu.temporal_consistency(clip([1] * 5 + [2] + [1] * 6))
+    assert inserted.breaks == [4, 5] and inserted.outlier_frames == [5]
+    assert max(inserted.segments, key=lambda s: s["score"])["start"] == 5
+    assert prnu.temporal_consistency(steady[:4]) is None
@@ -0,0 +1,90 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from deepforensics.__main__ import main
+from deepforensics.app import config, reports
+from deepforensics.app.api import app
+
+
+def _report(task_id, finished_at, decision="SAFE", score=0.2, provider="local_stub", sha="a" * 64):
+    return {
+        "task_id": task_id,
+        "source": {"filename": f"{task_id}.mp4", "sha256": sha},
+        "ml": {"provider": provider, "score": score},
+        "ensemble": {"decision": decision, "weighted_score": score},
+        "timestamps": {"started_at": finished_at, "finished_at": finished_at},
+    }
+
+
+def _fill(store):
+    for i in range(30):
+        decision = "SUSPECT" if i % 3 == 0 else "SAFE"
+        store.put(_report(f"t{i:03d}", f"2024-05-01T{i // 2:02d}:{(i % 2) * 30:02d}:00Z", decision, 0.5 if decision == "SUSPECT" else 0.1))
+
+
+def test_query_filters_and_cursor_pagination(tmp_path):
+    store = reports.ReportStore(tmp_path / "reports.sqlite3")
+    _fill(store)
+    store.put(_report("t001", "2024-05-01T00:30:00Z", "LIKELY_MANIPULATED", 0.9, provider="ollama:x"))  # replaced
+    assert len(store) == 30 and store.get("t001")["ensemble"]["decision"] == "LIKELY_MANIPULATED"
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = store.query(decision=["SUSPECT"], since=reports._timestamp("2024-05-01T03:00:00Z"),
+                                   limit=3, cursor=cursor)
+        seen += page
+        if cursor is None:
+            break
+    ids = [r["task_id"] for r in seen]
+    assert ids == [f"t{i:03d}" for i in range(27, 5, -3)]
+    assert seen[0]["created_at"] == "2024-05-01T13:30:00Z" and seen[0]["weighted_score"] == 0.5
+
+    page, _ = store.query(ml_provider="ollama:x", include_report=True)
+    assert [r["task_id"] for r in page] == ["t001"] and page[0]["report"]["ml"]["score"] == 0.9
+    page, _ = store.query(min_score=0.4, until=reports._timestamp("2024-05-01T02:00:00Z"))
+    assert [r["task_id"] for r in page] == ["t003", "t001", "t000"]
+
+
+def test_reports_endpoint_and_import(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(config, "REPORTS_DB", tmp_path / "reports.sqlite3")
+    legacy = tmp_path / "legacy"
+    legacy.mkdir()
+    for i in range(3):
+        (legacy / f"old{i}.json").write_text(json.dumps(_report(f"old{i}", f"2024-04-0{i + 1}T12:00:00Z", "SUSPECT"), indent=2))
+    (legacy / "broken.json").write_text("{")
+    try:
+        assert main(["import-reports", "--dir", str(legacy)]) == 1  # one unreadable file
+        assert capsys.readouterr().out.startswith("3 imported, 0 already stored, 1 unreadable")
+        assert reports.get_store().import_dir(legacy) == {"imported": 0, "skipped": 3, "failed": 1}
+
+        client = TestClient(app)
+        r = client.get("/reports", params={"decision": "SUSPECT", "since": "2024-04-02T00:00:00Z", "limit": 1})
+        assert r.status_code == 200
+        body = r.json()
+        assert [i["task_id"] for i in body["items"]] == ["old2"] and body["next_cursor"]
+        r = client.get("/reports", params={"decision": "SUSPECT", "since": "2024-04-02T00:00:00Z",
+                                           "cursor": body["next_cursor"]})
+        assert [i["task_id"] for i in r.json()["items"]] == ["old1"] and r.json()["next_cursor"] is None
+        assert client.get("/reports", params={"cursor": "!!"}).status_code == 400
+        assert client.get("/report/old0").json()["source"]["filename"] == "old0.mp4"
+    finally:
+        reports.shutdown_store()
+
+
+def test_import_moves_inline_heatmaps_to_blobs(tmp_path, monkeypatch):
+    import base64
+
+    monkeypatch.setattr(config, "BLOB_DIR", tmp_path / "blobs")
+    uri = "data:image/png;base64," + base64.b64encode(b"\x89PNGfake").decode()
+    report = _report("inline", "2024-04-01T12:00:00Z")
+    report["prnu"] = {"heatmap_image": uri, "heatmap_images": [uri], "heatmap_frames": [{"frame_index": 4, "image": uri}]}
+    (tmp_path / "inline.json").write_text(json.dumps(report))
+    store = reports.ReportStore(tmp_path / "reports.sqlite3")
+    assert store.import_dir(tmp_path)["imported"] == 1
+
+    prnu = store.get("inline")["prnu"]
+    url = prnu["heatmap_image"]
+    assert url.startswith("/blobs/") and prnu["heatmap_images"] == [url] and prnu["heatmap_frames"][0]["image"] == url
+    assert (config.BLOB_DIR / prnu["heatmap_frames"][0]["blob"][:2] / prnu["heatmap_frames"][0]["blob"]).read_bytes() == b"\x89PNGfake"
+    store.close()
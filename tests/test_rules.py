@@ -0,0 +1,72 @@
+import json
+import os
+
+from deepforensics.app import config, ml, rules, utils
+
+
+def _write(path, data, mtime_ns):
+    path.write_text(json.dumps(data))
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_legacy_map_and_precedence():
+    legacy = rules.RuleSet.from_dict({"a.mp4": 0.85})
+    assert legacy.match("a.mp4") == rules.Match(0.85, "filename")
+    assert legacy.match("b.mp4") is None
+
+    rs = rules.RuleSet.from_dict({
+        "sha256": {"ABC123": 0.95},
+        "filenames": {"a.mp4": 0.1},
+        "rules": [
+            {"glob": "*_fake_*.mp4", "flags": ["recompression_detected"], "score": 0.8},
+            {"regex": r"^cam\d+_", "score": 0.2},
+            {"glob": "*.mp4", "score": 1.5},
+        ],
+    })
+    assert rs.match("a.mp4", "abc123") == rules.Match(0.95, "sha256")
+    assert rs.match("a.mp4", "other") == rules.Match(0.1, "filename")
+    assert rs.match("x_fake_1.mp4", flags=["recompression_detected"]) == rules.Match(0.8, "rule", 0)
+    assert rs.match("cam7_fake_1.mp4") == rules.Match(0.2, "rule", 1)  # flag condition not met
+    assert rs.match("z.mp4").score == 1.0  # clipped
+    assert rs.match("z.mov") is None
+    assert [m and m.by for m in rs.match_many([("a.mp4", None, []), ("z.mov", None, [])])] == ["filename", None]
+
+
+def test_loader_recompiles_only_on_change_and_keeps_last_good(tmp_path):
+    path = tmp_path / "stub_rules.json"
+    loader = rules.RuleLoader(path)
+    assert len(loader.get()) == 0
+
+    _write(path, {"a.mp4": 0.9}, 1_000_000_000)
+    first = loader.get()
+    assert first.match("a.mp4").score == 0.9
+    assert loader.get() is first
+
+    path.write_text("{not json")
+    os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+    assert loader.get() is first and loader.error
+
+    _write(path, {"filenames": {"b.mp4": 0.3}}, 3_000_000_000)
+    second = loader.get()
+    assert second is not first and loader.error is None
+    assert second.match("a.mp4") is None and second.match("b.mp4").score == 0.3
+
+
+def test_stub_predict_uses_hash_rules(tmp_path, monkeypatch):
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"not really a video")
+    digest = utils.sha256_file(video)
+    path = tmp_path / "stub_rules.json"
+    _write(path, {"sha256": {digest: 0.9}, "rules": [{"glob": "*.mov", "score": 0.05}]}, 1_000_000_000)
+    monkeypatch.setattr(config, "STUB_RULES_PATH", path)
+
+    out = ml.stub_predict(video, [], [])
+    assert out["score"] == 0.9 and out["raw_response"]["rule"] == "stub_rules_override"
+    assert ml.stub_predict(video, [], [], sha256="0" * 64)["raw_response"]["rule"] == "baseline_low"
+
+    many = ml.predict_many([
+        {"video_path": video, "sha256": digest},
+        {"video_path": tmp_path / "other.mov", "metadata_flags": []},
+        {"video_path": tmp_path / "other.mp4", "sha256": "0" * 64},
+    ])
+    assert [m["score"] for m in many] == [0.9, 0.05, 0.12]
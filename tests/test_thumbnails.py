@@ -0,0 +1,47 @@
+import base64
+
+import cv2
+import numpy as np
+
+from deepforensics.app import thumbnails
+
+
+def _frames():
+    rng = np.random.default_rng(10)
+    base = [cv2.resize(rng.integers(0, 255, (9, 16, 3), dtype=np.uint8), (640, 360), interpolation=cv2.INTER_LINEAR)
+            for _ in range(4)]
+    # 0,1 and 2,3 are near-identical pairs; 4,5 are two more distinct scenes
+    return np.stack([base[0], base[0], base[1], base[1] + 1, base[2], base[3]])
+
+
+def test_selection_prefers_suspicious_faces_then_distinct_frames():
+    frames = _frames()
+    hashes = [thumbnails.dhash(cv2.cvtColor(f, cv2.COLOR_BGR2GRAY)) for f in frames]
+    faces = [
+        {"frame_index": 3, "bbox": [10, 10, 50, 50], "score": 0.9},
+        {"frame_index": 2, "bbox": [10, 10, 50, 50], "score": 0.8},  # duplicate of frame 3: skipped
+        {"frame_index": 0, "bbox": [100, 40, 60, 60], "score": 0.2},
+    ]
+    picked = thumbnails.select_frames(hashes, faces, count=3)
+    assert picked[:2] == [(3, (10, 10, 50, 50)), (0, (100, 40, 60, 60))]
+    assert picked[2][0] in (4, 5) and picked[2][1] is None
+
+    no_faces = thumbnails.select_frames(hashes, [], count=6)
+    chosen = [i for i, _ in no_faces]
+    assert chosen[0] == 0 and len(chosen) == 4 and not ({0, 1} <= set(chosen)) and not ({2, 3} <= set(chosen))
+
+
+def test_thumbnails_respect_pixel_and_byte_budgets():
+    noisy = np.random.default_rng(11).integers(0, 255, (2, 360, 640, 3), dtype=np.uint8)
+    faces = [{"frame_index": 1, "bbox": [600, 300, 60, 60], "score": 0.7}]
+    thumbs = thumbnails.build_thumbnails(noisy, faces, count=2, max_pixels=128 * 128, max_bytes=8000)
+    assert [t.frame_index for t in thumbs] == [1, 0]
+    assert thumbs[0].bbox == (570, 270, 70, 90) and thumbs[0].label == "frame 1 (face crop)"
+    for t in thumbs:
+        assert t.size[0] * t.size[1] <= 128 * 128 and len(t.jpeg) <= 8000
+        img = cv2.imdecode(np.frombuffer(base64.b64decode(t.b64), np.uint8), cv2.IMREAD_COLOR)
+        assert img.shape[:2] == (t.size[1], t.size[0])
+
+    # Labels name the frame in the video, not its position among the samples
+    thumbs = thumbnails.build_thumbnails(noisy, faces, count=2, source_frames=[0, 48])
+    assert [t.label for t in thumbs] == ["frame 48 (face crop)", "frame 0"]
@@ -17,12 +17,19 @@ form.addEventListener('submit', async (e) => {
   data.append('privacy_mode', privacy ? 'true' : 'false');
   if (deviceId) data.append('device_id', deviceId);
   try {
-    const res = await fetch('/analyze', { method: 'POST', body: data });
+    const res = await fetch('/jobs', { method: 'POST', body: data });
     if (!res.ok) {
       statusEl.textContent = 'Error ' + res.status + ': ' + (await res.text());
-      btn.disabled = false; return;
+      return;
     }
-    const json = await res.json();
+    const job = await res.json();
+    statusEl.textContent = 'Queued...';
+    const final = await waitForJob(job.task_id);
+    if (final.status !== 'done') {
+      statusEl.textContent = 'Error: ' + (final.error || 'analysis failed');
+      return;
+    }
+    const json = final.report;
     renderReport(json);
     statusEl.textContent = 'Done';
     dlBtn.disabled = false;
@@ -34,6 +41,33 @@ form.addEventListener('submit', async (e) => {
   }
 });
 
+function showProgress(ev) {
+  const pct = Math.round((ev?.progress ?? 0) * 100);
+  statusEl.textContent = `Analyzing: ${ev?.stage || ev?.status || '...'} (${pct}%)`;
+}
+
+// Follow a background job via Server-Sent Events, falling back to polling; resolves with the final status
+async function waitForJob(taskId) {
+  const fetchStatus = async () => (await fetch(`/jobs/${taskId}`)).json();
+  if (window.EventSource) {
+    const ended = await new Promise((resolve) => {
+      const es = new EventSource(`/jobs/${taskId}/events`);
+      es.addEventListener('progress', (e) => showProgress(JSON.parse(e.data)));
+      const finish = () => { es.close(); resolve(true); };
+      es.addEventListener('done', finish);
+      es.addEventListener('failed', finish);
+      es.onerror = () => { es.close(); resolve(false); };
+    });
+    if (ended) return fetchStatus();
+  }
+  for (;;) {
+    const st = await fetchStatus();
+    if (st.status === 'done' || st.status === 'failed') return st;
+    showProgress(st);
+    await new Promise((r) => setTimeout(r, 1000));
+  }
+}
+
 function renderReport(j) {
   // Top stats
   const dec = document.getElementById('decision');
@@ -193,7 +227,12 @@ function renderReport(j) {
   // Faces table (top 5 by score)
   const faces = (j?.prnu?.face_region_scores || []).slice().sort((a,b)=>b.score-a.score).slice(0,5);
   const faceText = faces.map(f => `frame ${f.frame_index}  score ${(f.score||0).toFixed(3)}  bbox [${(f.bbox||[]).join(', ')}]`).join('\n');
-  document.getElementById('faces').textContent = faceText || '—';
+  const regions = (j?.prnu?.dense_region_scores || []).slice(0,5);
+  const regionText = regions.map(f => `frame ${f.frame_index}  score ${(f.score||0).toFixed(3)}  window [${(f.bbox||[]).join(', ')}]`).join('\n');
+  const temporal = j?.temporal;
+  const temporalText = temporal ? `Temporal consistency: score ${(temporal.score||0).toFixed(3)}` +
+    ((temporal.breaks || []).length ? `  breaks after frames ${temporal.breaks.join(', ')}` : '  no breaks') : '';
+  document.getElementById('faces').textContent = [faceText, regionText && 'Most inconsistent regions:\n' + regionText, temporalText].filter(Boolean).join('\n\n') || '—';
 }
 
 function downloadJson(j) {